@@ -1 +1 @@
-__all__ = ['main.py', 'telegram_bot.py', 'words_list.py', 'utils.py', 'constants.py']
+__all__ = ['main.py', 'telegram_bot.py', 'words_list.py', 'utils.py', 'constants.py', 'quiz_history.py', 'sqlite_words_list.py', 'state_store.py', 'message_sender.py', 'quiz_scheduler.py', 'replay_updates.py', 'chat_locks.py', 'sharding.py', 'loadtest.py', 'metrics.py', 'lazy_words_list.py', 'translation_catalog.py', 'duplicate_index.py', 'spaced_repetition.py', 'chat_stats.py', 'words_cli.py', 'startup_snapshot.py', 'benchmarks.py']
@@ -0,0 +1,331 @@
+"""
+Before/after benchmarks of the word store and answer checking optimizations. Each
+subcommand runs the old code path next to the current one and prints both as JSON, e.g.
+
+    python bot/benchmarks.py boots --boots 50
+    python bot/benchmarks.py normalize --repeat 5
+    python bot/benchmarks.py distance --long-length 4096
+    python bot/benchmarks.py sqlite --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import string
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import constants
+from utils import TextNormalizer, levenshtein_distance, similarity_percentage, CLOSENESS_MIN_SIMILARITY
+from words_list import WordsList
+from sqlite_words_list import SQLiteWordsList
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def _legacy_boot(words_path, word_sets_path):
+    """
+    Startup before idempotent imports: every word set was appended to words.json on every boot
+    """
+    with open(words_path, 'r', encoding='utf-8') as file:
+        words = json.load(file)
+    for file_name in os.listdir(word_sets_path):
+        if not file_name.endswith(".json"):
+            continue
+        with open(os.path.join(word_sets_path, file_name), 'r', encoding='utf-8') as file:
+            word_set = json.load(file)
+        for language, data in word_set.items():
+            if language not in words:
+                words[language] = data
+            else:
+                words[language]["words"].extend(data["words"])
+    with open(words_path, 'w', encoding='utf-8') as file:
+        json.dump(words, file, ensure_ascii=False, indent=4)
+    return sum(len(data["words"]) for data in words.values())
+
+
+def _current_boot(words_path, word_sets_path):
+    return sum(WordsList(words_path, word_sets_path).word_counts().values())
+
+
+def bench_boots(args):
+    """
+    Time the first and the last of args.boots consecutive boots on a fresh copy of the word sets
+    """
+    results = {}
+    for name, boot in (("before", _legacy_boot), ("after", _current_boot)):
+        with tempfile.TemporaryDirectory() as directory:
+            word_sets_path = os.path.join(directory, "word_sets")
+            shutil.copytree(os.path.join(args.data, "word_sets"), word_sets_path)
+            words_path = os.path.join(directory, "words.json")
+            with open(words_path, 'w', encoding='utf-8') as file:
+                file.write("{}")
+            timings = []
+            for _ in range(args.boots):
+                started = time.perf_counter()
+                words = boot(words_path, word_sets_path)
+                timings.append(time.perf_counter() - started)
+            results[name] = {
+                "first_boot_ms": timings[0] * 1e3,
+                f"boot_{args.boots}_ms": timings[-1] * 1e3,
+                "words": words,
+                "words_json_bytes": os.path.getsize(words_path),
+            }
+    return results
+
+
+def _legacy_preprocess(text):
+    """
+    preprocess_string before TextNormalizer: tables and stopword lists rebuilt on every call
+    """
+    text = text.lower()
+    text = text.translate(str.maketrans('', '', string.punctuation))
+    if len(text.split()) == 1:
+        return text
+    for _, stopwords in constants.stopwords.items():
+        text = ' '.join([word for word in text.split() if word not in stopwords])
+    text = text.replace("_", "")
+    text = text.replace(" ", "")
+    return text
+
+
+def _corpus_texts(data):
+    """
+    Every word and description of the word sets in data
+    """
+    texts = []
+    word_sets_path = os.path.join(data, "word_sets")
+    for file_name in sorted(os.listdir(word_sets_path)):
+        if not file_name.endswith(".json"):
+            continue
+        with open(os.path.join(word_sets_path, file_name), 'r', encoding='utf-8') as file:
+            for group in json.load(file).values():
+                for word in group["words"]:
+                    texts.append(word["word"])
+                    texts.extend(description for description in word.get("descriptions", {}).values()
+                                 if isinstance(description, str))
+    return texts
+
+
+def bench_normalize(args):
+    """
+    Normalize the corpus texts and as many random replies, args.long_replies of them 4096 characters long
+    """
+    rng = random.Random(0)
+    texts = _corpus_texts(args.data)
+    alphabet = string.ascii_lowercase + "  ,.!"
+    replies = ["".join(rng.choice(alphabet) for _ in range(rng.randint(3, 30))) for _ in range(len(texts))]
+    replies += ["".join(rng.choice(alphabet) for _ in range(4096)) for _ in range(args.long_replies)]
+    inputs = (texts + replies) * args.repeat
+
+    def run(normalize):
+        started = time.perf_counter()
+        for text in inputs:
+            normalize(text)
+        return time.perf_counter() - started
+
+    normalizer = TextNormalizer(constants.stopwords)
+    distinct = set(inputs)
+    return {
+        "inputs": len(inputs),
+        "before_s": run(_legacy_preprocess),
+        "after_uncached_s": run(normalizer._normalize),
+        "after_s": run(normalizer.normalize),
+        # The cache holds the distinct inputs up to NORMALIZER_CACHE_MAX_LENGTH, before the cap it held all of them
+        "cached_chars": sum(len(text) for text in distinct if len(text) <= constants.NORMALIZER_CACHE_MAX_LENGTH),
+        "cached_chars_without_length_cap": sum(map(len, distinct)),
+    }
+
+
+def _legacy_levenshtein(s1, s2):
+    """
+    Edit distance before the bit-parallel version: full dynamic programming table, no bound
+    """
+    if len(s1) < len(s2):
+        return _legacy_levenshtein(s2, s1)
+    previous_row = range(len(s2) + 1)
+    for i, c1 in enumerate(s1):
+        current_row = [i + 1]
+        for j, c2 in enumerate(s2):
+            current_row.append(min(previous_row[j + 1] + 1, current_row[j] + 1, previous_row[j] + (c1 != c2)))
+        previous_row = current_row
+    return previous_row[-1]
+
+
+def _legacy_similarity(s1, s2):
+    return (1 - _legacy_levenshtein(s1, s2) / max(len(s1), len(s2))) * 100
+
+
+def _mutate(rng, text, alphabet, edits):
+    text = list(text)
+    for _ in range(edits):
+        text[rng.randrange(len(text))] = rng.choice(alphabet)
+    return "".join(text)
+
+
+def bench_distance(args):
+    """
+    Closeness scoring of wrong replies: Korean phrase pairs a few edits apart, and adversarial
+    long replies against a short answer and against each other
+    """
+    rng = random.Random(0)
+    hangul = [chr(code) for code in range(0xAC00, 0xD7A4)]
+    korean = []
+    for _ in range(args.pairs):
+        answer = "".join(rng.choice(hangul) for _ in range(args.korean_length))
+        korean.append((_mutate(rng, answer, hangul, rng.randint(1, 10)), answer))
+    reply = "".join(rng.choice(string.ascii_lowercase) for _ in range(args.long_length))
+    cases = {
+        "korean": korean,
+        "long_reply_short_answer": [(reply, "apple")],
+        "long_reply_long_answer": [(reply, _mutate(rng, reply, string.ascii_lowercase, args.long_length // 4))],
+    }
+
+    def run(pairs, similarity):
+        started = time.perf_counter()
+        for reply_text, answer in pairs:
+            similarity(reply_text, answer)
+        return (time.perf_counter() - started) / len(pairs) * 1e3
+
+    results = {}
+    for name, pairs in cases.items():
+        mismatches = sum(levenshtein_distance(*pair) != _legacy_levenshtein(*pair) for pair in pairs)
+        results[name] = {
+            "pairs": len(pairs),
+            "before_ms": run(pairs, _legacy_similarity),
+            "after_ms": run(pairs, lambda s1, s2: similarity_percentage(s1, s2, preprocess=False)),
+            # As check_answer scores it, bounded at the lowest closeness bucket
+            "after_bounded_ms": run(pairs, lambda s1, s2: similarity_percentage(
+                s1, s2, preprocess=False, min_similarity=CLOSENESS_MIN_SIMILARITY)),
+            "distance_mismatches": mismatches,
+        }
+    return results
+
+
+def _write_corpus(path, words, group_size):
+    """
+    Stream a words.json of words synthetic entries in groups of group_size without holding it in memory
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write("{")
+        for group_start in range(0, words, group_size):
+            if group_start:
+                file.write(",")
+            file.write(f'"group{group_start // group_size}":{{"description":{{"english":"Group"}},"words":[')
+            for i in range(group_start, min(group_start + group_size, words)):
+                if i > group_start:
+                    file.write(",")
+                json.dump({"word": f"word{i}", "descriptions": {"english": f"meaning {i}", "russian": f"значение {i}"}},
+                          file, ensure_ascii=False)
+            file.write("]}")
+        file.write("}")
+
+
+def _measure_store(backend, directory, words, group_size, lookups, adds):
+    """
+    Start, query and modify one store on the corpus in directory, runs in a fresh process so its peak RSS is its own
+    """
+    words_path = os.path.join(directory, "words.json")
+    word_sets_path = os.path.join(directory, "word_sets")
+
+    def open_store():
+        if backend == "sqlite":
+            return SQLiteWordsList(os.path.join(directory, "words.sqlite3"), words_path, word_sets_path)
+        return WordsList(words_path, word_sets_path)
+
+    async def measure():
+        rng = random.Random(0)
+        groups = [f"group{i}" for i in range((words + group_size - 1) // group_size)]
+        result = {}
+        started = time.perf_counter()
+        store = open_store()
+        result["first_start_s"] = time.perf_counter() - started
+        await store.close()
+        started = time.perf_counter()
+        store = open_store()
+        result["restart_s"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(lookups):
+            await store.get_random_question(rng.choice(groups), "english")
+        result["random_question_us"] = (time.perf_counter() - started) / lookups * 1e6
+        started = time.perf_counter()
+        for _ in range(lookups):
+            await store.get_word_by_text(f"word{rng.randrange(words)}")
+        result["lookup_us"] = (time.perf_counter() - started) / lookups * 1e6
+
+        # The first addition builds the duplicate index of the group in both stores
+        await store.add_words([{"word": "warmup", "language": groups[0], "descriptions": {}}])
+        await store.flush()
+        started = time.perf_counter()
+        for i in range(adds):
+            await store.add_words([{"word": f"new entry {i}", "language": groups[0], "descriptions": {}}])
+            await store.flush()
+        result["add_and_flush_ms"] = (time.perf_counter() - started) / adds * 1e3
+        await store.close()
+        result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return result
+
+    return asyncio.run(measure())
+
+
+def bench_sqlite(args):
+    """
+    WordsList (the JSON file kept resident) against SQLiteWordsList for every corpus size in args.sizes
+    """
+    results = {}
+    # Spawned workers start from a clean interpreter, so the peak RSS is that of the measured store alone
+    context = multiprocessing.get_context("spawn")
+    for words in args.sizes:
+        results[words] = {}
+        for name, backend in (("before", "json"), ("after", "sqlite")):
+            with tempfile.TemporaryDirectory() as directory:
+                os.mkdir(os.path.join(directory, "word_sets"))
+                _write_corpus(os.path.join(directory, "words.json"), words, args.group_size)
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    results[words][name] = executor.submit(_measure_store, backend, directory, words, args.group_size,
+                                                           args.lookups, args.adds).result()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Before/after benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    boots_parser = subparsers.add_parser("boots", help="word set import on the first and the n-th boot")
+    boots_parser.add_argument("--boots", type=int, default=50)
+    boots_parser.add_argument("--data", default=DATA_PATH, help="directory with the word_sets to import")
+    boots_parser.set_defaults(run=bench_boots)
+
+    normalize_parser = subparsers.add_parser("normalize", help="old preprocess_string against TextNormalizer")
+    normalize_parser.add_argument("--repeat", type=int, default=5)
+    normalize_parser.add_argument("--long-replies", type=int, default=100, help="4096 character replies mixed in")
+    normalize_parser.add_argument("--data", default=DATA_PATH, help="directory with the word_sets to normalize")
+    normalize_parser.set_defaults(run=bench_normalize)
+
+    distance_parser = subparsers.add_parser("distance", help="old dynamic programming edit distance against the "
+                                                             "bounded bit-parallel one")
+    distance_parser.add_argument("--pairs", type=int, default=200, help="Korean phrase pairs")
+    distance_parser.add_argument("--korean-length", type=int, default=75)
+    distance_parser.add_argument("--long-length", type=int, default=4096, help="length of the adversarial reply")
+    distance_parser.set_defaults(run=bench_distance)
+
+    sqlite_parser = subparsers.add_parser("sqlite", help="JSON word list against the SQLite repository")
+    sqlite_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                               help="corpus sizes in words")
+    sqlite_parser.add_argument("--group-size", type=int, default=10000, help="words per group")
+    sqlite_parser.add_argument("--lookups", type=int, default=1000, help="random questions and lookups timed")
+    sqlite_parser.add_argument("--adds", type=int, default=3, help="additions timed, each followed by a flush")
+    sqlite_parser.set_defaults(run=bench_sqlite)
+
+    args = parser.parse_args()
+    print(json.dumps(args.run(args), indent=4))
+
+
+if __name__ == '__main__':
+    main()
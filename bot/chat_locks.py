@@ -0,0 +1,29 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class ChatLocks:
+    """
+    One asyncio lock per chat so concurrently processed updates of the same chat
+    run strictly one after another, in arrival order (asyncio locks wake waiters FIFO).
+    Locks exist only while someone holds or waits for them.
+    """
+    def __init__(self):
+        self._locks = {}  # chat_id -> [lock, holders and waiters]
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, chat_id):
+        entry = self._locks.get(chat_id)
+        if entry is None:
+            entry = self._locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[chat_id]
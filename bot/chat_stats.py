@@ -0,0 +1,217 @@
+from collections import OrderedDict
+
+import constants
+
+# User id of the row holding the totals of a whole chat, Telegram user ids are positive
+CHAT_TOTAL = 0
+
+
+class AnswerStats:
+    """
+    Running counters of answered questions, updated in O(1) per question
+    """
+    __slots__ = ('correct', 'incorrect', 'streak', 'best_streak', 'tries', 'answer_time', 'timed')
+
+    def __init__(self, correct=0, incorrect=0, streak=0, best_streak=0, tries=0, answer_time=0.0, timed=0):
+        self.correct = correct
+        self.incorrect = incorrect
+        self.streak = streak  # correct answers in a row
+        self.best_streak = best_streak
+        self.tries = tries  # replies over all questions
+        self.answer_time = answer_time  # seconds from question to outcome over the timed questions
+        self.timed = timed  # questions whose asking time is known
+
+    def record(self, correct, tries, seconds=None):
+        if correct:
+            self.correct += 1
+            self.streak += 1
+            self.best_streak = max(self.best_streak, self.streak)
+        else:
+            self.incorrect += 1
+            self.streak = 0
+        self.tries += tries
+        if seconds is not None:
+            self.answer_time += seconds
+            self.timed += 1
+
+    @property
+    def questions(self):
+        return self.correct + self.incorrect
+
+    def average_tries(self):
+        return self.tries / self.questions if self.questions else 0.0
+
+    def average_answer_time(self):
+        return self.answer_time / self.timed if self.timed else 0.0
+
+    def row(self):
+        return (self.correct, self.incorrect, self.streak, self.best_streak, self.tries, self.answer_time, self.timed)
+
+
+class Leaderboard:
+    """
+    Users of a chat ranked by score. Scores only grow one point at a time, so the ranking
+    is kept as one array where users of equal score are contiguous: an increment swaps the
+    user with the first one of its score and moves that boundary, O(1) like the rank and
+    the top n (O(n)).
+    """
+    __slots__ = ('_users', '_positions', '_scores', '_starts')
+
+    def __init__(self, scores=None):
+        """
+        scores is {user: score} to start from
+        """
+        scores = scores or {}
+        self._users = sorted(scores, key=scores.get, reverse=True)  # highest score first
+        self._positions = {user: position for position, user in enumerate(self._users)}
+        self._scores = dict(scores)
+        self._starts = {}  # score -> position of its first user
+        for position, user in enumerate(self._users):
+            self._starts.setdefault(self._scores[user], position)
+
+    def __len__(self):
+        return len(self._users)
+
+    def __contains__(self, user):
+        return user in self._scores
+
+    def add(self, user):
+        """
+        Add a user with score 0, at the end where the lowest scores are
+        """
+        if user not in self._scores:
+            self._scores[user] = 0
+            self._positions[user] = len(self._users)
+            self._starts.setdefault(0, len(self._users))
+            self._users.append(user)
+
+    def increment(self, user):
+        self.add(user)
+        score = self._scores[user]
+        position = self._positions[user]
+        start = self._starts[score]
+        first = self._users[start]
+        self._users[start], self._users[position] = user, first
+        self._positions[user], self._positions[first] = start, position
+        # The user leaves the front of its score block and ends the block above, which starts earlier if it exists
+        if start + 1 < len(self._users) and self._scores[self._users[start + 1]] == score:
+            self._starts[score] = start + 1
+        else:
+            del self._starts[score]
+        self._scores[user] = score + 1
+        self._starts.setdefault(score + 1, start)
+
+    def score(self, user):
+        return self._scores.get(user, 0)
+
+    def rank(self, user):
+        """
+        1 + the number of users with a higher score, None for unknown users
+        """
+        if user not in self._scores:
+            return None
+        return self._starts[self._scores[user]] + 1
+
+    def top(self, n=constants.LEADERBOARD_SIZE):
+        """
+        [(rank, user, score)] of the n best users
+        """
+        return [(self._starts[self._scores[user]] + 1, user, self._scores[user]) for user in self._users[:n]]
+
+
+class _ChatEntry:
+    """
+    The statistics, display names and leaderboard of one chat
+    """
+    __slots__ = ('stats', 'names', 'leaderboard')
+
+    def __init__(self, rows):
+        """
+        rows are state store rows (chat_id, user_id, name, *AnswerStats.row()) of the chat
+        """
+        self.stats = {}  # user_id or CHAT_TOTAL -> AnswerStats
+        self.names = {}  # user_id -> display name
+        scores = {}
+        for _, user_id, name, *counters in rows:
+            self.stats[user_id] = AnswerStats(*counters)
+            if user_id != CHAT_TOTAL:
+                self.names[user_id] = name
+                scores[user_id] = counters[0]
+        self.leaderboard = Leaderboard(scores)
+
+    def get(self, user_id):
+        stats = self.stats.get(user_id)
+        if stats is None:
+            stats = self.stats[user_id] = AnswerStats()
+        return stats
+
+
+class ChatStats:
+    """
+    Per-user and per-chat answer statistics with a leaderboard of correct answers per chat.
+    Every change is handed to the state store, which writes it with its next batched flush.
+    The statistics of the most recently used chats stay resident, the others are reloaded.
+    """
+    def __init__(self, state_store, cache_size=constants.STATS_CHAT_CACHE_SIZE):
+        self.state_store = state_store
+        self.cache_size = cache_size
+        self._chats = OrderedDict()  # chat_id -> _ChatEntry
+
+    def __len__(self):
+        return sum(len(entry.stats) for entry in self._chats.values())
+
+    def _chat(self, chat_id):
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = _ChatEntry(self.state_store.load_stats(chat_id))
+            while len(self._chats) > self.cache_size:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return entry
+
+    def record(self, chat_id, user_id, name, correct, tries, seconds=None, missed_by=None):
+        """
+        Count a question answered by user_id, correct after tries replies of theirs, seconds after it was asked
+        if known. missed_by is {user_id: (name, tries)} of the other users who replied to it, for whom it
+        counts as missed. The chat totals count the question once with the replies of everyone.
+        """
+        missed_by = missed_by or {}
+        entry = self._chat(chat_id)
+        totals = entry.get(CHAT_TOTAL)
+        totals.record(correct, tries + sum(count for _, count in missed_by.values()), seconds)
+        self._record_user(chat_id, entry, user_id, name, correct, tries, seconds)
+        for other_id, (other_name, other_tries) in missed_by.items():
+            self._record_user(chat_id, entry, other_id, other_name, False, other_tries)
+        self.state_store.save_stats(chat_id, CHAT_TOTAL, None, totals)
+
+    def _record_user(self, chat_id, entry, user_id, name, correct, tries, seconds=None):
+        stats = entry.get(user_id)
+        stats.record(correct, tries, seconds)
+        entry.names[user_id] = name
+        if correct:
+            entry.leaderboard.increment(user_id)
+        else:
+            entry.leaderboard.add(user_id)
+        self.state_store.save_stats(chat_id, user_id, name, stats)
+
+    def user(self, chat_id, user_id):
+        """
+        (AnswerStats, rank, number of ranked users) of a user in a chat, or None if the user never answered there
+        """
+        entry = self._chat(chat_id)
+        stats = entry.stats.get(user_id)
+        if stats is None:
+            return None
+        return stats, entry.leaderboard.rank(user_id), len(entry.leaderboard)
+
+    def chat(self, chat_id):
+        return self._chat(chat_id).stats.get(CHAT_TOTAL)
+
+    def top(self, chat_id, n=constants.LEADERBOARD_SIZE):
+        """
+        [(rank, display name, correct answers)] of the n best users of a chat
+        """
+        entry = self._chat(chat_id)
+        return [(rank, entry.names.get(user_id) or str(user_id), score)
+                for rank, user_id, score in entry.leaderboard.top(n)]
@@ -3,10 +3,25 @@ DEFAULT_LANGUAGE = 'english_b2'  # Default language for a quiz
 DEFAULT_INTERVAL_TIME = 120  # Default time
 TIME_UNITS = ['s', 'm', 'h']
 DEFAULT_TIME_UNIT = TIME_UNITS[1]
+QUIZ_SCHEDULER_TICK = 0.5  # Quizzes due within this many seconds are run in the same batch
+QUIZ_INTERVAL_JITTER = 0.05  # Each quiz period is randomly stretched or shrunk by up to this fraction
+QUIZ_RESTORE_SPREAD = 30  # Seconds over which quizzes that became overdue during a restart are spread
 
 DEFAULT_MAX_ATTEMPTS = 4
 
 QUIZ_HISTORY_LENGTH = 100  # How many quiz history to keep in memory
+CONCURRENT_UPDATES = 256  # How many updates may be processed at the same time
+SHARD_STOP_TIMEOUT = 10  # Seconds a sharded worker gets to flush its state when stopping
+METRICS_PREFIX = "quizbot_"  # Prefix of every exported metric name
+PROFILER_INTERVAL = 0.005  # Seconds between stack samples of /debug_profile
+PROFILER_STACK_DEPTH = 64  # Innermost frames kept per sample
+PROFILER_REPORT_LENGTH = 25  # Functions listed in the /debug_profile report
+LIST_PAGE_SIZE = 30  # Words per /list page
+LIST_PAGE_LENGTH = 3500  # Characters per /list page, Telegram messages are limited to 4096
+MAX_MESSAGE_LENGTH = 3500  # Characters of a report that fit in one Telegram message with its text around
+LEADERBOARD_SIZE = 10  # Users listed by /top
+STATS_CHAT_CACHE_SIZE = 10000  # Chats whose answer statistics are kept in memory, the others are reloaded when needed
+STATE_FLUSH_INTERVAL = 5  # Seconds between writes of chat state to the state store
 
 DEFAULT_BOT_LANGUAGE = 'english'  # Default language for the bot
 
@@ -17,8 +32,39 @@ stopwords = {
     "korean": ["이", "그", "저", "그녀", "우리", "너", "그들", "이것", "저것", "그것", "그리고", "하지만", "또는", "입니다", "있는", "그랬어", "하나", "두", "세", "네", "다섯"]
 }
 
+NORMALIZER_CACHE_SIZE = 65536  # How many normalized texts to keep cached
+NORMALIZER_CACHE_MAX_LENGTH = 64  # Longer texts (e.g. long replies) are normalized without caching
+
+WORDS_FLUSH_DELAY = 2  # Seconds to coalesce word list modifications before writing them to disk
+LAZY_READ_CHUNK = 1 << 20  # Bytes read at a time when indexing or copying a lazily loaded corpus
+SQLITE_RANDOM_WORD_ATTEMPTS = 8  # Random id probes before falling back to an offset scan
+DUPLICATE_SIMILARITY = 90  # Percent similarity from which a new word counts as a near duplicate of one in its group
+IMPORT_CHUNK_SIZE = 5000  # Records validated per worker task by words_cli.py import
+IMPORT_BATCH_SIZE = 100000  # Records added per flush by words_cli.py import
+EXPORT_BATCH_SIZE = 10000  # Words read per query by words_cli.py export from the sqlite backend
+
+# Outgoing message rate limits as (messages per second, burst size)
+SEND_GLOBAL_LIMIT = (30, 30)
+SEND_PRIVATE_CHAT_LIMIT = (1, 3)
+SEND_GROUP_CHAT_LIMIT = (20 / 60, 5)
+SEND_LATENCY_SAMPLES = 1000  # How many recent send latencies to keep for the percentiles
+# Lower values are sent first
+PRIORITY_REPLY = 0
+PRIORITY_SCHEDULED = 1
+
 DEFAULT_QUIZ_TYPE = "translate"  # Default quiz type
 
+# Spaced repetition (SM-2): seconds until the next review after the first correct answers in a row,
+# later intervals grow by the word's ease factor
+SRS_FIRST_INTERVALS = (24 * 60 * 60, 6 * 24 * 60 * 60)
+SRS_RETRY_DELAY = 10 * 60  # Seconds until a forgotten word is due again
+SRS_UNANSWERED_DELAY = 30 * 60  # Seconds a due word that was asked but not answered waits before it is asked again
+SRS_MAX_INTERVAL = 180 * 24 * 60 * 60
+SRS_INITIAL_EASE = 2.5
+SRS_MIN_EASE = 1.3
+SRS_NEW_WORD_ATTEMPTS = 8  # Random draws looking for an unseen word before a word is reviewed ahead of time
+SRS_DECK_CACHE_SIZE = 10000  # Decks (and chat member lists) kept in memory, the others are reloaded from the state store
+
 REMAINING_ATTEMPTS_HINT = 2
 HINT_ITERATION_PERCENTAGE = 20
 
@@ -0,0 +1,101 @@
+from collections import Counter
+from itertools import repeat
+from operator import contains
+
+import constants
+from utils import levenshtein_distance
+
+# Pads the keys so their first and last characters get their own trigrams
+_PADDING = "\x02"
+
+
+def trigrams(key):
+    padded = _PADDING * 2 + key + _PADDING * 2
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class DuplicateIndex:
+    """
+    Exact and near-duplicate lookup over the preprocessed words of one group.
+    Keys are indexed by their character trigrams, a candidate is compared only to the keys
+    sharing enough trigrams with it to possibly reach the similarity threshold
+    (one edit changes at most three trigrams). Only keys too short to share a trigram
+    with every near duplicate are compared to the whole group.
+    """
+    def __init__(self, keys=(), threshold=constants.DUPLICATE_SIMILARITY):
+        """
+        threshold is the similarity_percentage from which two different keys are near duplicates
+        """
+        self.threshold = threshold
+        self._counts = Counter()  # key -> number of words with that key
+        self._postings = {}  # trigram -> set of keys
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key):
+        return key in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, key):
+        self._counts[key] += 1
+        # With a threshold of 100 only exact duplicates are looked up, the trigrams are not needed
+        if self._counts[key] == 1 and self.threshold < 100:
+            for trigram in trigrams(key):
+                self._postings.setdefault(trigram, set()).add(key)
+
+    def discard(self, key):
+        """
+        Forget key, whichever number of words had it
+        """
+        if self._counts.pop(key, None) is None or self.threshold >= 100:
+            return
+        for trigram in trigrams(key):
+            keys = self._postings[trigram]
+            keys.discard(key)
+            if not keys:
+                del self._postings[trigram]
+
+    def _max_distance(self, length):
+        # similarity >= threshold  <=>  distance <= length * (100 - threshold) / 100
+        return int(length * (100 - self.threshold) / 100)
+
+    def find(self, key):
+        """
+        The indexed key most similar to key as (key, similarity), key itself with 100 if it is indexed,
+        or None if no key reaches the threshold
+        """
+        if key in self._counts:
+            return key, 100.0
+        if self.threshold >= 100 or not key:
+            return None
+        # Rarest trigrams first: a key sharing enough trigrams with key to be similar has one of the
+        # rarest 3 * max_distance + 1, so only their postings are candidates
+        postings = sorted((self._postings.get(trigram, ()) for trigram in trigrams(key)), key=len)
+        longest = int(len(key) * 100 / self.threshold)
+        prefix_length = 3 * self._max_distance(longest) + 1
+        if prefix_length > len(postings):
+            # Short key or low threshold: a similar key may share no trigram with it, compare to every key
+            candidates = self._counts.keys()
+        else:
+            candidates = set().union(*postings[:prefix_length])
+        # Candidate length -> max distance, lengths too different to reach the threshold are left out
+        limits = {length: self._max_distance(max(len(key), length)) for length in range(longest + 1)}
+        limits = {length: limit for length, limit in limits.items() if abs(len(key) - length) <= limit}
+
+        best = None
+        for candidate in candidates:
+            max_distance = limits.get(len(candidate))
+            if max_distance is None:
+                continue
+            shared = sum(map(contains, postings, repeat(candidate, len(postings))))
+            if shared < len(postings) - 3 * max_distance:
+                continue
+            distance = levenshtein_distance(key, candidate, max_distance)
+            if distance > max_distance:
+                continue
+            similarity = (1 - distance / max(len(key), len(candidate))) * 100
+            if best is None or similarity > best[1]:
+                best = (candidate, similarity)
+        return best
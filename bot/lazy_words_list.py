@@ -0,0 +1,730 @@
+import array
+import asyncio
+import hashlib
+import json
+import logging
+import marshal
+import os
+import random
+import re
+import struct
+import tempfile
+
+import constants
+from metrics import metrics
+from duplicate_index import DuplicateIndex
+from utils import preprocess_string, localize_description
+from words_list import read_changed_word_sets, log_rejected, QuizQuestion, WordsList, Word, DescriptionTable, AddResult
+
+INDEX_MAGIC = b"QBWI"
+INDEX_VERSION = 2
+# magic, version, corpus size, corpus mtime_ns, position of the group directory
+INDEX_HEADER = struct.Struct("<4sIQQQ")
+# Per group, the word offsets are followed by (key hash, entry number) pairs sorted by hash
+KEY_PAIR_SIZE = 16
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_SEPARATORS = b", \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+class _Scanner:
+    """
+    Incremental reader over a JSON file that reports byte offsets of values.
+    The bytes are decoded as latin-1 so that string positions are byte positions,
+    values that are kept are re-decoded from their raw bytes as UTF-8.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ""
+        self.base = 0  # file offset of buffer[0]
+        self.pos = 0
+
+    @property
+    def offset(self):
+        return self.base + self.pos
+
+    def _fill(self):
+        chunk = self.file.read(constants.LAZY_READ_CHUNK)
+        if not chunk:
+            return False
+        self.base += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk.decode('latin-1')
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError(f"Unexpected end of file at byte {self.offset}")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at byte {self.offset}")
+        self.pos += 1
+
+    def closes(self, char):
+        """
+        Consume a ',' and return False, or return True if the next character is char (left unconsumed)
+        """
+        if self.peek() == ',':
+            self.pos += 1
+            return False
+        if self.buffer[self.pos] != char:
+            raise ValueError(f"Expected ',' or {char!r} at byte {self.offset}")
+        return True
+
+    def skip_value(self):
+        """
+        Skip one value and return its (start, end) byte range
+        """
+        self.peek()
+        while True:
+            try:
+                _, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            start = self.offset
+            self.pos = end
+            return start, self.offset
+
+    def value(self):
+        return self.located_value()[1]
+
+    def located_value(self):
+        """
+        Return (start byte offset, decoded value) of the next value
+        """
+        start, end = self.skip_value()
+        raw = self.buffer[start - self.base:end - self.base]
+        return start, json.loads(raw.encode('latin-1').decode('utf-8'))
+
+
+def key_hash(word_key):
+    """
+    Stable 64-bit hash of a preprocessed word, the same in every process
+    """
+    return int.from_bytes(hashlib.blake2b(word_key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def scan_corpus(file):
+    """
+    Return [(group, description range, word offsets, key hashes)] of a words.json file opened in binary mode.
+    Word offsets hold the start of every word entry plus the position of the closing bracket,
+    key hashes the key_hash of every entry in file order.
+    """
+    scanner = _Scanner(file)
+    groups = []
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        return groups
+    while True:
+        name = scanner.value()
+        scanner.expect(":")
+        scanner.expect("{")
+        description_range = None
+        offsets = array.array('Q')
+        hashes = array.array('Q')
+        while scanner.peek() != "}":
+            key = scanner.value()
+            scanner.expect(":")
+            if key == "words":
+                scanner.expect("[")
+                if scanner.peek() != "]":
+                    while True:
+                        start, word = scanner.located_value()
+                        offsets.append(start)
+                        hashes.append(key_hash(preprocess_string(word["word"])))
+                        if scanner.closes("]"):
+                            break
+                offsets.append(scanner.offset)
+                scanner.expect("]")
+            elif key == "description":
+                description_range = scanner.skip_value()
+            else:
+                scanner.skip_value()
+            if scanner.closes("}"):
+                break
+        scanner.expect("}")
+        groups.append((name, description_range, offsets, hashes))
+        if scanner.closes("}"):
+            return groups
+
+
+class _Group:
+    __slots__ = ('name', 'count', 'description', 'description_range', 'table_pos', 'offsets', 'words', 'keys', 'table',
+                 'duplicates')
+
+    def __init__(self, name, count=0, description_range=None, table_pos=None):
+        self.name = name
+        self.count = count
+        self.description = None  # dict once read or modified
+        self.description_range = description_range  # byte range in the corpus file
+        self.table_pos = table_pos  # position of the word offsets in the index file
+        self.offsets = None  # array of word offsets once a random word was read from the file
+        self.words = None  # list of Words once the group was loaded
+        self.keys = None  # preprocessed word -> first Word with it, of a loaded group
+        self.table = None  # DescriptionTable of a loaded group
+        self.duplicates = None  # DuplicateIndex of a loaded group, built on the first addition
+
+    @property
+    def loaded(self):
+        return self.words is not None
+
+
+class LazyWordsList:
+    """
+    WordsList compatible store for corpora too large to keep resident.
+    A binary index next to the corpus file keeps the byte offset of every word entry
+    and a table of key hashes, so a random question or a lookup by word reads a single entry
+    and unused groups cost no memory. A group is loaded entirely only when it is listed or modified.
+    Modified groups are written back by a write-behind flush like WordsList,
+    unchanged groups are copied over byte for byte.
+    """
+    def __init__(self, filepath: str, file_sets_path: str, duplicate_similarity=constants.DUPLICATE_SIMILARITY):
+        self.filepath = filepath
+        self.file_sets_path = file_sets_path
+        self.duplicate_similarity = duplicate_similarity
+        self.index_path = os.path.splitext(filepath)[0] + ".idx"
+        self.imported_sets_path = os.path.splitext(filepath)[0] + "_imported_sets.json"
+
+        self._dirty = False
+        self._flush_task = None
+        self._flush_lock = None  # Created on first use, asyncio primitives bind to the running loop
+
+        if not os.path.exists(filepath):
+            with open(filepath, 'w', encoding='utf-8') as file:
+                file.write("{}")
+        self._open()
+        imported = self._import_word_sets()
+        if imported.added or imported.merged:
+            logging.info(f"Imported {len(imported.added)} new words from word sets")
+            self._swap(self._write_corpus(self._flush_plan()))
+
+    def _open(self):
+        """
+        Open the corpus and load its index, rebuilding the index if it is missing or stale
+        """
+        self._file = open(self.filepath, 'rb')
+        self._index = None
+        with metrics.timer("words_io", operation="load"):
+            stat = os.fstat(self._file.fileno())
+            directory = self._read_index(stat)
+            if directory is None:
+                logging.info(f"Indexing {self.filepath}")
+                groups = scan_corpus(self._file)
+                directory = self._write_index(self.index_path + ".tmp", stat, groups)
+                os.replace(self.index_path + ".tmp", self.index_path)
+        self._index = open(self.index_path, 'rb')
+        self._groups = {name: _Group(name, count, description_range, table_pos)
+                        for name, description_range, count, table_pos in directory}
+        self._group_index = {preprocess_string(name): name for name in self._groups}
+
+    def _close_files(self):
+        self._file.close()
+        if self._index is not None:
+            self._index.close()
+
+    def _read_index(self, stat):
+        """
+        Return the group directory of the index if it matches the corpus file, else None
+        """
+        try:
+            with open(self.index_path, 'rb') as file:
+                magic, version, size, mtime_ns, directory_pos = INDEX_HEADER.unpack(file.read(INDEX_HEADER.size))
+                if (magic, version, size, mtime_ns) != (INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns):
+                    return None
+                file.seek(directory_pos)
+                return marshal.load(file)
+        except (OSError, EOFError, ValueError, struct.error):
+            return None
+
+    @staticmethod
+    def _write_index(path, stat, groups):
+        """
+        Write the index for groups [(name, description range, word offsets, key hashes)], returns its directory
+        """
+        directory = []
+        with open(path, 'wb') as file:
+            file.write(b"\0" * INDEX_HEADER.size)
+            for name, description_range, offsets, hashes in groups:
+                # A group without a "words" key has no offsets at all
+                directory.append((name, description_range, max(len(offsets) - 1, 0), file.tell()))
+                offsets.tofile(file)
+                # Stable sort, entries with the same hash stay in file order
+                pairs = array.array('Q')
+                for entry in sorted(range(len(hashes)), key=hashes.__getitem__):
+                    pairs.append(hashes[entry])
+                    pairs.append(entry)
+                pairs.tofile(file)
+            directory_pos = file.tell()
+            marshal.dump(directory, file)
+            file.seek(0)
+            file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns, directory_pos))
+        return directory
+
+    def _read_range(self, start, end):
+        return os.pread(self._file.fileno(), end - start, start)
+
+    def _group_offsets(self, group):
+        if group.offsets is None:
+            offsets = array.array('Q')
+            offsets.frombytes(os.pread(self._index.fileno(), (group.count + 1) * offsets.itemsize, group.table_pos))
+            group.offsets = offsets
+        return group.offsets
+
+    def _read_word(self, group, i):
+        offsets = self._group_offsets(group)
+        return json.loads(self._read_range(offsets[i], offsets[i + 1]).rstrip(_SEPARATORS))
+
+    def _key_pair(self, group, i):
+        """
+        Return the i-th (key hash, entry number) pair of a group's key table
+        """
+        position = group.table_pos + (group.count + 1) * 8 + i * KEY_PAIR_SIZE
+        return tuple(array.array('Q', os.pread(self._index.fileno(), KEY_PAIR_SIZE, position)))
+
+    def _key_hashes(self, group):
+        """
+        Key hashes of a group not loaded, in file order
+        """
+        hashes = array.array('Q', bytes(group.count * 8))
+        if group.count:
+            pairs = array.array('Q', os.pread(self._index.fileno(), group.count * KEY_PAIR_SIZE,
+                                              group.table_pos + (group.count + 1) * 8))
+            for i in range(0, len(pairs), 2):
+                hashes[pairs[i + 1]] = pairs[i]
+        return hashes
+
+    def _find_word(self, group, word_key):
+        """
+        Return the entry dict of the first word with word_key in a group not loaded, or None.
+        Binary searches the key table in the index file and reads only the matching entries.
+        """
+        if group.table_pos is None or not group.count:
+            return None
+        wanted = key_hash(word_key)
+        low, high = 0, group.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_pair(group, middle)[0] < wanted:
+                low = middle + 1
+            else:
+                high = middle
+        while low < group.count:
+            hash_value, entry = self._key_pair(group, low)
+            if hash_value != wanted:
+                break
+            word = self._read_word(group, entry)
+            if preprocess_string(word["word"]) == word_key:
+                return word
+            low += 1
+        return None
+
+    def _read_words(self, group):
+        """
+        Decode all word entry dicts of a group from the file without keeping them
+        """
+        if group.table_pos is None or not group.count:
+            return []
+        offsets = self._group_offsets(group)
+        return json.loads(b"[" + self._read_range(offsets[0], offsets[-1]).rstrip(_SEPARATORS) + b"]")
+
+    def _load_group(self, group, words=None):
+        """
+        Keep the words of a group in memory, words are the already decoded entry dicts if given
+        """
+        if not group.loaded:
+            group.table = DescriptionTable()
+            group.words = [Word.from_dict(word, group.table)
+                           for word in (words if words is not None else self._read_words(group))]
+            group.keys = {word.key: word for word in reversed(group.words)}
+            group.duplicates = None
+            group.offsets = None
+        return group
+
+    def _description(self, group):
+        if group.description is None:
+            if group.description_range is None:
+                group.description = {}
+            else:
+                group.description = json.loads(self._read_range(*group.description_range))
+        return group.description
+
+    def _ensure_group(self, language):
+        if language not in self._groups:
+            group = self._groups[language] = _Group(language)
+            self._load_group(group, [])
+            group.description = {}
+            self._group_index[preprocess_string(language)] = language
+        return self._groups[language]
+
+    def _find_group(self, language):
+        name = self._group_index.get(preprocess_string(language))
+        return self._groups[name] if name is not None else None
+
+    def _add_new_words(self, group, words, result):
+        """
+        Add word entry dicts to a loaded group, skipping those the group has or near duplicates of them,
+        and record the outcome in the AddResult result. Returns True if the group was modified.
+        """
+        if group.duplicates is None:
+            group.duplicates = DuplicateIndex(group.keys, self.duplicate_similarity)
+        new_words = []
+        merged = False
+        for word_data in words:
+            key = preprocess_string(word_data["word"])
+            match = group.duplicates.find(key)
+            if match is None:
+                word = group.keys[key] = Word.from_dict(word_data, group.table, key)
+                group.duplicates.add(key)
+                new_words.append(word)
+                result.added.append(word.word)
+                continue
+            existing_key, similarity = match
+            existing = group.keys[existing_key]
+            if existing_key != key:
+                result.rejected.append((word_data["word"], existing.word, similarity))
+            else:
+                merged |= existing.merge_descriptions(word_data.get("descriptions", {}))
+                result.merged.append(existing.word)
+        if new_words:
+            # Lists are replaced, not appended to, so concurrent readers keep a consistent view
+            group.words = group.words + new_words
+            group.count = len(group.words)
+        return bool(new_words) or merged
+
+    def _import_word_sets(self):
+        if os.path.exists(self.imported_sets_path):
+            with open(self.imported_sets_path, 'r', encoding='utf-8') as file:
+                imported_sets = json.load(file)
+        else:
+            imported_sets = {}
+
+        imported = AddResult.empty()
+        manifest_changed = False
+        for file, record, word_set in read_changed_word_sets(self.file_sets_path, imported_sets,
+                                                             lambda name: name in self._groups):
+            for language, data in (word_set or {}).items():
+                group = self._load_group(self._ensure_group(language))
+                if not self._description(group):
+                    group.description = data.get("description", {})
+                self._add_new_words(group, data["words"], imported)
+            imported_sets[file] = record
+            manifest_changed = True
+
+        if manifest_changed:
+            with open(self.imported_sets_path, 'w', encoding='utf-8') as file:
+                json.dump(imported_sets, file, ensure_ascii=False)
+        log_rejected(imported.rejected)
+        return imported
+
+    def _flush_plan(self):
+        """
+        Snapshot of what to write per group: loaded data or byte ranges of the current file
+        """
+        plan = []
+        for group in self._groups.values():
+            words = list(group.words) if group.loaded else None
+            offsets = hashes = None
+            if not group.loaded and group.count:
+                offsets = array.array('Q', self._group_offsets(group))
+                hashes = self._key_hashes(group)
+            plan.append((group.name, group.description, group.description_range, words, offsets, hashes))
+        return plan
+
+    def _write_corpus(self, plan):
+        """
+        Write the corpus and its index to temporary files, returns (corpus path, index path, directory).
+        Runs off the event loop, it only reads the current files.
+        """
+        directory = os.path.dirname(os.path.abspath(self.filepath))
+        source = self._file.fileno()
+        groups = []
+        with tempfile.NamedTemporaryFile('wb', dir=directory, suffix='.tmp', delete=False) as file:
+            try:
+                def write(data):
+                    file.write(data)
+
+                write(b"{")
+                for i, (name, description, description_range, words, offsets, hashes) in enumerate(plan):
+                    if i:
+                        write(b",")
+                    write(json.dumps(name, ensure_ascii=False).encode('utf-8') + b':{"description":')
+                    description_start = file.tell()
+                    if description is not None or description_range is None:
+                        write(json.dumps(description or {}, ensure_ascii=False).encode('utf-8'))
+                    else:
+                        write(os.pread(source, description_range[1] - description_range[0], description_range[0]))
+                    new_description_range = (description_start, file.tell())
+                    write(b',"words":[')
+                    new_offsets = array.array('Q')
+                    new_hashes = array.array('Q')
+                    if words is not None:
+                        for j, word in enumerate(words):
+                            if j:
+                                write(b",")
+                            new_offsets.append(file.tell())
+                            new_hashes.append(key_hash(word.key))
+                            write(json.dumps(word.to_dict(), ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+                    elif offsets is not None and len(offsets) > 1:
+                        # Unchanged group, copy its entries as they are
+                        shift = file.tell() - offsets[0]
+                        position, end = offsets[0], offsets[-1]
+                        while position < end:
+                            chunk = os.pread(source, min(constants.LAZY_READ_CHUNK, end - position), position)
+                            write(chunk)
+                            position += len(chunk)
+                        new_offsets.extend(offset + shift for offset in offsets[:-1])
+                        new_hashes = hashes
+                    new_offsets.append(file.tell())
+                    write(b"]}")
+                    groups.append((name, new_description_range, new_offsets, new_hashes))
+                write(b"}")
+                file.flush()
+                os.fsync(file.fileno())
+            except BaseException:
+                file.close()
+                os.unlink(file.name)
+                raise
+        index_path = file.name + ".idx"
+        return file.name, index_path, self._write_index(index_path, os.stat(file.name), groups)
+
+    def _swap(self, written):
+        """
+        Replace the corpus and index with freshly written ones, on the event loop so no read sees them half swapped
+        """
+        corpus_path, index_path, directory = written
+        os.replace(corpus_path, self.filepath)
+        os.replace(index_path, self.index_path)
+        self._close_files()
+        self._file = open(self.filepath, 'rb')
+        self._index = open(self.index_path, 'rb')
+        for name, description_range, count, table_pos in directory:
+            group = self._groups[name]
+            group.description_range = description_range
+            group.table_pos = table_pos
+            if not group.loaded:
+                group.count = count
+                group.offsets = None
+
+    async def _save_words(self):
+        """
+        Mark the corpus as modified, all mutations within WORDS_FLUSH_DELAY are written by one flush
+        """
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(constants.WORDS_FLUSH_DELAY)
+        await self.flush()
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            plan = self._flush_plan()
+            loop = asyncio.get_running_loop()
+            try:
+                with metrics.timer("words_io", operation="flush"):
+                    written = await loop.run_in_executor(None, self._write_corpus, plan)
+            except Exception:
+                self._dirty = True
+                logging.exception(f"Failed to save words to {self.filepath}")
+                return
+            self._swap(written)
+
+    async def close(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        self._close_files()
+
+    async def reload(self):
+        """
+        Forget everything read so far after another process modified the corpus
+        """
+        if self._dirty:
+            logging.warning(f"Discarding unsaved word changes, {self.filepath} was modified by another process")
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._dirty = False
+        self._close_files()
+        self._open()
+
+    def word_counts(self):
+        return {name: group.count for name, group in self._groups.items()}
+
+    async def add_word(self, json_word_data):
+        """
+        Add one word entry or a list of them, returns an AddResult
+        """
+        words_data = json.loads(json_word_data)
+        if isinstance(words_data, dict):
+            words_data = [words_data]
+        elif not isinstance(words_data, list):
+            raise ValueError("Invalid input format")
+        return await self.add_words(words_data)
+
+    async def add_words(self, words_data):
+        """
+        Add word entry dicts, returns an AddResult
+        """
+        # Validate every entry before touching the corpus
+        new_words = {}
+        for word_data in words_data:
+            language, new_word = WordsList._make_word(word_data)
+            new_words.setdefault(language, []).append(new_word)
+        result = AddResult.empty()
+        modified = False
+        for language, words in new_words.items():
+            modified |= self._add_new_words(self._load_group(self._ensure_group(language)), words, result)
+        if modified:
+            await self._save_words()
+        return result
+
+    async def remove_word(self, word_text):
+        word_key = preprocess_string(word_text)
+        removed = False
+        for group in self._groups.values():
+            if group.loaded:
+                if word_key not in group.keys:
+                    continue
+            else:
+                if self._find_word(group, word_key) is None:
+                    continue
+                self._load_group(group)
+            group.words = [word for word in group.words if word.key != word_key]
+            del group.keys[word_key]
+            if group.duplicates is not None:
+                group.duplicates.discard(word_key)
+            group.count = len(group.words)
+            removed = True
+        if removed:
+            await self._save_words()
+        return removed
+
+    async def get_word_by_text(self, word_text):
+        word_key = preprocess_string(word_text)
+        for group in self._groups.values():
+            if group.loaded:
+                if word_key in group.keys:
+                    return group.keys[word_key]
+                continue
+            word = self._find_word(group, word_key)
+            if word is not None:
+                return Word.from_dict(word, key=word_key)
+        return None
+
+    async def get_words_by_text(self, word_text=None):
+        """
+        Return the whole corpus, without the entries of word_text if given. Loads every group.
+        """
+        excluded = preprocess_string(word_text) if word_text is not None else None
+        return {
+            name: {"description": self._description(group),
+                   "words": [word for word in self._load_group(group).words if word.key != excluded]}
+            for name, group in self._groups.items()
+        }
+
+    async def get_words_by_language(self, language=None):
+        """
+        Return the word entries of a group (or of all groups), loading them; callers must not mutate them
+        """
+        if language is not None:
+            group = self._find_group(language)
+            if group is None:
+                return []
+            return self._load_group(group).words
+        return [word for group in self._groups.values() for word in self._load_group(group).words]
+
+    async def iter_words(self, language):
+        """
+        Yield the words of a group one by one. A group not loaded is streamed from the file through
+        its word offsets, about LAZY_READ_CHUNK bytes at a time, and stays unloaded.
+        """
+        group = self._find_group(language)
+        if group is None:
+            return
+        if group.loaded:
+            for word in group.words:
+                yield word
+            return
+        if group.table_pos is None or not group.count:
+            return
+        offsets = self._group_offsets(group)
+        start = 0
+        while start < group.count:
+            end = start + 1
+            while end < group.count and offsets[end + 1] - offsets[start] <= constants.LAZY_READ_CHUNK:
+                end += 1
+            for word in json.loads(b"[" + self._read_range(offsets[start], offsets[end]).rstrip(_SEPARATORS) + b"]"):
+                yield Word.from_dict(word)
+            start = end
+
+    async def get_random_word(self, language):
+        group = self._find_group(language)
+        if group is None or not group.count:
+            return None
+        if group.loaded:
+            return random.choice(group.words)
+        return Word.from_dict(self._read_word(group, random.randrange(group.count)))
+
+    async def get_random_question(self, language, bot_language):
+        """
+        Return a random QuizQuestion of a group localized for bot_language, or None if the group is empty
+        """
+        word_data = await self.get_random_word(language)
+        if word_data is None:
+            return None
+        return QuizQuestion.from_word(word_data, bot_language)
+
+    async def get_question_by_key(self, language, word_key, bot_language):
+        """
+        Return the QuizQuestion of the word with the preprocessed text word_key in a group, or None.
+        Reads only that entry of a group not loaded.
+        """
+        group = self._find_group(language)
+        if group is None:
+            return None
+        if group.loaded:
+            word = group.keys.get(word_key)
+        else:
+            word = self._find_word(group, word_key)
+            if word is not None:
+                word = Word.from_dict(word, key=word_key)
+        return QuizQuestion.from_word(word, bot_language) if word is not None else None
+
+    async def get_languages(self):
+        return list(self._groups)
+
+    async def get_group_description(self, language, bot_language=None):
+        """
+        Return the description dict of a group, or the resolved description
+        for bot_language if one is given
+        """
+        group = self._find_group(language)
+        if group is None:
+            return None
+        description = self._description(group)
+        if bot_language is None:
+            return description
+        return localize_description(description, bot_language)
+
+    async def update_description(self, json_word_data):
+        word_data = json.loads(json_word_data)
+        group = self._find_group(word_data["language"])
+        if group is None:
+            return False
+        group.description = word_data["descriptions"]
+        await self._save_words()
+        return True
@@ -0,0 +1,208 @@
+"""
+Offline load test of TelegramQuizBot.
+
+Builds the bot with the real WordsList and translations.json (on a temporary copy of
+the data directory) and drives its handlers directly with synthetic Update objects.
+Outgoing messages go through the bot's MessageSender to a recording fake bot, so no
+network is involved. Every chat starts a quiz, then each round every chat is asked a
+question and answers it, with /list and /add_word mixed in. The report has p50/p99
+latency per handler, updates per second and peak RSS as JSON, e.g.
+
+    python bot/loadtest.py --chats 500 --rounds 20 --output load_test.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+from telegram import Update
+
+from telegram_bot import TelegramQuizBot
+from words_list import WordsList
+from message_sender import MessageSender
+from replay_updates import percentile
+
+ADMIN_HANDLE = "load_test_admin"
+UNLIMITED = (1e9, 1e9)
+
+
+class RecordingBot:
+    """
+    Stands in for telegram.Bot, answers send_message after an optional simulated API delay
+    """
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = defaultdict(list)  # chat_id -> texts
+        self._message_id = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self._message_id += 1
+        self.sent[chat_id].append(text)
+        return SimpleNamespace(message_id=self._message_id, chat_id=chat_id, text=text)
+
+
+class UpdateFactory:
+    def __init__(self, bot):
+        self.bot = bot
+        self._update_id = 0
+
+    def message(self, chat_id, text, username="load_test_user", reply_to=None):
+        self._update_id += 1
+        chat = {"id": chat_id, "type": "private" if chat_id > 0 else "group"}
+        message = {
+            "message_id": self._update_id,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": {"id": abs(chat_id), "is_bot": False, "first_name": username, "username": username},
+            "text": text,
+        }
+        if reply_to is not None:
+            message["reply_to_message"] = {"message_id": reply_to, "date": int(time.time()), "chat": chat}
+        return Update.de_json({"update_id": self._update_id, "message": message}, self.bot)
+
+
+class LoadTest:
+    def __init__(self, args, data_path):
+        with open(os.path.join(data_path, "translations.json"), 'r', encoding='utf-8') as f:
+            translations = json.load(f)
+        words = WordsList(filepath=os.path.join(data_path, "words.json"),
+                          file_sets_path=os.path.join(data_path, "word_sets"))
+        self.args = args
+        self.fake_bot = RecordingBot(args.send_delay)
+        self.quiz_bot = TelegramQuizBot(telegram_token="load-test", allowed_handles=['@' + ADMIN_HANDLE],
+                                        words_list=words, translations=translations,
+                                        message_sender=MessageSender(UNLIMITED, UNLIMITED, UNLIMITED))
+        self.updates = UpdateFactory(self.fake_bot)
+        self.latencies = defaultdict(list)  # handler name -> seconds
+        # Chats 1..N, every other one is a group chat (negative id)
+        self.chats = [chat if chat % 2 else -chat for chat in range(1, args.chats + 1)]
+
+    async def _timed(self, name, handler, *args):
+        started = time.perf_counter()
+        await handler(*args)
+        self.latencies[name].append(time.perf_counter() - started)
+
+    async def _command(self, name, handler, chat_id, command_args, username="load_test_user"):
+        update = self.updates.message(chat_id, " ".join(["/" + name] + command_args), username)
+        await self._timed(name, handler, update, SimpleNamespace(args=command_args))
+
+    async def _answer(self, chat_id):
+        question = self.quiz_bot.quiz_history.latest(chat_id)
+        if question is None:
+            return
+        roll = random.random()
+        if roll < self.args.correct_ratio:
+            text = question["answer"]
+        elif roll < self.args.correct_ratio + 0.1:
+            text = random.choice(["hint", "idk"])
+        else:
+            text = question["answer"][::-1] + "x"
+        update = self.updates.message(chat_id, text, reply_to=question["message_ids"][-1])
+        await self._timed("check_answer", self.quiz_bot.check_answer, update, SimpleNamespace(args=[]))
+
+    async def _chat_round(self, chat_id, round_number):
+        await self._timed("callback_quiz", self.quiz_bot.callback_quiz, chat_id)
+        for _ in range(self.args.answers):
+            await self._answer(chat_id)
+        if random.random() < self.args.list_ratio:
+            await self._command("list", self.quiz_bot.list_words, chat_id,
+                                [self.args.language] if random.random() < 0.5 else [])
+        if random.random() < self.args.add_ratio:
+            # Random suffixes, numbered words would be rejected as near duplicates of each other
+            word = {"word": f"load test {random.getrandbits(64):016x}", "descriptions": {"english": "load test word"},
+                    "language": self.args.language}
+            await self._command("add_word", self.quiz_bot.add_word, chat_id, [json.dumps(word)], ADMIN_HANDLE)
+
+    async def run(self):
+        sender = self.quiz_bot.message_sender
+        sender.start(self.fake_bot)
+        interval = [self.args.language, "60m"]
+        await asyncio.gather(*[self._command("start", self.quiz_bot.start_callback_quiz, chat_id, interval)
+                               for chat_id in self.chats])
+
+        started = time.perf_counter()
+        for round_number in range(self.args.rounds):
+            round_started = time.perf_counter()
+            # Chats are independent, their rounds run concurrently like concurrently processed updates
+            await asyncio.gather(*[self._chat_round(chat_id, round_number) for chat_id in self.chats])
+            if self.args.round_time:
+                await asyncio.sleep(max(self.args.round_time - (time.perf_counter() - round_started), 0))
+        elapsed = time.perf_counter() - started
+
+        await sender.stop()
+        await self.quiz_bot.words_list.close()
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        # The /start commands run before the timed rounds
+        handled = sum(len(values) for name, values in self.latencies.items() if name != "start")
+        return {
+            "commit": current_commit(),
+            "config": vars(self.args),
+            "seconds": elapsed,
+            "updates": handled,
+            "updates_per_second": handled / elapsed if elapsed else 0.0,
+            "messages_sent": self.quiz_bot.message_sender.sent,
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "handlers": {
+                name: {"count": len(values), "p50_ms": percentile(values, 0.5) * 1000,
+                       "p99_ms": percentile(values, 0.99) * 1000}
+                for name, values in sorted(self.latencies.items())
+            },
+        }
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"),
+                        help="data directory with words.json, word_sets/ and translations.json, it is not modified")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=10, help="questions asked per chat")
+    parser.add_argument("--answers", type=int, default=2, help="answers per question")
+    parser.add_argument("--round-time", type=float, default=0,
+                        help="seconds per round, sets the answer rate; 0 runs as fast as possible")
+    parser.add_argument("--language", default="english_b2", help="word group of the quizzes")
+    parser.add_argument("--correct-ratio", type=float, default=0.3)
+    parser.add_argument("--list-ratio", type=float, default=0.02, help="chance of a /list per chat round")
+    parser.add_argument("--add-ratio", type=float, default=0.001, help="chance of an /add_word per chat round")
+    parser.add_argument("--send-delay", type=float, default=0, help="simulated Bot API latency in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as data_path:
+        shutil.copy(os.path.join(args.data, "translations.json"), data_path)
+        shutil.copy(os.path.join(args.data, "words.json"), data_path)
+        shutil.copytree(os.path.join(args.data, "word_sets"), os.path.join(data_path, "word_sets"))
+        report = asyncio.run(LoadTest(args, data_path).run())
+
+    report_text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report_text)
+    else:
+        print(report_text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,98 @@
+import asyncio
+import fcntl
 import os
 import logging
 from dotenv import load_dotenv
 from telegram_bot import TelegramQuizBot
 from words_list import WordsList
+from sqlite_words_list import SQLiteWordsList
+from lazy_words_list import LazyWordsList
+from state_store import StateStore, SQLiteStateStore
+from sharding import ShardRouter
+import startup_snapshot
 import json
+import constants
+
+
+def _duplicate_similarity():
+    # New words at least this similar (in percent) to a word of their group are rejected, 100 allows near duplicates
+    return float(os.getenv('DUPLICATE_SIMILARITY', constants.DUPLICATE_SIMILARITY))
+
+
+def load_snapshot():
+    """
+    The startup snapshot of the json backend's corpus and of the translations, None with another backend
+    or an empty SNAPSHOT_PATH
+    """
+    snapshot_path = os.getenv('SNAPSHOT_PATH', './data/snapshot.pickle')
+    if os.getenv('WORDS_BACKEND', 'json') != 'json' or not snapshot_path:
+        return None
+    return startup_snapshot.load_or_build(snapshot_path, "./data/words.json", "./data/word_sets/",
+                                          "./data/translations.json", _duplicate_similarity())
+
+
+def create_words_list(duplicate_similarity=None, snapshot=None):
+    if snapshot is not None:
+        return snapshot.words
+    backend = os.getenv('WORDS_BACKEND', 'json')
+    if duplicate_similarity is None:
+        duplicate_similarity = _duplicate_similarity()
+    if backend == 'sqlite':
+        return SQLiteWordsList(db_path=os.getenv('WORDS_DB_PATH', './data/words.sqlite3'),
+                               filepath="./data/words.json", file_sets_path="./data/word_sets/",
+                               duplicate_similarity=duplicate_similarity)
+    if backend == 'lazy':
+        return LazyWordsList(filepath="./data/words.json", file_sets_path="./data/word_sets/",
+                             duplicate_similarity=duplicate_similarity)
+    return WordsList(filepath="./data/words.json", file_sets_path="./data/word_sets/",
+                     duplicate_similarity=duplicate_similarity)
+
+
+def lock_words(blocking=True):
+    """
+    Take the lock the running bot holds over the word files. The json and lazy backends rewrite
+    words.json from memory on every flush, so words_cli refuses to import into them while it is held.
+    Returns the open lock file, locked until it is closed, or None if blocking is False and the lock is taken.
+    """
+    lock_file = open("./data/words.lock", 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def create_bot(shard=None, workers=1, **bot_kwargs):
+    """
+    Build the bot, in sharded mode this runs inside each worker process
+    """
+    snapshot = load_snapshot()
+    words = create_words_list(snapshot=snapshot)
+    if snapshot is not None:
+        translations = snapshot.catalog
+    else:
+        with open("./data/translations.json", 'r', encoding='utf-8') as f:
+            translations = json.load(f)
+
+    # An empty STATE_DB_PATH keeps chat state in memory only
+    state_db_path = os.getenv('STATE_DB_PATH', './data/state.sqlite3')
+    state_store = SQLiteStateStore(state_db_path) if state_db_path else StateStore()
+
+    # Prometheus metrics on METRICS_PORT, sharded workers use the following ports
+    metrics_address = None
+    if os.getenv('METRICS_PORT'):
+        metrics_address = (os.getenv('METRICS_HOST', '127.0.0.1'), int(os.getenv('METRICS_PORT')) + (shard or 0))
+    metrics_log_interval = float(os.getenv('METRICS_LOG_INTERVAL') or 0) or None
+
+    return TelegramQuizBot(telegram_token=os.getenv('TELEGRAM_TOKEN'),
+                           allowed_handles=os.getenv('ALLOWED_HANDLES').split(','),
+                           words_list=words,
+                           translations=translations,
+                           state_store=state_store,
+                           metrics_address=metrics_address,
+                           metrics_log_interval=metrics_log_interval,
+                           **bot_kwargs)
 
 
 def main():
@@ -15,17 +104,40 @@ def main():
         level=logging.INFO
     )
 
-    words = WordsList(filepath="./data/words.json", file_sets_path="./data/word_sets/")
-    with open("./data/translations.json", 'r', encoding='utf-8') as f:
-        translations = json.load(f)
+    # Webhook mode is enabled by WEBHOOK_URL, the public base URL Telegram posts updates to
+    run_args = dict(webhook_url=os.getenv('WEBHOOK_URL'),
+                    listen=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+                    port=int(os.getenv('WEBHOOK_PORT', '8443')),
+                    url_path=os.getenv('WEBHOOK_PATH', 'telegram'),
+                    secret_token=os.getenv('WEBHOOK_SECRET_TOKEN'))
+
+    workers = int(os.getenv('BOT_WORKERS', '1'))
+    if workers > 1 and os.getenv('WORDS_BACKEND', 'json') != 'sqlite':
+        # Every worker would rewrite words.json from its own copy of the corpus, losing the others' changes
+        raise SystemExit("BOT_WORKERS > 1 needs WORDS_BACKEND=sqlite")
+
+    # Held until the process exits, sharded workers run under the lock of this process
+    words_lock = lock_words(blocking=False)
+    if words_lock is None:
+        logging.info("Waiting for words_cli to finish importing")
+        words_lock = lock_words()
 
-    bot = TelegramQuizBot(telegram_token=os.getenv('TELEGRAM_TOKEN'),
-                          allowed_handles=os.getenv('ALLOWED_HANDLES').split(','),
-                          words_list=words,
-                          translations=translations)
-    
-    bot.run()
+    if workers > 1:
+        # Import the word sets and refresh the startup snapshot once here instead of racing in every worker.
+        # Not with asyncio.run, which leaves the main thread without the event loop that
+        # run_webhook/run_polling get from asyncio.get_event_loop()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(create_words_list(snapshot=load_snapshot()).close())
+        finally:
+            loop.close()
+        router = ShardRouter(telegram_token=os.getenv('TELEGRAM_TOKEN'), create_bot=create_bot,
+                             workers=workers, base_url=os.getenv('TELEGRAM_BASE_URL'))
+        router.run(**run_args)
+    else:
+        bot = create_bot()
+        bot.run(base_url=os.getenv('TELEGRAM_BASE_URL'), **run_args)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,218 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram.error import RetryAfter
+
+import constants
+from metrics import metrics
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """
+        Seconds until a token is available
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def time_to_full(self, now):
+        self._refill(now)
+        return (self.capacity - self.tokens) / self.rate
+
+
+class _PendingMessage:
+    __slots__ = ('priority', 'kwargs', 'future', 'enqueued_at')
+
+    def __init__(self, priority, kwargs, future, enqueued_at):
+        self.priority = priority
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued_at = enqueued_at
+
+
+class _ChatQueue:
+    __slots__ = ('messages', 'bucket', 'busy')
+
+    def __init__(self, bucket):
+        self.messages = deque()
+        self.bucket = bucket
+        # Set while the head message is in flight or the chat waits for its rate limit
+        self.busy = False
+
+
+class MessageSender:
+    """
+    Central outbound queue for bot messages. Respects the global and per-chat
+    Telegram rate limits with token buckets, honours RetryAfter and sends
+    higher priority (lower value) messages first. Messages of one chat are
+    always delivered in the order they were queued.
+    """
+    def __init__(self, global_limit=constants.SEND_GLOBAL_LIMIT,
+                 private_chat_limit=constants.SEND_PRIVATE_CHAT_LIMIT,
+                 group_chat_limit=constants.SEND_GROUP_CHAT_LIMIT):
+        """
+        Limits are (messages per second, burst size) pairs
+        """
+        self.bot = None
+        self.global_bucket = TokenBucket(*global_limit)
+        self.private_chat_limit = private_chat_limit
+        self.group_chat_limit = group_chat_limit
+        self._chats = {}  # chat_id -> _ChatQueue
+        self._ready = []  # heap of (priority, seq, chat_id) for chats that can send their head message
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._worker = None
+        self._deliveries = set()
+
+        # Metrics
+        self.queue_depth = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self._latencies = deque(maxlen=constants.SEND_LATENCY_SAMPLES)
+
+    def start(self, bot):
+        self.bot = bot
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for task in list(self._deliveries):
+            task.cancel()
+        for chat in self._chats.values():
+            for pending in chat.messages:
+                pending.future.cancel()
+        self._chats.clear()
+        self._ready.clear()
+        self.queue_depth = 0
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        return {
+            "queue_depth": self.queue_depth,
+            "queued_chats": len(self._chats),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+            "latency_p99": latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+        }
+
+    async def send_message(self, chat_id, priority=constants.PRIORITY_REPLY, **kwargs):
+        """
+        Queue a message and wait until it is sent, returns the sent Message
+        """
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            # Group and channel ids are negative
+            limit = self.group_chat_limit if chat_id < 0 else self.private_chat_limit
+            chat = self._chats[chat_id] = _ChatQueue(TokenBucket(*limit))
+        chat.messages.append(_PendingMessage(priority, dict(kwargs, chat_id=chat_id), future, time.monotonic()))
+        self.queue_depth += 1
+        if not chat.busy and len(chat.messages) == 1:
+            self._make_ready(chat_id)
+        return await future
+
+    def _make_ready(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return
+        chat.busy = False
+        if chat.messages:
+            heapq.heappush(self._ready, (chat.messages[0].priority, next(self._seq), chat_id))
+            self._wakeup.set()
+        else:
+            self._discard_if_idle(chat_id)
+
+    def _discard_if_idle(self, chat_id):
+        """
+        Forget a chat once it has nothing pending and its bucket refilled, so idle chats cost no memory
+        """
+        chat = self._chats.get(chat_id)
+        if chat is None or chat.busy or chat.messages:
+            return
+        wait = chat.bucket.time_to_full(time.monotonic())
+        if wait > 0:
+            asyncio.get_running_loop().call_later(wait, self._discard_if_idle, chat_id)
+        else:
+            del self._chats[chat_id]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            wait = self.global_bucket.wait_time(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            _, _, chat_id = heapq.heappop(self._ready)
+            chat = self._chats[chat_id]
+            chat.busy = True
+            wait = chat.bucket.wait_time(now)
+            if wait > 0:
+                # Let other chats go first until this one has a token again
+                loop.call_later(wait, self._make_ready, chat_id)
+                continue
+
+            self.global_bucket.consume(now)
+            chat.bucket.consume(now)
+            task = asyncio.create_task(self._deliver(chat_id, chat, chat.messages[0]))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, chat_id, chat, pending):
+        started = time.perf_counter()
+        try:
+            message = await self.bot.send_message(**pending.kwargs)
+        except RetryAfter as e:
+            # Keep the message at the head of the chat queue and retry once the flood wait is over
+            self.retries += 1
+            logging.warning(f"Flood limit hit for chat {chat_id}, retrying in {e.retry_after}s")
+            asyncio.get_running_loop().call_later(float(e.retry_after), self._make_ready, chat_id)
+            return
+        except Exception as e:
+            metrics.observe("send_api", time.perf_counter() - started)
+            self.failed += 1
+            chat.messages.popleft()
+            self.queue_depth -= 1
+            if not pending.future.done():
+                pending.future.set_exception(e)
+        else:
+            metrics.observe("send_api", time.perf_counter() - started)
+            self.sent += 1
+            chat.messages.popleft()
+            self.queue_depth -= 1
+            self._latencies.append(time.monotonic() - pending.enqueued_at)
+            if not pending.future.done():
+                pending.future.set_result(message)
+        self._make_ready(chat_id)
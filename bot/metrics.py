@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+import constants
+
+
+class Metrics:
+    """
+    In-process counters, timers and gauges rendered in the Prometheus text format.
+    Timers are exported as summaries (_count, _sum) plus the maximum seen.
+    Gauges are read from collectors, callables returning {(name, labels): value}, at render time.
+    """
+    def __init__(self):
+        self._counters = {}  # (name, labels) -> value
+        self._timers = {}  # (name, labels) -> [count, total seconds, max seconds]
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        timer = self._timers.get(key)
+        if timer is None:
+            self._timers[key] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name, **labels):
+        """
+        Decorator timing every call of a coroutine function
+        """
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        self._collectors.remove(collector)
+
+    def render(self):
+        lines = []
+        for (name, labels), value in sorted(self._counters.items()):
+            lines.append(f"{constants.METRICS_PREFIX}{name}_total{_labels(labels)} {value}")
+        for (name, labels), (count, total, maximum) in sorted(self._timers.items()):
+            lines.append(f"{constants.METRICS_PREFIX}{name}_seconds_count{_labels(labels)} {count}")
+            lines.append(f"{constants.METRICS_PREFIX}{name}_seconds_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{constants.METRICS_PREFIX}{name}_seconds_max{_labels(labels)} {maximum:.6f}")
+        for collector in self._collectors:
+            try:
+                gauges = collector()
+            except Exception:
+                logging.exception("Metrics collector failed")
+                continue
+            for (name, labels), value in sorted(gauges.items()):
+                lines.append(f"{constants.METRICS_PREFIX}{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host, port):
+        """
+        Serve render() over HTTP on host:port for Prometheus scrapes, returns the asyncio server
+        """
+        async def handle(reader, writer):
+            try:
+                # Only the request line matters, every path answers with the metrics
+                await reader.readline()
+                body = self.render().encode("utf-8")
+                writer.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                             b"Connection: close\r\n\r\n" + body)
+                await writer.drain()
+            finally:
+                writer.close()
+        return await asyncio.start_server(handle, host, port)
+
+
+_LABEL_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n"})
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    # Label values are user data (e.g. word group names), escaped as the text exposition format requires
+    return "{" + ",".join(f'{key}="{str(value).translate(_LABEL_ESCAPES)}"' for key, value in labels) + "}"
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread from a background thread at a fixed interval and counts
+    where it is, cheap enough to toggle on a live bot
+    """
+    def __init__(self, interval=constants.PROFILER_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()  # stack tuple, innermost frame last -> sample count
+        self.total = 0
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, thread_id=None):
+        """
+        Start sampling thread_id, by default the calling thread
+        """
+        target = thread_id if thread_id is not None else threading.get_ident()
+        self.samples.clear()
+        self.total = 0
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample, args=(target,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def _sample(self, target):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None and len(stack) < constants.PROFILER_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno} {code.co_name}")
+                frame = frame.f_back
+            self.samples[tuple(reversed(stack))] += 1
+            self.total += 1
+
+    def report(self, limit=constants.PROFILER_REPORT_LENGTH):
+        """
+        Share of samples per function, counting a function once per sample it appears in
+        """
+        inclusive = Counter()
+        for stack, count in self.samples.items():
+            for function in {frame.split(" ", 1)[1] + " " + frame.split(":", 1)[0] for frame in stack}:
+                inclusive[function] += count
+        lines = [f"{self.total} samples every {self.interval * 1000:g} ms"]
+        for function, count in inclusive.most_common(limit):
+            lines.append(f"{count * 100 / max(self.total, 1):5.1f}% {function}")
+        return "\n".join(lines)
+
+
+metrics = Metrics()
@@ -0,0 +1,57 @@
+from collections import deque
+
+import constants
+
+
+class QuizHistory:
+    """
+    Recent quiz questions kept per chat in bounded ring buffers, with an index
+    from (chat_id, message_id) to the question so replies are resolved in O(1).
+    """
+    def __init__(self, max_length=constants.QUIZ_HISTORY_LENGTH):
+        self.max_length = max_length
+        self._chats = {}  # chat_id -> deque of questions, oldest first
+        self._by_message = {}  # (chat_id, message_id) -> question
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, question):
+        """
+        Store a question, evicting the oldest one of the chat when its buffer is full.
+        Returns the evicted question or None.
+        """
+        chat_id = question['chat_id']
+        history = self._chats.get(chat_id)
+        if history is None:
+            history = self._chats[chat_id] = deque()
+
+        evicted = None
+        if len(history) >= self.max_length:
+            evicted = history.popleft()
+            self._size -= 1
+            for message_id in evicted['message_ids']:
+                self._by_message.pop((chat_id, message_id), None)
+
+        history.append(question)
+        self._size += 1
+        for message_id in question['message_ids']:
+            self._by_message[(chat_id, message_id)] = question
+        return evicted
+
+    def add_message_id(self, question, message_id):
+        """
+        Register a follow-up message that can be replied to for the question
+        """
+        question['message_ids'].append(message_id)
+        self._by_message[(question['chat_id'], message_id)] = question
+
+    def find(self, chat_id, message_id):
+        return self._by_message.get((chat_id, message_id))
+
+    def latest(self, chat_id):
+        history = self._chats.get(chat_id)
+        if history:
+            return history[-1]
+        return None
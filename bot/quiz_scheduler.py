@@ -0,0 +1,141 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+
+import constants
+
+
+class QuizScheduler:
+    """
+    Drives every timed quiz from a single heap of due times instead of one job per chat.
+    Chats due within the same tick are handed to the callback as one batch, and every
+    period is jittered so chats that started together drift apart instead of firing
+    together forever.
+    """
+    def __init__(self, callback, tick=constants.QUIZ_SCHEDULER_TICK, jitter=constants.QUIZ_INTERVAL_JITTER):
+        """
+        callback is an async callable receiving the list of chat ids that are due
+        """
+        self.callback = callback
+        self.tick = tick
+        self.jitter = jitter
+        self._heap = []  # (due, generation, chat_id), stale entries are skipped when popped
+        self._quizzes = {}  # chat_id -> (interval, due, generation)
+        self._generation = 0
+        self._wakeup = None
+        self._worker = None
+
+        # Statistics
+        self.ticks = 0
+        self.last_batch_size = 0
+        self.max_lag = 0.0
+        self._lag_total = 0.0
+        self._lag_count = 0
+
+    def __contains__(self, chat_id):
+        return chat_id in self._quizzes
+
+    def __len__(self):
+        return len(self._quizzes)
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def schedule(self, chat_id, interval, first):
+        """
+        Run the chat's quiz in first seconds and then every interval seconds, replacing any previous schedule
+        """
+        self._push(chat_id, interval, time.monotonic() + first)
+
+    def cancel(self, chat_id):
+        """
+        Stop the chat's quiz, returns False if it had none
+        """
+        return self._quizzes.pop(chat_id, None) is not None
+
+    def interval(self, chat_id):
+        return self._quizzes[chat_id][0]
+
+    def time_until(self, chat_id):
+        """
+        Seconds until the chat's next question is due
+        """
+        return max(self._quizzes[chat_id][1] - time.monotonic(), 0)
+
+    def stats(self):
+        next_due = self._next_due()
+        return {
+            "active": len(self._quizzes),
+            "next_due_in": max(next_due - time.monotonic(), 0) if next_due is not None else None,
+            "ticks": self.ticks,
+            "last_batch_size": self.last_batch_size,
+            "lag_avg": self._lag_total / self._lag_count if self._lag_count else 0.0,
+            "lag_max": self.max_lag,
+        }
+
+    def _push(self, chat_id, interval, due):
+        self._generation += 1
+        self._quizzes[chat_id] = (interval, due, self._generation)
+        heapq.heappush(self._heap, (due, self._generation, chat_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _next_due(self):
+        # Drop cancelled or rescheduled entries from the top of the heap
+        while self._heap:
+            due, generation, chat_id = self._heap[0]
+            quiz = self._quizzes.get(chat_id)
+            if quiz is not None and quiz[2] == generation:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self, now):
+        due_chats = []
+        while True:
+            due = self._next_due()
+            if due is None or due > now + self.tick:
+                return due_chats
+            _, _, chat_id = heapq.heappop(self._heap)
+            interval = self._quizzes[chat_id][0]
+
+            lag = max(now - due, 0)
+            self._lag_total += lag
+            self._lag_count += 1
+            self.max_lag = max(self.max_lag, lag)
+
+            next_due = due + interval * (1 + random.uniform(-self.jitter, self.jitter))
+            # After a long stall skip the missed runs instead of firing them back to back
+            self._push(chat_id, interval, max(next_due, now + interval * self.jitter))
+            due_chats.append(chat_id)
+
+    async def _run(self):
+        while True:
+            due = self._next_due()
+            self._wakeup.clear()
+            if due is None:
+                await self._wakeup.wait()
+                continue
+            delay = due - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due_chats = self._pop_due(time.monotonic())
+            self.ticks += 1
+            self.last_batch_size = len(due_chats)
+            try:
+                await self.callback(due_chats)
+            except Exception:
+                logging.exception("Failed to run due quizzes")
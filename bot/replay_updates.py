@@ -0,0 +1,168 @@
+"""
+Replays recorded Telegram updates against the bot running in webhook mode and
+measures end-to-end latency offline.
+
+The harness serves a fake Bot API that answers the bot's requests and records
+every sendMessage. Each recorded update (one JSON object per line) is POSTed
+to the webhook, and its latency is the time until the bot's next message to
+the same chat. Start the bot against the harness with e.g.
+
+    TELEGRAM_BASE_URL=http://127.0.0.1:8081/bot WEBHOOK_URL=http://127.0.0.1:8443 python bot/main.py
+    python bot/replay_updates.py updates.ndjson --webhook http://127.0.0.1:8443/telegram
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeBotAPI:
+    """
+    Minimal Bot API answering the calls the bot makes and recording when each chat got a message
+    """
+    def __init__(self, host, port):
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self._pending = defaultdict(deque)  # chat_id -> posted-at times of updates still waiting for a reply
+        self.latencies = []
+        self.sent_messages = 0
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+
+    def expect_reply(self, chat_id, posted_at):
+        with self._lock:
+            self._pending[chat_id].append(posted_at)
+
+    def _on_send_message(self, params):
+        chat_id = int(params["chat_id"])
+        now = time.perf_counter()
+        with self._lock:
+            self._message_id += 1
+            self.sent_messages += 1
+            if self._pending[chat_id]:
+                self.latencies.append(now - self._pending[chat_id].popleft())
+            message_id = self._message_id
+        return {"message_id": message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+                "text": params.get("text", "")}
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                else:
+                    params = {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+
+                method = self.path.rsplit("/", 1)[-1]
+                if method == "getMe":
+                    result = {"id": 1, "is_bot": True, "first_name": "QuizBot", "username": "quiz_bot"}
+                elif method == "sendMessage":
+                    result = api._on_send_message(params)
+                else:
+                    result = True
+
+                response = json.dumps({"ok": True, "result": result}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("updates", help="file with one recorded update JSON per line")
+    parser.add_argument("--webhook", default="http://127.0.0.1:8443/telegram", help="the bot's webhook URL")
+    parser.add_argument("--secret-token", default=None, help="WEBHOOK_SECRET_TOKEN of the bot")
+    parser.add_argument("--api-host", default="127.0.0.1")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel webhook POSTs")
+    parser.add_argument("--rate", type=float, default=0, help="updates per second, 0 replays as fast as possible")
+    parser.add_argument("--wait", type=float, default=5, help="seconds to wait for outstanding replies")
+    parser.add_argument("--no-api", action="store_true", help="do not start the fake Bot API")
+    args = parser.parse_args()
+
+    api = None
+    if not args.no_api:
+        api = FakeBotAPI(args.api_host, args.api_port)
+        threading.Thread(target=api.server.serve_forever, daemon=True).start()
+        print(f"Fake Bot API listening on http://{args.api_host}:{args.api_port}/bot")
+        input("Start the bot with TELEGRAM_BASE_URL pointing here, then press Enter to replay...")
+
+    with open(args.updates, "r", encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+
+    headers = {"Content-Type": "application/json"}
+    if args.secret_token:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = args.secret_token
+
+    post_latencies = []
+    failures = []
+
+    def post(update):
+        chat = (update.get("message") or update.get("edited_message") or {}).get("chat", {})
+        request = urllib.request.Request(args.webhook, data=json.dumps(update).encode("utf-8"), headers=headers)
+        started = time.perf_counter()
+        if api is not None and "id" in chat:
+            api.expect_reply(chat["id"], started)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+            post_latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            failures.append(e)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for i, update in enumerate(updates):
+            if args.rate:
+                delay = started + i / args.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            executor.submit(post, update)
+    replay_time = time.perf_counter() - started
+    if api is not None:
+        time.sleep(args.wait)
+
+    report = {
+        "updates": len(updates),
+        "failed_posts": len(failures),
+        "replay_seconds": replay_time,
+        "updates_per_second": len(updates) / replay_time if replay_time else 0.0,
+        "post_p50": percentile(post_latencies, 0.5),
+        "post_p99": percentile(post_latencies, 0.99),
+    }
+    if api is not None:
+        report.update({
+            "replies": len(api.latencies),
+            "sent_messages": api.sent_messages,
+            "end_to_end_p50": percentile(api.latencies, 0.5),
+            "end_to_end_p99": percentile(api.latencies, 0.99),
+        })
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
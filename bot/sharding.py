@@ -0,0 +1,134 @@
+"""
+Sharded mode: a front process receives the updates (long polling or webhook) and
+routes each one by chat id to one of several worker processes over multiprocessing
+queues. Every worker runs a full TelegramQuizBot that owns the quizzes, history and
+preferences of its chats. A worker that modifies the word list flushes it and tells
+all other workers to reload it. Workers share the words through the sqlite backend,
+the other backends rewrite words.json from memory and would overwrite each other.
+
+Everything runs on one machine, with TELEGRAM_BASE_URL pointing at the fake Bot API
+of replay_updates.py the whole setup can be exercised offline.
+"""
+import asyncio
+import logging
+import multiprocessing
+import signal
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, ContextTypes, TypeHandler, Application
+
+import constants
+from message_sender import MessageSender
+
+# Messages sent to the workers
+UPDATE = "update"
+RELOAD_WORDS = "reload_words"
+STOP = "stop"
+
+
+def shard_of(chat_id, workers):
+    return chat_id % workers
+
+
+def _run_worker(create_bot, shard, queues, base_url):
+    # Ctrl+C is handled by the front process, which stops the workers in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.info(f"Worker {shard} started")
+    asyncio.run(_serve_shard(create_bot, shard, queues, base_url))
+
+
+async def _serve_shard(create_bot, shard, queues, base_url):
+    workers = len(queues)
+
+    def broadcast_words_changed():
+        for other, queue in enumerate(queues):
+            if other != shard:
+                queue.put((RELOAD_WORDS, None))
+
+    # The global send limit is shared by all workers
+    rate, burst = constants.SEND_GLOBAL_LIMIT
+    bot = create_bot(shard=shard, workers=workers,
+                     message_sender=MessageSender(global_limit=(rate / workers, max(burst / workers, 1))),
+                     on_words_changed=broadcast_words_changed,
+                     chat_filter=lambda chat_id: shard_of(chat_id, workers) == shard)
+    application = bot.build_application(base_url)
+
+    loop = asyncio.get_running_loop()
+    queue = queues[shard]
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+        try:
+            while True:
+                kind, payload = await loop.run_in_executor(None, queue.get)
+                if kind == UPDATE:
+                    await application.update_queue.put(Update.de_json(payload, application.bot))
+                elif kind == RELOAD_WORDS:
+                    await bot.reload_words()
+                elif kind == STOP:
+                    break
+        finally:
+            await application.stop()
+            await bot.post_shutdown(application)
+    logging.info(f"Worker {shard} stopped")
+
+
+class ShardRouter:
+    """
+    Front process of the sharded mode, it only parses updates and forwards them.
+    Updates are routed in arrival order, so each worker sees its chats' updates in order.
+    """
+    def __init__(self, telegram_token, create_bot, workers, base_url=None):
+        """
+        create_bot(shard, workers, **bot_kwargs) builds the TelegramQuizBot of a worker inside its process
+        """
+        self.telegram_token = telegram_token
+        self.base_url = base_url
+        self.queues = [multiprocessing.Queue() for _ in range(workers)]
+        self.processes = [
+            multiprocessing.Process(target=_run_worker, args=(create_bot, shard, self.queues, base_url),
+                                    name=f"quiz-worker-{shard}", daemon=True)
+            for shard in range(workers)
+        ]
+        self.routed = [0] * workers
+
+    async def route(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        chat = update.effective_chat
+        # Updates without a chat (e.g. inline queries) all go to the first worker
+        shard = shard_of(chat.id, len(self.queues)) if chat is not None else 0
+        self.routed[shard] += 1
+        self.queues[shard].put((UPDATE, update.to_dict()))
+
+    async def post_shutdown(self, application: Application):
+        for queue in self.queues:
+            queue.put((STOP, None))
+        for process in self.processes:
+            process.join(timeout=constants.SHARD_STOP_TIMEOUT)
+            if process.is_alive():
+                logging.warning(f"{process.name} did not stop in time, terminating it")
+                process.terminate()
+        logging.info(f"Routed updates per worker: {self.routed}")
+
+    def run(self, webhook_url=None, listen="0.0.0.0", port=8443, url_path="", secret_token=None):
+        """
+        Start the workers and receive updates until the user presses Ctrl+C, see TelegramQuizBot.run
+        """
+        for process in self.processes:
+            process.start()
+
+        builder = ApplicationBuilder() \
+            .token(self.telegram_token) \
+            .post_shutdown(self.post_shutdown)
+        if self.base_url:
+            builder = builder.base_url(self.base_url)
+        application = builder.build()
+        application.add_handler(TypeHandler(Update, self.route))
+
+        if webhook_url:
+            application.run_webhook(listen=listen,
+                                    port=port,
+                                    url_path=url_path,
+                                    webhook_url=webhook_url.rstrip("/") + "/" + url_path,
+                                    secret_token=secret_token)
+        else:
+            application.run_polling()
@@ -0,0 +1,319 @@
+"""
+Spaced repetition of quiz words, SM-2 style. Run it directly for a simulation benchmark:
+
+    python bot/spaced_repetition.py --users 10000 --words 5000 --days 7
+"""
+import argparse
+import array
+import heapq
+import json
+import random
+import struct
+import time
+from collections import OrderedDict
+
+import constants
+
+# SM-2 quality of an answer, correct answers are graded by grade()
+QUALITY_IDK = 0
+QUALITY_WRONG = 1
+
+_NEVER = 0xFFFFFFFF  # due time of words that are no longer in their group
+_VERSION = 1
+_HEADER = struct.Struct("<BI")  # format version, number of words
+
+
+def grade(attempts, hint_count):
+    """
+    SM-2 quality of a correct answer: 5 at the first try without hints, down to 3
+    """
+    return max(5 - attempts - hint_count, 3)
+
+
+class Deck:
+    """
+    Review state of the words one learner was asked in one group. Each field is an array
+    indexed by word (11 bytes per word) and a heap of due << 32 | word entries finds the
+    next due word in O(log n), never looking at the words that are not due.
+    The number of correct answers in a row doubles as the Leitner box of a word.
+    """
+    __slots__ = ('keys', '_items', 'due', 'interval', 'ease', 'reps', '_heap')
+
+    def __init__(self):
+        self.keys = []  # preprocessed words by index
+        self._items = {}  # preprocessed word -> index
+        self.due = array.array('I')  # unix time of the next review
+        self.interval = array.array('I')  # seconds between the last two reviews
+        self.ease = array.array('H')  # ease factor in thousandths
+        self.reps = array.array('B')  # correct answers in a row
+        self._heap = []  # stale entries (whose due changed since) are dropped when they reach the top
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def _add(self, key):
+        item = len(self.keys)
+        self.keys.append(key)
+        self._items[key] = item
+        self.due.append(0)
+        self.interval.append(0)
+        self.ease.append(round(constants.SRS_INITIAL_EASE * 1000))
+        self.reps.append(0)
+        return item
+
+    def _push(self, item):
+        if len(self._heap) > 2 * len(self.keys) + 16:
+            # Mostly stale entries, rebuild instead of letting the heap grow
+            self._heap = [self.due[i] << 32 | i for i in range(len(self.keys)) if self.due[i] != _NEVER]
+            heapq.heapify(self._heap)
+        else:
+            heapq.heappush(self._heap, self.due[item] << 32 | item)
+
+    def _top(self):
+        heap = self._heap
+        while heap:
+            item = heap[0] & 0xFFFFFFFF
+            if heap[0] >> 32 == self.due[item]:
+                return item
+            heapq.heappop(heap)
+        return None
+
+    def next_due(self):
+        """
+        (due, key) of the word due first, even if it is not due yet, or None
+        """
+        item = self._top()
+        return (self.due[item], self.keys[item]) if item is not None else None
+
+    def due_key(self, now):
+        """
+        The word that has been due the longest at now, or None
+        """
+        item = self._top()
+        if item is None or self.due[item] > now:
+            return None
+        return self.keys[item]
+
+    def earliest_key(self):
+        """
+        The word due first, even if it is not due yet, or None
+        """
+        item = self._top()
+        return self.keys[item] if item is not None else None
+
+    def postpone(self, key, until):
+        item = self._items[key]
+        self.due[item] = int(until)
+        self._push(item)
+
+    def retire(self, key):
+        """
+        Never ask key again, e.g. after it was removed from its group
+        """
+        self.due[self._items[key]] = _NEVER
+
+    def review(self, key, quality, now):
+        """
+        Schedule the next review of key after an answer graded quality at now
+        """
+        item = self._items.get(key)
+        if item is None:
+            item = self._add(key)
+        if quality < 3:
+            # Start over, the ease factor is kept
+            self.reps[item] = 0
+            interval = constants.SRS_RETRY_DELAY
+        else:
+            reps = self.reps[item]
+            if reps < len(constants.SRS_FIRST_INTERVALS):
+                interval = constants.SRS_FIRST_INTERVALS[reps]
+            else:
+                interval = self.interval[item] * self.ease[item] / 1000
+            self.reps[item] = min(reps + 1, 255)
+            ease = self.ease[item] / 1000 + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+            self.ease[item] = round(max(ease, constants.SRS_MIN_EASE) * 1000)
+        self.interval[item] = min(int(interval), constants.SRS_MAX_INTERVAL)
+        self.due[item] = int(now) + self.interval[item]
+        self._push(item)
+
+    def to_bytes(self):
+        return b"".join((_HEADER.pack(_VERSION, len(self.keys)), self.due.tobytes(), self.interval.tobytes(),
+                         self.ease.tobytes(), self.reps.tobytes(), "\0".join(self.keys).encode("utf-8")))
+
+    @classmethod
+    def from_bytes(cls, data):
+        deck = cls()
+        version, count = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported deck format {version}")
+        position = _HEADER.size
+        for column in (deck.due, deck.interval, deck.ease, deck.reps):
+            end = position + count * column.itemsize
+            column.frombytes(data[position:end])
+            position = end
+        if count:
+            deck.keys = data[position:].decode("utf-8").split("\0")
+        deck._items = {key: item for item, key in enumerate(deck.keys)}
+        deck._heap = [due << 32 | item for item, due in enumerate(deck.due) if due != _NEVER]
+        heapq.heapify(deck._heap)
+        return deck
+
+
+class Reviews:
+    """
+    Decks of every (chat, user, group), loaded from the state store on first use and saved
+    back with its other buffered changes. A chat is quizzed from the union of the decks of
+    its members who were quizzed on the group, in private chats that is the chat itself.
+    The most recently used decks and member lists stay resident, the others are reloaded.
+    """
+    def __init__(self, state_store, cache_size=constants.SRS_DECK_CACHE_SIZE):
+        self.state_store = state_store
+        self.cache_size = cache_size
+        self._decks = OrderedDict()  # (chat_id, user_id, group) -> Deck
+        self._learners = OrderedDict()  # (chat_id, group) -> set of user ids with a deck
+
+    def __len__(self):
+        return len(self._decks)
+
+    @staticmethod
+    def _evict(cache, size):
+        while len(cache) > size:
+            cache.popitem(last=False)
+
+    def deck(self, chat_id, user_id, group):
+        key = (chat_id, user_id, group)
+        deck = self._decks.get(key)
+        if deck is None:
+            data = self.state_store.load_deck(chat_id, user_id, group)
+            deck = self._decks[key] = Deck.from_bytes(data) if data else Deck()
+            self._evict(self._decks, self.cache_size)
+        else:
+            self._decks.move_to_end(key)
+        return deck
+
+    def learners(self, chat_id, group):
+        """
+        The users of chat_id who have a deck of group
+        """
+        key = (chat_id, group)
+        learners = self._learners.get(key)
+        if learners is None:
+            learners = self._learners[key] = set(self.state_store.load_learners(chat_id, group))
+            self._evict(self._learners, self.cache_size)
+        else:
+            self._learners.move_to_end(key)
+        return learners
+
+    def decks(self, chat_id, group):
+        """
+        (user_id, Deck) of every learner of group in chat_id
+        """
+        return [(user_id, self.deck(chat_id, user_id, group)) for user_id in sorted(self.learners(chat_id, group))]
+
+    def next_due(self, chat_id, group):
+        """
+        (due, user_id, key) of the word due first among the chat's decks, even if it is not due yet, or None
+        """
+        first = None
+        for user_id, deck in self.decks(chat_id, group):
+            due = deck.next_due()
+            if due is not None and (first is None or due[0] < first[0]):
+                first = (due[0], user_id, due[1])
+        return first
+
+    def seen(self, chat_id, group, key):
+        """
+        Whether a learner of the chat was asked key before
+        """
+        return any(key in deck for _, deck in self.decks(chat_id, group))
+
+    def postpone(self, chat_id, user_id, group, key, until):
+        deck = self.deck(chat_id, user_id, group)
+        deck.postpone(key, until)
+        self.state_store.save_deck(chat_id, user_id, group, deck)
+
+    def retire(self, chat_id, user_id, group, key):
+        deck = self.deck(chat_id, user_id, group)
+        deck.retire(key)
+        self.state_store.save_deck(chat_id, user_id, group, deck)
+
+    def review(self, chat_id, user_id, group, key, quality, now=None):
+        deck = self.deck(chat_id, user_id, group)
+        deck.review(key, quality, now if now is not None else time.time())
+        self.learners(chat_id, group).add(user_id)
+        self.state_store.save_deck(chat_id, user_id, group, deck)
+
+
+def _pick(deck, now, rng, words):
+    # Same order as TelegramQuizBot._pick_question: due words, unseen words, then the word due first
+    key = deck.due_key(now)
+    if key is not None:
+        return key, True
+    for _ in range(constants.SRS_NEW_WORD_ATTEMPTS):
+        key = f"w{rng.randrange(words)}"
+        if key not in deck:
+            return key, False
+    return deck.earliest_key(), True
+
+
+def simulate(users, words, days, questions_per_day, correct_ratio, seed=0):
+    """
+    Quiz users on a group of words for days, each answering questions_per_day questions spread
+    over the day, correctly with probability correct_ratio. Returns timings and deck sizes.
+    """
+    rng = random.Random(seed)
+    start = int(time.time())
+    decks = []
+    reviews = 0
+    scheduling = 0.0
+    for _ in range(users):
+        deck = Deck()
+        for question in range(days * questions_per_day):
+            now = start + question * 24 * 60 * 60 // questions_per_day
+            started = time.perf_counter()
+            key, review = _pick(deck, now, rng, words)
+            quality = grade(0, 0) if rng.random() < correct_ratio else QUALITY_WRONG
+            deck.review(key, quality, now)
+            scheduling += time.perf_counter() - started
+            reviews += review
+        decks.append(deck)
+
+    started = time.perf_counter()
+    saved = [deck.to_bytes() for deck in decks]
+    serialize = time.perf_counter() - started
+    started = time.perf_counter()
+    for data in saved:
+        Deck.from_bytes(data)
+    deserialize = time.perf_counter() - started
+    questions = users * days * questions_per_day
+    deck_words = sum(len(deck) for deck in decks)
+    return {
+        "questions": questions,
+        "review_share": reviews / questions,
+        "us_per_question": scheduling / questions * 1e6,
+        "words_per_deck": deck_words / users,
+        "bytes_per_word": sum(map(len, saved)) / deck_words,
+        "serialize_us_per_deck": serialize / users * 1e6,
+        "deserialize_us_per_deck": deserialize / users * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spaced repetition simulation benchmark")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--words", type=int, default=5000, help="words in the group every user is quizzed on")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--questions-per-day", type=int, default=30)
+    parser.add_argument("--correct-ratio", type=float, default=0.7)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    result = simulate(args.users, args.words, args.days, args.questions_per_day, args.correct_ratio)
+    result["seconds"] = time.perf_counter() - started
+    print(json.dumps(result, indent=4))
+
+
+if __name__ == '__main__':
+    main()
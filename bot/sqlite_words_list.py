@@ -0,0 +1,457 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import constants
+from metrics import metrics
+from duplicate_index import DuplicateIndex
+from utils import preprocess_string
+from words_list import read_changed_word_sets, log_rejected, QuizQuestion, Word, DescriptionTable, AddResult, WordsList
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS groups (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    name_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS groups_name_key ON groups (name_key);
+
+CREATE TABLE IF NOT EXISTS group_descriptions (
+    group_id INTEGER NOT NULL REFERENCES groups (id) ON DELETE CASCADE,
+    locale TEXT NOT NULL,
+    description TEXT NOT NULL,
+    PRIMARY KEY (group_id, locale)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS words (
+    id INTEGER PRIMARY KEY,
+    group_id INTEGER NOT NULL REFERENCES groups (id) ON DELETE CASCADE,
+    word TEXT NOT NULL,
+    word_key TEXT NOT NULL,
+    quiz_type TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS words_group ON words (group_id, id);
+CREATE INDEX IF NOT EXISTS words_key ON words (word_key, group_id);
+
+CREATE TABLE IF NOT EXISTS word_descriptions (
+    word_id INTEGER NOT NULL REFERENCES words (id) ON DELETE CASCADE,
+    locale TEXT NOT NULL,
+    description TEXT NOT NULL,
+    PRIMARY KEY (word_id, locale)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS imported_sets (
+    file TEXT PRIMARY KEY,
+    record TEXT NOT NULL
+);
+"""
+
+
+class SQLiteWordsList:
+    """
+    WordsList compatible store backed by sqlite3, every lookup is an indexed query.
+    Lookups run on the event loop, writes on a single writer thread through a connection
+    of its own so that a large batch does not block the other chats while it commits.
+    """
+    def __init__(self, db_path: str, filepath: str, file_sets_path: str, duplicate_similarity=constants.DUPLICATE_SIMILARITY):
+        """
+        Open (or create) the database, import filepath once and the word sets from file_sets_path
+        that changed since the last start. New words at least duplicate_similarity percent similar
+        to a word of their group are rejected.
+        """
+        self.db_path = db_path
+        self.file_sets_path = file_sets_path
+        self.duplicate_similarity = duplicate_similarity
+        self._connection = sqlite3.connect(db_path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        # group id -> (number of words, min id, max id), used to pick random words
+        self._word_stats = {}
+        # Changes when another connection (the writer thread, words_cli, a sharded worker) commits,
+        # the statistics above are dropped then
+        self._data_version = None
+
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="words-writer")
+        # Opened and used by the writer thread only, like the duplicate indexes and their data version
+        self._write_connection = None
+        # group id -> DuplicateIndex of its word keys, built on the first addition to the group
+        self._duplicate_indexes = {}
+        self._write_data_version = None
+
+        self._writer.submit(self._import, filepath).result()
+
+    def _writing(self):
+        """
+        The connection of the writer thread, opened on first use. The duplicate indexes are dropped
+        if another connection committed since the last write.
+        """
+        if self._write_connection is None:
+            self._write_connection = sqlite3.connect(self.db_path)
+            self._write_connection.execute("PRAGMA synchronous=NORMAL")
+            self._write_connection.execute("PRAGMA foreign_keys=ON")
+        data_version = self._write_connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._write_data_version:
+            self._write_data_version = data_version
+            self._duplicate_indexes.clear()
+        return self._write_connection
+
+    def _write(self, function, *args):
+        """
+        Run function in a transaction on the writer thread, the duplicate indexes are rebuilt
+        from the database on demand if it fails
+        """
+        connection = self._writing()
+        try:
+            with connection:
+                return function(connection, *args)
+        except BaseException:
+            self._duplicate_indexes.clear()
+            raise
+
+    def _close_writer(self):
+        if self._write_connection is not None:
+            self._write_connection.close()
+            self._write_connection = None
+
+    def _import(self, filepath):
+        """
+        Import filepath into an empty database and the changed word sets, runs on the writer thread
+        """
+        def import_all(connection):
+            if not self._has_groups(connection) and os.path.exists(filepath):
+                with open(filepath, 'r', encoding='utf-8') as file:
+                    imported = self._import_groups(connection, json.load(file))
+                logging.info(f"Imported {imported} words from {filepath} into {self.db_path}")
+            imported = self._import_word_sets(connection)
+            if imported.added:
+                logging.info(f"Imported {len(imported.added)} new words from word sets into {self.db_path}")
+        self._write(import_all)
+
+    @staticmethod
+    def _has_groups(connection):
+        return connection.execute("SELECT 1 FROM groups LIMIT 1").fetchone() is not None
+
+    def _import_word_sets(self, connection):
+        imported_sets = {file: json.loads(record) for file, record
+                         in connection.execute("SELECT file, record FROM imported_sets")}
+        imported = AddResult.empty()
+        for file, record, word_set in read_changed_word_sets(self.file_sets_path, imported_sets,
+                                                             lambda group: self._group_id(group, connection) is not None):
+            for language, data in (word_set or {}).items():
+                group_id = self._ensure_group(connection, language)
+                if data.get("description") and not self._group_descriptions(group_id, connection):
+                    self._set_group_descriptions(connection, group_id, data["description"])
+                for word in data["words"]:
+                    self._add_new_word(connection, group_id, word, imported)
+            connection.execute("INSERT OR REPLACE INTO imported_sets (file, record) VALUES (?, ?)",
+                               (file, json.dumps(record)))
+        log_rejected(imported.rejected)
+        return imported
+
+    def _import_groups(self, connection, words):
+        imported = 0
+        for language, data in words.items():
+            group_id = self._ensure_group(connection, language)
+            if data.get("description") and not self._group_descriptions(group_id, connection):
+                self._set_group_descriptions(connection, group_id, data["description"])
+            for word in data["words"]:
+                imported += self._insert_word(connection, group_id, word, deduplicate=True)
+        return imported
+
+    def _group_id(self, language, connection=None):
+        row = (connection or self._connection).execute("SELECT id FROM groups WHERE name_key = ? ORDER BY id LIMIT 1",
+                                                       (preprocess_string(language),)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _ensure_group(connection, language):
+        row = connection.execute("SELECT id FROM groups WHERE name = ?", (language,)).fetchone()
+        if row:
+            return row[0]
+        return connection.execute("INSERT INTO groups (name, name_key) VALUES (?, ?)",
+                                  (language, preprocess_string(language))).lastrowid
+
+    def _group_descriptions(self, group_id, connection=None):
+        return dict((connection or self._connection).execute(
+            "SELECT locale, description FROM group_descriptions WHERE group_id = ?", (group_id,)))
+
+    @staticmethod
+    def _set_group_descriptions(connection, group_id, descriptions):
+        connection.execute("DELETE FROM group_descriptions WHERE group_id = ?", (group_id,))
+        connection.executemany(
+            "INSERT INTO group_descriptions (group_id, locale, description) VALUES (?, ?, ?)",
+            [(group_id, locale, description) for locale, description in descriptions.items()])
+
+    def _insert_word(self, connection, group_id, word, deduplicate=False):
+        word_key = preprocess_string(word["word"])
+        if deduplicate and connection.execute("SELECT 1 FROM words WHERE word_key = ? AND group_id = ?",
+                                              (word_key, group_id)).fetchone():
+            return False
+        word_id = connection.execute(
+            "INSERT INTO words (group_id, word, word_key, quiz_type) VALUES (?, ?, ?, ?)",
+            (group_id, word["word"], word_key, word.get("quiz_type", constants.DEFAULT_QUIZ_TYPE))).lastrowid
+        connection.executemany(
+            "INSERT INTO word_descriptions (word_id, locale, description) VALUES (?, ?, ?)",
+            [(word_id, locale, description) for locale, description in word.get("descriptions", {}).items()])
+        duplicates = self._duplicate_indexes.get(group_id)
+        if duplicates is not None:
+            duplicates.add(word_key)
+        return True
+
+    def _duplicates(self, connection, group_id):
+        duplicates = self._duplicate_indexes.get(group_id)
+        if duplicates is None:
+            duplicates = self._duplicate_indexes[group_id] = DuplicateIndex(
+                (word_key for word_key, in connection.execute("SELECT word_key FROM words WHERE group_id = ?",
+                                                             (group_id,))),
+                self.duplicate_similarity)
+        return duplicates
+
+    def _add_new_word(self, connection, group_id, word, result):
+        """
+        Insert a word unless its group has it or a near duplicate of it, recording the outcome in the AddResult result
+        """
+        word_key = preprocess_string(word["word"])
+        match = self._duplicates(connection, group_id).find(word_key)
+        if match is None:
+            self._insert_word(connection, group_id, word)
+            result.added.append(word["word"])
+            return
+        existing_key, similarity = match
+        row = connection.execute(
+            "SELECT id, word FROM words WHERE word_key = ? AND group_id = ? ORDER BY id LIMIT 1",
+            (existing_key, group_id)).fetchone()
+        if row is None:
+            # The index is out of sync with the database (e.g. another process removed the word), rebuild it
+            del self._duplicate_indexes[group_id]
+            return self._add_new_word(connection, group_id, word, result)
+        word_id, existing = row
+        if existing_key != word_key:
+            result.rejected.append((word["word"], existing, similarity))
+        else:
+            # Locales the existing word already describes are kept
+            connection.executemany(
+                "INSERT OR IGNORE INTO word_descriptions (word_id, locale, description) VALUES (?, ?, ?)",
+                [(word_id, locale, description) for locale, description in word.get("descriptions", {}).items()
+                 if description])
+            result.merged.append(existing)
+
+    def _load_words(self, where, params):
+        """
+        Build Words for the rows of words matching where, in insertion order, sharing one description table
+        """
+        rows = {}
+        for word_id, word, word_key, quiz_type in self._connection.execute(
+                f"SELECT id, word, word_key, quiz_type FROM words WHERE {where} ORDER BY id", params):
+            rows[word_id] = (word, word_key, quiz_type, {})
+        for word_id, locale, description in self._connection.execute(
+                f"SELECT d.word_id, d.locale, d.description FROM word_descriptions d "
+                f"JOIN words ON words.id = d.word_id WHERE {where}", params):
+            rows[word_id][3][locale] = description
+        table = DescriptionTable()
+        return [Word(word, quiz_type, descriptions, table, word_key) for word, word_key, quiz_type, descriptions in rows.values()]
+
+    async def _run_write(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._writer, self._write, function, *args)
+
+    async def flush(self):
+        """
+        Writes are committed as they are made, this waits for the ones still running
+        """
+        await asyncio.get_running_loop().run_in_executor(self._writer, lambda: None)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._writer, self._close_writer)
+        self._writer.shutdown()
+        self._connection.close()
+
+    async def reload(self):
+        """
+        Drop cached statistics after another process modified the database
+        """
+        self._word_stats.clear()
+        await asyncio.get_running_loop().run_in_executor(self._writer, self._duplicate_indexes.clear)
+
+    def _refresh(self):
+        """
+        Drop the cached statistics if another connection committed since the last call
+        """
+        data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self._word_stats.clear()
+
+    def word_counts(self):
+        """
+        Number of words per group
+        """
+        return dict(self._connection.execute(
+            "SELECT groups.name, count(words.id) FROM groups LEFT JOIN words ON words.group_id = groups.id "
+            "GROUP BY groups.id"))
+
+    async def add_word(self, json_word_data):
+        """
+        Add one word entry or a list of them, returns an AddResult
+        """
+        words_data = json.loads(json_word_data)
+        if isinstance(words_data, dict):
+            words_data = [words_data]
+        elif not isinstance(words_data, list):
+            raise ValueError("Invalid input format")
+        return await self.add_words(words_data)
+
+    @metrics.timed("words_io", operation="add")
+    async def add_words(self, words_data):
+        """
+        Add word entry dicts in one transaction, returns an AddResult
+        """
+        # Validate every entry before the transaction
+        new_words = [WordsList._make_word(word_data) for word_data in words_data]
+        return await self._run_write(self._add_words, new_words)
+
+    def _add_words(self, connection, new_words):
+        result = AddResult.empty()
+        for language, new_word in new_words:
+            self._add_new_word(connection, self._ensure_group(connection, language), new_word, result)
+        return result
+
+    @metrics.timed("words_io", operation="remove")
+    async def remove_word(self, word_text):
+        return await self._run_write(self._remove_word, preprocess_string(word_text))
+
+    def _remove_word(self, connection, word_key):
+        rows = connection.execute("SELECT DISTINCT group_id FROM words WHERE word_key = ?", (word_key,)).fetchall()
+        if rows:
+            connection.execute("DELETE FROM words WHERE word_key = ?", (word_key,))
+        for group_id, in rows:
+            if group_id in self._duplicate_indexes:
+                self._duplicate_indexes[group_id].discard(word_key)
+        return bool(rows)
+
+    async def get_word_by_text(self, word_text):
+        row = self._connection.execute("SELECT id FROM words WHERE word_key = ? ORDER BY id LIMIT 1",
+                                       (preprocess_string(word_text),)).fetchone()
+        if row is None:
+            return None
+        return self._load_words("words.id = ?", row)[0]
+
+    async def get_words_by_text(self, word_text=None):
+        excluded_key = preprocess_string(word_text) if word_text is not None else None
+        words = {}
+        for group_id, language in self._connection.execute("SELECT id, name FROM groups ORDER BY id").fetchall():
+            words[language] = {
+                "description": self._group_descriptions(group_id),
+                "words": self._load_words("words.group_id = ? AND words.word_key IS NOT ?", (group_id, excluded_key))
+            }
+        return words
+
+    @metrics.timed("words_io", operation="list")
+    async def get_words_by_language(self, language=None):
+        if language is None:
+            return self._load_words("1", ())
+        group_id = self._group_id(language)
+        if group_id is None:
+            return []
+        return self._load_words("words.group_id = ?", (group_id,))
+
+    async def iter_words(self, language):
+        """
+        Yield the words of a group one by one, read EXPORT_BATCH_SIZE at a time
+        """
+        group_id = self._group_id(language)
+        if group_id is None:
+            return
+        last_id = 0
+        while True:
+            upper_id = self._connection.execute(
+                "SELECT max(id) FROM (SELECT id FROM words WHERE group_id = ? AND id > ? ORDER BY id LIMIT ?)",
+                (group_id, last_id, constants.EXPORT_BATCH_SIZE)).fetchone()[0]
+            if upper_id is None:
+                return
+            for word in self._load_words("words.group_id = ? AND words.id > ? AND words.id <= ?",
+                                         (group_id, last_id, upper_id)):
+                yield word
+            last_id = upper_id
+
+    @metrics.timed("words_io", operation="random_word")
+    async def get_random_word(self, language):
+        group_id = self._group_id(language)
+        if group_id is None:
+            return None
+        self._refresh()
+        stats = self._word_stats.get(group_id)
+        if stats is None:
+            stats = self._word_stats[group_id] = self._connection.execute(
+                "SELECT count(*), min(id), max(id) FROM words WHERE group_id = ?", (group_id,)).fetchone()
+        count, min_id, max_id = stats
+        if not count:
+            return None
+
+        # Rejection sampling over the id range is uniform and O(log n) per try,
+        # fall back to an index walk when the group's ids are too sparse
+        for _ in range(constants.SQLITE_RANDOM_WORD_ATTEMPTS):
+            word_id = random.randint(min_id, max_id)
+            if self._connection.execute("SELECT 1 FROM words WHERE id = ? AND group_id = ?",
+                                        (word_id, group_id)).fetchone():
+                return self._load_words("words.id = ?", (word_id,))[0]
+        row = self._connection.execute("SELECT id FROM words WHERE group_id = ? ORDER BY id LIMIT 1 OFFSET ?",
+                                       (group_id, random.randrange(count))).fetchone()
+        if row is None:
+            return None
+        return self._load_words("words.id = ?", row)[0]
+
+    async def get_random_question(self, language, bot_language):
+        """
+        Return a random QuizQuestion of a group localized for bot_language, or None if the group is empty
+        """
+        word_data = await self.get_random_word(language)
+        if word_data is None:
+            return None
+        return QuizQuestion.from_word(word_data, bot_language)
+
+    @metrics.timed("words_io", operation="question_by_key")
+    async def get_question_by_key(self, language, word_key, bot_language):
+        """
+        Return the QuizQuestion of the word with the preprocessed text word_key in a group, or None
+        """
+        group_id = self._group_id(language)
+        words = self._load_words("words.id = (SELECT min(id) FROM words WHERE word_key = ? AND group_id = ?)",
+                                 (word_key, group_id))
+        return QuizQuestion.from_word(words[0], bot_language) if words else None
+
+    async def get_languages(self):
+        return [name for name, in self._connection.execute("SELECT name FROM groups ORDER BY id")]
+
+    async def get_group_description(self, language, bot_language=None):
+        """
+        Return the description dict of a group, or the resolved description
+        for bot_language if one is given
+        """
+        group_id = self._group_id(language)
+        if group_id is None:
+            return None
+        if bot_language is None:
+            return self._group_descriptions(group_id)
+        # Preferred locale first, then the default bot language, then any description
+        row = self._connection.execute(
+            "SELECT description FROM group_descriptions WHERE group_id = ? AND description != '' "
+            "ORDER BY locale = ? DESC, locale = ? DESC LIMIT 1",
+            (group_id, bot_language, constants.DEFAULT_BOT_LANGUAGE)).fetchone()
+        return row[0] if row else None
+
+    @metrics.timed("words_io", operation="update_description")
+    async def update_description(self, json_word_data):
+        word_data = json.loads(json_word_data)
+        return await self._run_write(self._update_description, word_data["language"], word_data["descriptions"])
+
+    def _update_description(self, connection, language, descriptions):
+        group_id = self._group_id(language, connection)
+        if group_id is None:
+            return False
+        self._set_group_descriptions(connection, group_id, descriptions)
+        return True
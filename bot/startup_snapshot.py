@@ -0,0 +1,208 @@
+"""
+Startup snapshot: the resident word corpus (with its preprocessed keys and indexes) and the
+compiled translations catalog pickled into one file, so the bot starts without parsing
+words.json, the word sets and translations.json. Build it ahead of time, e.g. in the Dockerfile:
+
+    python bot/startup_snapshot.py
+
+The snapshot records the size, mtime and hash of every source file. At startup a snapshot
+whose sources changed (or that was written by other code) is ignored and rebuilt after the
+sources were loaded. Compare the startup times with:
+
+    python bot/startup_snapshot.py --measure 20
+"""
+import argparse
+import gc
+import hashlib
+import json
+import logging
+import os
+import pickle
+import statistics
+import sys
+import tempfile
+import time
+from typing import NamedTuple
+
+import constants
+from translation_catalog import TranslationCatalog
+from words_list import WordsList
+
+_VERSION = 1
+# Modules defining the pickled classes or computing the pickled keys, a change to them invalidates the snapshot
+_CODE_MODULES = ("constants.py", "utils.py", "words_list.py", "duplicate_index.py", "translation_catalog.py")
+
+
+class Snapshot(NamedTuple):
+    words: WordsList
+    catalog: TranslationCatalog
+
+
+def source_files(words_path, word_sets_path, translations_path):
+    word_sets = sorted(os.path.join(word_sets_path, file) for file in os.listdir(word_sets_path)
+                       if file.endswith(".json"))
+    return [words_path, translations_path] + word_sets
+
+
+def _sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _code_digest():
+    digest = hashlib.sha256(sys.implementation.cache_tag.encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in _CODE_MODULES:
+        with open(os.path.join(directory, module), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def fingerprint(paths):
+    """
+    {path: [size, mtime_ns, sha256]} of the source files
+    """
+    result = {}
+    for path in paths:
+        stat = os.stat(path)
+        result[path] = [stat.st_size, stat.st_mtime_ns, _sha256(path)]
+    return result
+
+
+def _stale_source(recorded, paths):
+    """
+    The first source that differs from its record, None if all match.
+    Like word sets, files are only hashed when their size or mtime changed.
+    """
+    if sorted(recorded) != sorted(paths):
+        return "the set of source files"
+    for path in paths:
+        size, mtime_ns, digest = recorded[path]
+        stat = os.stat(path)
+        if stat.st_size != size:
+            return path
+        if stat.st_mtime_ns != mtime_ns and _sha256(path) != digest:
+            return path
+    return None
+
+
+def load(snapshot_path, paths):
+    """
+    The Snapshot in snapshot_path, or None if it is missing or out of date
+    """
+    try:
+        with open(snapshot_path, 'rb') as f:
+            header = pickle.load(f)
+            if header.get("version") != _VERSION or header.get("code") != _code_digest():
+                logging.info(f"Ignoring {snapshot_path}, it was built by another version of the bot")
+                return None
+            stale = _stale_source(header["sources"], paths)
+            if stale is not None:
+                logging.info(f"Ignoring {snapshot_path}, {stale} changed since it was built")
+                return None
+            # Unpickling allocates an object per word, the cyclic GC would scan them over and over
+            gc.disable()
+            try:
+                return Snapshot(*pickle.load(f))
+            finally:
+                gc.enable()
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logging.exception(f"Failed to load {snapshot_path}")
+        return None
+
+
+def save(snapshot_path, paths, snapshot):
+    """
+    Write the header and the snapshot to a temp file next to snapshot_path and atomically rename it over
+    """
+    header = {"version": _VERSION, "code": _code_digest(), "sources": fingerprint(paths)}
+    directory = os.path.dirname(os.path.abspath(snapshot_path))
+    with tempfile.NamedTemporaryFile('wb', dir=directory, suffix='.tmp', delete=False) as f:
+        try:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # As a plain tuple, Snapshot is __main__.Snapshot when this module is run directly
+            pickle.dump(tuple(snapshot), f, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, snapshot_path)
+
+
+def build(words_path, word_sets_path, translations_path, duplicate_similarity=constants.DUPLICATE_SIMILARITY):
+    """
+    Load the Snapshot from its sources, importing changed word sets into words_path like the bot does
+    """
+    words = WordsList(filepath=words_path, file_sets_path=word_sets_path, duplicate_similarity=duplicate_similarity)
+    with open(translations_path, 'r', encoding='utf-8') as f:
+        catalog = TranslationCatalog(json.load(f))
+    return Snapshot(words, catalog)
+
+
+def load_or_build(snapshot_path, words_path, word_sets_path, translations_path,
+                  duplicate_similarity=constants.DUPLICATE_SIMILARITY):
+    """
+    The Snapshot in snapshot_path if it is up to date, otherwise built from the sources and saved
+    """
+    paths = source_files(words_path, word_sets_path, translations_path)
+    snapshot = load(snapshot_path, paths)
+    if snapshot is not None:
+        snapshot.words.duplicate_similarity = duplicate_similarity
+        return snapshot
+    snapshot = build(words_path, word_sets_path, translations_path, duplicate_similarity)
+    # Fingerprinted after building, which may have rewritten words.json
+    try:
+        save(snapshot_path, source_files(words_path, word_sets_path, translations_path), snapshot)
+    except OSError:
+        logging.exception(f"Failed to save {snapshot_path}")
+    return snapshot
+
+
+def _measure(args, runs):
+    """
+    Median seconds to load from the sources and from the snapshot, and the snapshot size
+    """
+    paths = source_files(args.words, args.word_sets, args.translations)
+    from_sources = []
+    from_snapshot = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        build(args.words, args.word_sets, args.translations)
+        from_sources.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        if load(args.output, paths) is None:
+            raise SystemExit(f"{args.output} is out of date")
+        from_snapshot.append(time.perf_counter() - started)
+    return {
+        "runs": runs,
+        "sources_ms": statistics.median(from_sources) * 1000,
+        "snapshot_ms": statistics.median(from_snapshot) * 1000,
+        "snapshot_bytes": os.path.getsize(args.output),
+    }
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", default="./data/snapshot.pickle")
+    parser.add_argument("--words", default="./data/words.json")
+    parser.add_argument("--word-sets", default="./data/word_sets/")
+    parser.add_argument("--translations", default="./data/translations.json")
+    parser.add_argument("--measure", type=int, metavar="RUNS",
+                        help="after building, print the median load times from the sources and from the snapshot")
+    args = parser.parse_args()
+    snapshot = build(args.words, args.word_sets, args.translations)
+    save(args.output, source_files(args.words, args.word_sets, args.translations), snapshot)
+    logging.info(f"Wrote {args.output}: {sum(snapshot.words.word_counts().values())} words, "
+                 f"{len(snapshot.catalog.languages)} bot languages")
+    if args.measure:
+        print(json.dumps(_measure(args, args.measure), indent=4))
+
+
+if __name__ == '__main__':
+    main()
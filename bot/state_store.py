@@ -0,0 +1,280 @@
+import asyncio
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StateStore:
+    """
+    Keeps chat state in memory only. Subclasses persist it: changes are buffered
+    by the save/delete methods and written together by flush().
+    Decks and statistics are kept here so that Reviews and ChatStats can evict them from their caches.
+    """
+    def __init__(self):
+        self._saved_decks = {}  # (chat_id, user_id, group) -> Deck
+        self._saved_stats = {}  # chat_id -> user_id -> (name, AnswerStats)
+
+    def load(self):
+        """
+        Return (chats, quizzes, questions): chat rows (chat_id, language, bot_language),
+        quiz rows (chat_id, interval, next_run) and quiz history questions, oldest first
+        """
+        return [], [], []
+
+    def save_chat(self, chat_id, language, bot_language):
+        pass
+
+    def save_quiz(self, chat_id, interval, next_run):
+        pass
+
+    def delete_quiz(self, chat_id):
+        pass
+
+    def save_question(self, question):
+        pass
+
+    def delete_question(self, question):
+        pass
+
+    def load_deck(self, chat_id, user_id, group):
+        """
+        Return the saved bytes of a spaced repetition Deck or None
+        """
+        deck = self._saved_decks.get((chat_id, user_id, group))
+        return deck.to_bytes() if deck is not None else None
+
+    def load_learners(self, chat_id, group):
+        """
+        Return the ids of the users with a saved Deck of group in chat_id
+        """
+        return [key[1] for key in self._saved_decks if key[0] == chat_id and key[2] == group]
+
+    def save_deck(self, chat_id, user_id, group, deck):
+        self._saved_decks[(chat_id, user_id, group)] = deck
+
+    def load_stats(self, chat_id):
+        """
+        Return the answer statistics rows (chat_id, user_id, name, *AnswerStats.row()) of chat_id
+        """
+        return [(chat_id, user_id, name, *stats.row())
+                for user_id, (name, stats) in self._saved_stats.get(chat_id, {}).items()]
+
+    def save_stats(self, chat_id, user_id, name, stats):
+        self._saved_stats.setdefault(chat_id, {})[user_id] = (name, stats)
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class SQLiteStateStore(StateStore):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS chats (
+        chat_id INTEGER PRIMARY KEY,
+        language TEXT,
+        bot_language TEXT
+    );
+    CREATE TABLE IF NOT EXISTS quizzes (
+        chat_id INTEGER PRIMARY KEY,
+        interval REAL NOT NULL,
+        next_run REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS questions (
+        id TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS questions_seq ON questions (seq);
+    CREATE TABLE IF NOT EXISTS decks (
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        word_group TEXT NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (chat_id, user_id, word_group)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS stats (
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        name TEXT,
+        correct INTEGER NOT NULL,
+        incorrect INTEGER NOT NULL,
+        streak INTEGER NOT NULL,
+        best_streak INTEGER NOT NULL,
+        tries INTEGER NOT NULL,
+        answer_time REAL NOT NULL,
+        timed INTEGER NOT NULL,
+        PRIMARY KEY (chat_id, user_id)
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path: str):
+        """
+        The connection opened here serves the loads on the event loop. Flushes are written
+        by a single writer thread through a connection of its own.
+        """
+        self.db_path = db_path
+        self._connection = sqlite3.connect(db_path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(self.SCHEMA)
+        row = self._connection.execute("SELECT max(seq) FROM questions").fetchone()
+        self._next_seq = (row[0] or 0) + 1
+
+        # Pending changes, keyed by primary key so repeated changes collapse into one write
+        self._chats = {}
+        self._quizzes = {}  # chat_id -> (interval, next_run) or None to delete
+        self._questions = {}  # question id -> (seq, question) or None to delete
+        self._question_seqs = {}  # question id -> seq of the stored row
+        self._decks = {}  # (chat_id, user_id, group) -> Deck
+        self._stats = {}  # (chat_id, user_id) -> (name, AnswerStats)
+        self._writing_decks = {}  # (chat_id, user_id, group) -> bytes being written by the current flush
+        self._writing_stats = {}  # (chat_id, user_id) -> stats row being written by the current flush
+
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+        self._write_connection = None  # Opened and used by the writer thread only
+        self._flush_lock = None  # Created on first use, asyncio primitives bind to the running loop
+
+    def load(self):
+        chats = self._connection.execute("SELECT chat_id, language, bot_language FROM chats").fetchall()
+        quizzes = self._connection.execute("SELECT chat_id, interval, next_run FROM quizzes").fetchall()
+        questions = []
+        for question_id, seq, data in self._connection.execute("SELECT id, seq, data FROM questions ORDER BY seq"):
+            self._question_seqs[question_id] = seq
+            questions.append(json.loads(data))
+        return chats, quizzes, questions
+
+    def save_chat(self, chat_id, language, bot_language):
+        self._chats[chat_id] = (language, bot_language)
+
+    def save_quiz(self, chat_id, interval, next_run):
+        self._quizzes[chat_id] = (interval, next_run)
+
+    def delete_quiz(self, chat_id):
+        self._quizzes[chat_id] = None
+
+    def save_question(self, question):
+        seq = self._question_seqs.get(question['id'])
+        if seq is None:
+            seq = self._question_seqs[question['id']] = self._next_seq
+            self._next_seq += 1
+        # The question itself is kept so later mutations before the flush are captured too
+        self._questions[question['id']] = (seq, question)
+
+    def delete_question(self, question):
+        self._question_seqs.pop(question['id'], None)
+        self._questions[question['id']] = None
+
+    def load_deck(self, chat_id, user_id, group):
+        # Decks evicted by Reviews are reloaded, the ones not written yet come from the pending changes
+        key = (chat_id, user_id, group)
+        if key in self._decks:
+            return self._decks[key].to_bytes()
+        if key in self._writing_decks:
+            return self._writing_decks[key]
+        row = self._connection.execute("SELECT data FROM decks WHERE chat_id = ? AND user_id = ? AND word_group = ?",
+                                       (chat_id, user_id, group)).fetchone()
+        return row[0] if row else None
+
+    def load_learners(self, chat_id, group):
+        learners = {user_id for (user_id,) in self._connection.execute(
+            "SELECT user_id FROM decks WHERE chat_id = ? AND word_group = ?", (chat_id, group))}
+        learners.update(key[1] for key in (*self._decks, *self._writing_decks) if key[0] == chat_id and key[2] == group)
+        return learners
+
+    def save_deck(self, chat_id, user_id, group, deck):
+        # Serialized at flush time, a deck reviewed many times in between is written once
+        self._decks[(chat_id, user_id, group)] = deck
+
+    def load_stats(self, chat_id):
+        rows = {row[1]: row for row in self._connection.execute(
+            "SELECT chat_id, user_id, name, correct, incorrect, streak, best_streak, tries, answer_time, timed "
+            "FROM stats WHERE chat_id = ?", (chat_id,))}
+        # Newer than the stored rows: being written, then not written yet
+        rows.update((key[1], row) for key, row in self._writing_stats.items() if key[0] == chat_id)
+        rows.update((key[1], (*key, name, *stats.row())) for key, (name, stats) in self._stats.items()
+                    if key[0] == chat_id)
+        return list(rows.values())
+
+    def save_stats(self, chat_id, user_id, name, stats):
+        self._stats[(chat_id, user_id)] = (name, stats)
+
+    def _take_pending(self):
+        """
+        Swap out the pending changes as rows, runs on the event loop. Questions and decks are
+        serialized here, they keep being mutated while the writer thread stores the rows.
+        """
+        pending = (
+            [(chat_id, language, bot_language) for chat_id, (language, bot_language) in self._chats.items()],
+            [(chat_id,) for chat_id, quiz in self._quizzes.items() if quiz is None],
+            [(chat_id, *quiz) for chat_id, quiz in self._quizzes.items() if quiz is not None],
+            [(question_id,) for question_id, entry in self._questions.items() if entry is None],
+            [(question_id, entry[0], json.dumps(entry[1], ensure_ascii=False))
+             for question_id, entry in self._questions.items() if entry is not None],
+            [(*key, deck.to_bytes()) for key, deck in self._decks.items()],
+            [(*key, name, *stats.row()) for key, (name, stats) in self._stats.items()],
+        )
+        self._chats, self._quizzes, self._questions, self._decks, self._stats = {}, {}, {}, {}, {}
+        return pending
+
+    def _write(self, pending):
+        """
+        Store rows taken by _take_pending in one transaction, runs on the writer thread
+        """
+        chats, deleted_quizzes, quizzes, deleted_questions, questions, decks, stats = pending
+        if self._write_connection is None:
+            self._write_connection = sqlite3.connect(self.db_path)
+            self._write_connection.execute("PRAGMA synchronous=NORMAL")
+        with self._write_connection:
+            self._write_connection.executemany(
+                "INSERT OR REPLACE INTO chats (chat_id, language, bot_language) VALUES (?, ?, ?)", chats)
+            self._write_connection.executemany("DELETE FROM quizzes WHERE chat_id = ?", deleted_quizzes)
+            self._write_connection.executemany(
+                "INSERT OR REPLACE INTO quizzes (chat_id, interval, next_run) VALUES (?, ?, ?)", quizzes)
+            self._write_connection.executemany("DELETE FROM questions WHERE id = ?", deleted_questions)
+            self._write_connection.executemany(
+                "INSERT OR REPLACE INTO questions (id, seq, data) VALUES (?, ?, ?)", questions)
+            self._write_connection.executemany(
+                "INSERT OR REPLACE INTO decks (chat_id, user_id, word_group, data) VALUES (?, ?, ?, ?)", decks)
+            self._write_connection.executemany(
+                "INSERT OR REPLACE INTO stats (chat_id, user_id, name, correct, incorrect, streak, best_streak, tries, "
+                "answer_time, timed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", stats)
+
+    def _close_writer(self):
+        if self._write_connection is not None:
+            self._write_connection.close()
+            self._write_connection = None
+
+    async def flush(self):
+        """
+        Write the pending changes on the writer thread, the event loop only swaps them out
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not (self._chats or self._quizzes or self._questions or self._decks or self._stats):
+                return
+            chats, quizzes, questions, decks, stats = self._chats, self._quizzes, self._questions, self._decks, self._stats
+            pending = self._take_pending()
+            self._writing_decks = {(chat_id, user_id, group): data for chat_id, user_id, group, data in pending[5]}
+            self._writing_stats = {(row[0], row[1]): row for row in pending[6]}
+            try:
+                await asyncio.get_running_loop().run_in_executor(self._writer, self._write, pending)
+            except Exception:
+                logging.exception(f"Failed to save chat state to {self.db_path}")
+                # Keep the failed changes for the next flush unless they were superseded meanwhile
+                for failed, current in ((chats, self._chats), (quizzes, self._quizzes), (questions, self._questions),
+                                        (decks, self._decks), (stats, self._stats)):
+                    for key, value in failed.items():
+                        current.setdefault(key, value)
+            finally:
+                self._writing_decks = {}
+                self._writing_stats = {}
+
+    async def close(self):
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(self._writer, self._close_writer)
+        self._writer.shutdown()
+        self._connection.close()
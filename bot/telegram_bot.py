@@ -1,14 +1,31 @@
-from telegram import Update, BotCommand
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, MessageHandler, filters, Application
+from telegram import Update, BotCommand, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, MessageHandler, filters, Application, \
+                         CallbackQueryHandler
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden
 
+import asyncio
+import hashlib
+import html
 import json
+import logging
 import random
-from functools import wraps
+import time
+from functools import partial, wraps
 
 import constants
-from utils import get_random_id, localized_text, quiz_start_args_parser, similarity_percentage, get_closeness_key, \
-                  words_eq, preprocess_string, get_hint_text
+from quiz_history import QuizHistory
+from state_store import StateStore
+from message_sender import MessageSender
+from quiz_scheduler import QuizScheduler
+from chat_locks import ChatLocks
+from translation_catalog import TranslationCatalog
+from spaced_repetition import Reviews, grade, QUALITY_IDK, QUALITY_WRONG
+from chat_stats import ChatStats
+from metrics import metrics, SamplingProfiler
+from utils import get_random_id, quiz_start_args_parser, similarity_percentage, get_closeness_key, \
+                  words_eq, preprocess_string, get_hint_text, paginate, \
+                  CLOSENESS_MIN_SIMILARITY
 
 
 def authorized(func):
@@ -16,18 +33,48 @@ def authorized(func):
     async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_handle = update.message.from_user.username
         if '@' + user_handle not in self.allowed_handles:
-            await context.bot.send_message(chat_id=update.message.chat_id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(update.message.chat_id, "unauthorized_command"))
+            await self._send(update.message.chat_id, self._localized_text(update.message.chat_id, "unauthorized_command"))
             return
         return await func(self, update, context)
     return wrapper
 
 
+def serialized_per_chat(func):
+    """
+    Updates are processed concurrently, this keeps the ones of a single chat strictly ordered.
+    Handler time is measured including the wait for the chat's earlier updates.
+    """
+    @wraps(func)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with metrics.timer("handler", handler=func.__name__):
+            async with self.chat_locks.hold(update.effective_chat.id):
+                return await func(self, update, context)
+    return wrapper
+
+
 class TelegramQuizBot:
-    def __init__(self, telegram_token, allowed_handles, words_list, translations):
+    def __init__(self, telegram_token, allowed_handles, words_list, translations, state_store=None,
+                 message_sender=None, on_words_changed=None, chat_filter=None,
+                 metrics_address=None, metrics_log_interval=None):
         self.words_list = words_list
-        self.translations = translations
+        # Compiled once (or taken precompiled from the startup snapshot), missing keys and broken
+        # templates are reported here instead of on every message
+        self.catalog = translations if isinstance(translations, TranslationCatalog) else TranslationCatalog(translations)
+        self.catalog.log_report()
+        # Persists chat preferences, running quizzes and quiz history across restarts
+        self.state_store = state_store if state_store is not None else StateStore()
+        # Rate limited outbound queue, every message goes through _send
+        self.message_sender = message_sender if message_sender is not None else MessageSender()
+        # Called after the word list was modified and flushed, sharded workers use it to tell the others to reload
+        self.on_words_changed = on_words_changed
+        # Only chats passing chat_filter are restored from the state store, sharded workers restore their own chats
+        self.chat_filter = chat_filter
+        # (host, port) serving Prometheus metrics and/or seconds between metric dumps to the log
+        self.metrics_address = metrics_address
+        self.metrics_log_interval = metrics_log_interval
+        self._metrics_server = None
+        # Toggled at runtime by /debug_profile
+        self.profiler = SamplingProfiler()
         # Telegram bot token
         self.telegram_token = telegram_token
 
@@ -38,6 +85,8 @@ class TelegramQuizBot:
             BotCommand(command="quiz", description=self._localized_text(None, "quiz_description")),
             BotCommand(command="language", description=self._localized_text(None, "language_description")),
             BotCommand(command="list", description=self._localized_text(None, "list_description")),
+            BotCommand(command="stats", description=self._localized_text(None, "stats_description")),
+            BotCommand(command="top", description=self._localized_text(None, "top_description")),
             BotCommand(command="add_word", description=self._localized_text(None, "add_word_description")),
             BotCommand(command="remove_word", description=self._localized_text(None, "remove_word_description")),
             BotCommand(command="change_description", description=self._localized_text(None, "change_description_description"))
@@ -52,229 +101,364 @@ class TelegramQuizBot:
             CommandHandler('change_description', self.change_description),
             CommandHandler('language', self.set_language),
             CommandHandler('list', self.list_words),
+            CommandHandler('stats', self.show_stats),
+            CommandHandler('top', self.show_top),
+            CommandHandler('debug_profile', self.debug_profile),
+            CallbackQueryHandler(self.list_page, pattern=r"^list:"),
             MessageHandler(filters.TEXT & ~filters.COMMAND, self.check_answer),
         ]
 
         # Custom data structures
         self.allowed_handles = allowed_handles
-        self.ongoing_quizzes = {}
+        # Running timed quizzes, all driven by one scheduler
+        self.quiz_scheduler = QuizScheduler(self._run_due_quizzes)
+        self._background_tasks = set()
+        self.chat_locks = ChatLocks()
         self.language_preferences = {}
         self.bot_language_preferences = {}
-        self.quiz_history = []
+        self.quiz_history = QuizHistory()
+        # Spaced repetition state per (chat, user, group), fed by check_answer and used by _pick_question
+        self.reviews = Reviews(self.state_store)
+        # Answer statistics and leaderboards, maintained on every answer for /stats and /top
+        self.stats = ChatStats(self.state_store)
+        # (group or None for the overview, bot language) -> rendered /list pages, dropped on any word list change
+        self._list_pages = {}
+
+    def _save_chat_state(self, chat_id):
+        self.state_store.save_chat(chat_id, self.language_preferences.get(chat_id), self.bot_language_preferences.get(chat_id))
+
+    def _remember_question(self, question):
+        evicted = self.quiz_history.append(question)
+        if evicted:
+            self.state_store.delete_question(evicted)
+        self.state_store.save_question(question)
+
+    def _schedule_quiz(self, chat_id, interval, first):
+        self.quiz_scheduler.schedule(chat_id, interval, first)
+        self.state_store.save_quiz(chat_id, interval, time.time() + first)
+
+    def _restore_state(self):
+        """
+        Load chat preferences and quiz history from the state store and reschedule running quizzes
+        """
+        chats, quizzes, questions = self.state_store.load()
+        if self.chat_filter is not None:
+            chats = [chat for chat in chats if self.chat_filter(chat[0])]
+            quizzes = [quiz for quiz in quizzes if self.chat_filter(quiz[0])]
+            questions = [question for question in questions if self.chat_filter(question['chat_id'])]
+        for chat_id, language, bot_language in chats:
+            if language:
+                self.language_preferences[chat_id] = language
+            if bot_language:
+                self.bot_language_preferences[chat_id] = bot_language
+        for question in questions:
+            self.quiz_history.append(question)
+
+        now = time.time()
+        for chat_id, interval, next_run in quizzes:
+            # Keep the original cadence, overdue quizzes are spread out instead of all firing at once
+            overdue_delay = random.uniform(1, max(min(interval, constants.QUIZ_RESTORE_SPREAD), 1))
+            self._schedule_quiz(chat_id, interval, first=max(next_run - now, overdue_delay))
+        logging.info(f"Restored {len(chats)} chats, {len(quizzes)} quizzes and {len(questions)} questions")
+
+    async def _flush_state(self, context: ContextTypes.DEFAULT_TYPE):
+        await self.state_store.flush()
+
+    def _collect_metrics(self):
+        gauges = {
+            ("active_quizzes", ()): len(self.quiz_scheduler),
+            ("quiz_history_questions", ()): len(self.quiz_history),
+            ("review_decks", ()): len(self.reviews),
+            ("answer_stats", ()): len(self.stats),
+            ("chats_with_pending_updates", ()): len(self.chat_locks),
+            ("background_tasks", ()): len(self._background_tasks),
+            ("profiler_running", ()): int(self.profiler.running),
+        }
+        for name, value in self.message_sender.stats().items():
+            gauges[("sender_" + name, ())] = value
+        for name, value in self.quiz_scheduler.stats().items():
+            if value is not None:
+                gauges[("scheduler_" + name, ())] = value
+        for group, count in self.words_list.word_counts().items():
+            gauges[("words", (("group", group),))] = count
+        return gauges
+
+    async def _log_metrics(self, context: ContextTypes.DEFAULT_TYPE):
+        logging.info("Metrics:\n" + metrics.render())
+
+    async def _words_changed(self):
+        self._list_pages.clear()
+        if self.on_words_changed is not None:
+            await self.words_list.flush()
+            self.on_words_changed()
+
+    async def reload_words(self):
+        """
+        Re-read the word list after another process modified it
+        """
+        await self.words_list.reload()
+        self._list_pages.clear()
+
+    async def _send(self, chat_id, text, priority=constants.PRIORITY_REPLY, **kwargs):
+        return await self.message_sender.send_message(chat_id, priority=priority, parse_mode=ParseMode.HTML, text=text,
+                                                      **kwargs)
 
-    def _localize_word_list(self, word_list, chat_id=None):
+    def _get_bot_language(self, chat_id=None):
         if chat_id is None:
-            language = constants.DEFAULT_BOT_LANGUAGE
-        else:
-            language = self.bot_language_preferences.get(chat_id, constants.DEFAULT_BOT_LANGUAGE)
-        
-        result_list = []
-        for word_data in word_list:
-            word = word_data.get("word")
-            quiz_type = word_data.get("quiz_type")
-            descriptions = word_data.get("descriptions", {})
-
-            # Try to get the description in the preferred language
-            description = descriptions.get(language)
-
-            # If not found, try the default bot language
-            if not description:
-                description = descriptions.get(constants.DEFAULT_BOT_LANGUAGE)
-
-            # If still not found, use any available description
-            if not description and descriptions:
-                description = next(iter(descriptions.values()))
-
-            result_list.append({
-                "word": word,
-                "description": description,
-                "quiz_type": quiz_type
-            })
-        return result_list
-    
+            return constants.DEFAULT_BOT_LANGUAGE
+        return self.bot_language_preferences.get(chat_id, constants.DEFAULT_BOT_LANGUAGE)
+
     def _localized_text(self, chat_id, key, format_params=None):
-        if chat_id is None:
-            language = constants.DEFAULT_BOT_LANGUAGE
-        else:
-            language = self.bot_language_preferences.get(chat_id, constants.DEFAULT_BOT_LANGUAGE)
-        return localized_text(self.translations, language, key, format_params)
+        return self.catalog.text(self._get_bot_language(chat_id), key, format_params)
 
+    @serialized_per_chat
     async def set_language(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id = update.message.chat_id
+        available_languages = ", ".join(self.catalog.languages)
         if not context.args:
             # No language provided, inform the user about available languages
-            available_languages = ", ".join(self.translations.keys())
-            await context.bot.send_message(chat_id=chat_id,
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(chat_id, "no_bot_language", {"available_languages": available_languages}))
+            await self._send(chat_id, self._localized_text(chat_id, "no_bot_language", {"available_languages": available_languages}))
             return
 
         new_language = preprocess_string(context.args[0])
-        if new_language not in list(map(preprocess_string, self.translations)):
-            await context.bot.send_message(chat_id=chat_id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(chat_id, "unsupported_language", {"available_languages": available_languages}))
+        if new_language not in list(map(preprocess_string, self.catalog.languages)):
+            await self._send(chat_id, self._localized_text(chat_id, "unsupported_language", {"available_languages": available_languages}))
             return
 
         self.bot_language_preferences[chat_id] = new_language
-        await context.bot.send_message(chat_id=chat_id, 
-                                       parse_mode=ParseMode.HTML, 
-                                       text=self._localized_text(chat_id, "language_set", {"new_language": new_language}))
+        self._save_chat_state(chat_id)
+        await self._send(chat_id, self._localized_text(chat_id, "language_set", {"new_language": new_language}))
 
+    @serialized_per_chat
     @authorized
     async def add_word(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await self.manage_word(update, context, 'add')
             
+    @serialized_per_chat
     @authorized
     async def remove_word(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await self.manage_word(update, context, 'remove')
 
     async def manage_word(self, update: Update, context: ContextTypes.DEFAULT_TYPE, action: str):
         if not context.args:
-            await context.bot.send_message(chat_id=update.effective_chat.id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(update.effective_chat.id, "provide_word"))
+            await self._send(update.effective_chat.id, self._localized_text(update.effective_chat.id, "provide_word"))
         else:
             word = ' '.join(context.args)
             if action == 'add':
                 try:
-                    await self.words_list.add_word(word)
-                    await context.bot.send_message(chat_id=update.message.chat_id, 
-                                                   parse_mode=ParseMode.HTML, 
-                                                   text=self._localized_text(update.message.chat_id, "word_added"))
+                    chat_id = update.message.chat_id
+                    result = await self.words_list.add_word(word)
+                    if result.added or result.merged:
+                        await self._words_changed()
+                    if result.added or not (result.merged or result.rejected):
+                        await self._send(chat_id, self._localized_text(chat_id, "word_added"))
+                    if result.merged:
+                        await self._send(chat_id, self._localized_text(chat_id, "words_merged",
+                                                                       {"words": html.escape(", ".join(result.merged))}))
+                    if result.rejected:
+                        rejected = ", ".join(f"<b>{html.escape(new_word)}</b> ≈ {html.escape(existing)} ({similarity:.0f}%)"
+                                             for new_word, existing, similarity in result.rejected)
+                        await self._send(chat_id, self._localized_text(chat_id, "words_rejected", {"words": rejected}))
                 except json.JSONDecodeError:
-                    await context.bot.send_message(chat_id=update.message.chat_id, 
-                                                   parse_mode=ParseMode.HTML, 
-                                                   text=self._localized_text(update.message.chat_id, "invalid_json_format"))
+                    await self._send(update.message.chat_id, self._localized_text(update.message.chat_id, "invalid_json_format"))
             elif action == 'remove':
                 removed = await self.words_list.remove_word(word)
                 if not removed:
-                    await context.bot.send_message(chat_id=update.message.chat_id, 
-                                                   parse_mode=ParseMode.HTML, 
-                                                   text=self._localized_text(update.message.chat_id, "word_not_found", {"word": word}))
+                    await self._send(update.message.chat_id, self._localized_text(update.message.chat_id, "word_not_found", {"word": word}))
                 else:
-                    await context.bot.send_message(chat_id=update.message.chat_id, 
-                                                   parse_mode=ParseMode.HTML, 
-                                                   text=self._localized_text(update.message.chat_id, "word_removed", {"word": word}))
+                    await self._words_changed()
+                    await self._send(update.message.chat_id, self._localized_text(update.message.chat_id, "word_removed", {"word": word}))
 
+    @serialized_per_chat
     @authorized
     async def change_description(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not context.args:
-            await context.bot.send_message(chat_id=update.effective_chat.id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(update.effective_chat.id, "provide_word"))
+            await self._send(update.effective_chat.id, self._localized_text(update.effective_chat.id, "provide_word"))
         else:
             word = ' '.join(context.args)
             try:
-                await self.words_list.update_description(word)
-                await context.bot.send_message(chat_id=update.message.chat_id, 
-                                               parse_mode=ParseMode.HTML, 
-                                               text=self._localized_text(update.message.chat_id, "description_updated"))
+                if not await self.words_list.update_description(word):
+                    language = json.loads(word)["language"]
+                    await self._send(update.message.chat_id, self._localized_text(update.message.chat_id, "no_words_specific_language", {"language": language}))
+                    return
+                await self._words_changed()
+                await self._send(update.message.chat_id, self._localized_text(update.message.chat_id, "description_updated"))
             except json.JSONDecodeError:
-                await context.bot.send_message(chat_id=update.message.chat_id, 
-                                               parse_mode=ParseMode.HTML,
-                                               text=self._localized_text(update.message.chat_id, "invalid_json_format"))
+                await self._send(update.message.chat_id, self._localized_text(update.message.chat_id, "invalid_json_format"))
 
-    async def callback_quiz(self, context: ContextTypes.DEFAULT_TYPE, chat_id=None):
-        if chat_id is None:
-            chat_id = context.job.chat_id
+    async def _run_due_quizzes(self, chat_ids):
+        """
+        Quiz scheduler callback: pick the questions of all due chats in one pass, then send them in the background
+        """
+        questions = [(chat_id, await self._pick_question(chat_id)) for chat_id in chat_ids]
+        for chat_id, question in questions:
+            if chat_id not in self.quiz_scheduler:
+                # Stopped while the questions were picked
+                continue
+            # Remember when the next question is due
+            self.state_store.save_quiz(chat_id, self.quiz_scheduler.interval(chat_id),
+                                       time.time() + self.quiz_scheduler.time_until(chat_id))
+            # Timed questions yield to answer feedback in the send queue
+            task = asyncio.create_task(self._ask_question(chat_id, question, constants.PRIORITY_SCHEDULED))
+            self._background_tasks.add(task)
+            task.add_done_callback(partial(self._scheduled_question_done, chat_id))
+
+    def _scheduled_question_done(self, chat_id, task):
+        """
+        Log the failure of a scheduled question, chats the bot may no longer write to are unscheduled
+        """
+        self._background_tasks.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+        error = task.exception()
+        if isinstance(error, Forbidden):
+            logging.warning(f"Stopping the quiz of chat {chat_id}, the bot can't write to it: {error}")
+            if self.quiz_scheduler.cancel(chat_id):
+                self.state_store.delete_quiz(chat_id)
+            return
+        logging.error(f"Failed to ask the scheduled question of chat {chat_id}", exc_info=error)
+
+    async def callback_quiz(self, chat_id, priority=constants.PRIORITY_REPLY):
+        await self._ask_question(chat_id, await self._pick_question(chat_id), priority)
+
+    async def _pick_question(self, chat_id):
+        """
+        The word that has been due the longest in the decks of the chat's learners, else a word none of them
+        has been asked yet, else the word due first
+        """
+        language = self.language_preferences.get(chat_id)
+        bot_language = self._get_bot_language(chat_id)
+        now = time.time()
+        while (due := self.reviews.next_due(chat_id, language)) is not None and due[0] <= now:
+            _, learner, key = due
+            question = await self.words_list.get_question_by_key(language, key, bot_language)
+            if question is not None:
+                # Asked again later if nobody answers it
+                self.reviews.postpone(chat_id, learner, language, key, now + constants.SRS_UNANSWERED_DELAY)
+                return question
+            # Removed from the group
+            self.reviews.retire(chat_id, learner, language, key)
+
+        question = None
+        for _ in range(constants.SRS_NEW_WORD_ATTEMPTS):
+            question = await self.words_list.get_random_question(language, bot_language)
+            if question is None or not self.reviews.seen(chat_id, language, question.answer_key):
+                return question
+        # Every word drawn was asked before, review ahead of time
+        if due is not None:
+            question = await self.words_list.get_question_by_key(language, due[2], bot_language) or question
+        return question
+
+    async def _ask_question(self, chat_id, question, priority):
         language = self.language_preferences.get(chat_id)
-        
-        word_list = await self.words_list.get_words_by_language(language)
-        word_list = self._localize_word_list(word_list, chat_id)
 
-        if not word_list:
-            await context.bot.send_message(chat_id=chat_id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(chat_id, "no_words_specific_language", {"language": language}))
+        if question is None:
+            await self._send(chat_id, self._localized_text(chat_id, "no_words_specific_language", {"language": language}))
             return
 
-        # Pick a random word-description pair
-        random_pair = random.choice(word_list)
-
-        word = random_pair['word']
-        description = random_pair['description']
-        quiz_type = random_pair["quiz_type"]
+        word = question.word
+        description = question.description
+        quiz_type = question.quiz_type
 
         if quiz_type == "fill":
             msg_key = "quiz_fill_question"
         else:
             msg_key = "quiz_question"
 
-        message = await context.bot.send_message(chat_id=chat_id, 
-                                                 parse_mode=ParseMode.HTML, 
-                                                 text=self._localized_text(chat_id, msg_key, {"language": language, "description": description}))
-        
+        message = await self._send(chat_id, self._localized_text(chat_id, msg_key, {"language": language, "description": description}), priority)
+
         # Save to history
-        self.quiz_history.append({
+        self._remember_question({
             'id': get_random_id(),
             'answer': word,
+            'answer_key': question.answer_key,
+            'language': language,
             'chat_id': chat_id,
             'attempts': 0,
             'hint_count': 0,
+            'asked_at': time.time(),
             'message_ids': [message.message_id]  # Initial valid reply IDs only contains the original message
         })
-        
-        self.quiz_history = [msg for chat_id in set(q['chat_id'] for q in self.quiz_history) 
-                     for msg in [q for q in self.quiz_history if q['chat_id'] == chat_id][-constants.QUIZ_HISTORY_LENGTH:]]
 
 
+    @serialized_per_chat
     async def start_callback_quiz(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id = update.message.chat_id
         
-        if chat_id in self.ongoing_quizzes:
-            await context.bot.send_message(chat_id=chat_id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(chat_id, "quiz_ongoing"))
+        if chat_id in self.quiz_scheduler:
+            await self._send(chat_id, self._localized_text(chat_id, "quiz_ongoing"))
             return
 
         language, interval_time_units = quiz_start_args_parser(context.args)
 
-        word_list = await self.words_list.get_words_by_language(language)
-        word_list = self._localize_word_list(word_list, chat_id)
-
-        if not word_list:
-            await context.bot.send_message(chat_id=chat_id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(chat_id, "no_words_specific_language", {"language": language}))
+        if await self.words_list.get_random_word(language) is None:
+            await self._send(chat_id, self._localized_text(chat_id, "no_words_specific_language", {"language": language}))
             return
 
         # Store language preference using chat_id as the key
         self.language_preferences[chat_id] = language
+        self._save_chat_state(chat_id)
         
-        await context.bot.send_message(chat_id=chat_id, 
-                                       parse_mode=ParseMode.HTML, 
-                                       text=self._localized_text(chat_id, "quiz_started", {"language": language}))
-        # Set the alarm:
-        # Store the job for the quiz
-        job = context.job_queue.run_repeating(self.callback_quiz, interval=interval_time_units, first=1, name="timed_quiz", chat_id=chat_id)
-        
-        # Add the job to the ongoing_quizzes dict
-        self.ongoing_quizzes[chat_id] = job
+        await self._send(chat_id, self._localized_text(chat_id, "quiz_started", {"language": language}))
+        # Set the alarm, at a random point of the first interval so chats started together do not fire together
+        self._schedule_quiz(chat_id, interval_time_units, first=random.uniform(1, max(interval_time_units, 1)))
 
 
+    @serialized_per_chat
     async def stop_callback_quiz(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id = update.message.chat_id
-        ongoing_job = self.ongoing_quizzes.pop(chat_id, None)
-        if ongoing_job:
-            ongoing_job.schedule_removal()
-            await context.bot.send_message(chat_id=chat_id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(chat_id, "quiz_stopped"))
+        if self.quiz_scheduler.cancel(chat_id):
+            self.state_store.delete_quiz(chat_id)
+            await self._send(chat_id, self._localized_text(chat_id, "quiz_stopped"))
         else:
-            await context.bot.send_message(chat_id=chat_id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(chat_id, "no_ongoing"))
+            await self._send(chat_id, self._localized_text(chat_id, "no_ongoing"))
 
+    @serialized_per_chat
     async def callback_quiz_on_demand(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id = update.message.chat_id
-        if chat_id not in self.ongoing_quizzes:
-            await context.bot.send_message(chat_id=chat_id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(chat_id, "start_first"))
+        if chat_id not in self.quiz_scheduler:
+            await self._send(chat_id, self._localized_text(chat_id, "start_first"))
             return
-        await self.callback_quiz(context, chat_id)
+        await self.callback_quiz(chat_id)
+
+    @staticmethod
+    def _sender(update):
+        """
+        (user id, display name) of the sender of a message, the chat itself if unknown
+        """
+        user = update.message.from_user
+        if user is None:
+            return update.message.chat_id, None
+        return user.id, user.username or user.first_name
+
+    def _count_reply(self, update, question):
+        """
+        Count a reply to a question against the user who sent it
+        """
+        user_id, name = self._sender(update)
+        # JSON object keys, the question is persisted as JSON
+        replies = question.setdefault('replies', {})
+        replies[str(user_id)] = [name, replies.get(str(user_id), [None, 0])[1] + 1]
 
+    def _record_outcome(self, update, question, quality):
+        """
+        Feed the outcome of a question to the spaced repetition deck of the user who answered and to the
+        statistics of everyone who replied to it, once per question
+        """
+        if question.get('reviewed'):
+            return
+        question['reviewed'] = True
+        chat_id = question['chat_id']
+        user_id, name = self._sender(update)
+        self.reviews.review(chat_id, user_id,
+                            question.get('language', self.language_preferences.get(chat_id)), question['answer_key'], quality)
+        seconds = time.time() - question['asked_at'] if 'asked_at' in question else None
+        replies = {int(replier): (replier_name, count) for replier, (replier_name, count) in question.get('replies', {}).items()}
+        tries = replies.pop(user_id, (name, 1))[1]
+        self.stats.record(chat_id, user_id, name, quality >= 3, tries, seconds, missed_by=replies)
+        self.state_store.save_question(question)
+
+    @serialized_per_chat
     async def check_answer(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_message = update.message.text  # Get user's message
         chat_id = update.message.chat_id  # Get chat_id
@@ -282,43 +466,38 @@ class TelegramQuizBot:
         reply_to_message_id = update.message.reply_to_message.message_id if update.message.reply_to_message else None
 
         # If in a private chat and the user did not reply to a specific message, consider it as a reply to the latest quiz question
-        if chat_type == 'private' and not reply_to_message_id and chat_id in self.ongoing_quizzes:
-            last_quiz_question = next((qa for qa in reversed(self.quiz_history) if qa['chat_id'] == chat_id), None)
+        if chat_type == 'private' and not reply_to_message_id and chat_id in self.quiz_scheduler:
+            last_quiz_question = self.quiz_history.latest(chat_id)
             if last_quiz_question:
                 reply_to_message_id = last_quiz_question['message_ids'][-1]
 
         if not reply_to_message_id:  # If the user did not reply to a specific message, you might decide to ignore or handle differently
-            if chat_id in self.ongoing_quizzes:
-                await context.bot.send_message(chat_id=chat_id, 
-                                            parse_mode=ParseMode.HTML, 
-                                            text=self._localized_text(chat_id, "reply_to_question"))
+            if chat_id in self.quiz_scheduler:
+                await self._send(chat_id, self._localized_text(chat_id, "reply_to_question"))
             else:
-                await context.bot.send_message(chat_id=chat_id, 
-                                            parse_mode=ParseMode.HTML, 
-                                            text=self._localized_text(chat_id, "start_first"))
+                await self._send(chat_id, self._localized_text(chat_id, "start_first"))
             return
 
         # Find the question in history based on reply_to_message_id
-        corresponding_question = next((qa for qa in self.quiz_history if qa['chat_id'] == chat_id and reply_to_message_id in qa['message_ids']), None)
-        similarity = similarity_percentage(user_message, corresponding_question['answer'])
-        similarity_msg = self._localized_text(chat_id, get_closeness_key(similarity))
+        corresponding_question = self.quiz_history.find(chat_id, reply_to_message_id)
+        user_key = preprocess_string(user_message)
 
         # Check if the user's reply is "idk" or any word in IDK_WORDS
-        if preprocess_string(user_message) in constants.IDK_WORDS:
+        if corresponding_question and not corresponding_question.get('reviewed'):
+            self._count_reply(update, corresponding_question)
+
+        if user_key in constants.IDK_WORDS:
             if corresponding_question:
-                await context.bot.send_message(chat_id=chat_id, 
-                                               parse_mode=ParseMode.HTML,
-                                               text=self._localized_text(chat_id, "idk_answer", {"correct_answer": corresponding_question["answer"]}))
+                self._record_outcome(update, corresponding_question, QUALITY_IDK)
+                await self._send(chat_id, self._localized_text(chat_id, "idk_answer", {"correct_answer": corresponding_question["answer"]}))
             else:
-                await context.bot.send_message(chat_id=chat_id, 
-                                               parse_mode=ParseMode.HTML, 
-                                               text=self._localized_text(chat_id, "incorrect_outdated"))
+                await self._send(chat_id, self._localized_text(chat_id, "incorrect_outdated"))
             return
 
-        if corresponding_question and words_eq(user_message, corresponding_question['answer']):
-            await context.bot.send_message(chat_id=chat_id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=self._localized_text(chat_id, "correct_answer"))
+        if corresponding_question and words_eq(user_key, corresponding_question['answer_key'], preprocess=False):
+            self._record_outcome(update, corresponding_question,
+                                 grade(corresponding_question['attempts'], corresponding_question['hint_count']))
+            await self._send(chat_id, self._localized_text(chat_id, "correct_answer"))
         else:
             if corresponding_question:  # If a related question is found
                 max_attempts = constants.DEFAULT_MAX_ATTEMPTS
@@ -326,107 +505,240 @@ class TelegramQuizBot:
                 corresponding_question['attempts'] = min(corresponding_question['attempts'], max_attempts)
                 remaining_attempts = max_attempts - corresponding_question['attempts']
                 
-                if preprocess_string(user_message) in constants.HINT_WORDS or remaining_attempts <= constants.REMAINING_ATTEMPTS_HINT:
+                asked_hint = user_key in constants.HINT_WORDS
+                if asked_hint or remaining_attempts <= constants.REMAINING_ATTEMPTS_HINT:
                     corresponding_question['hint_count'] += 1
                     hint_text = get_hint_text(corresponding_question['answer'], corresponding_question['hint_count'])
                     hint_msg = self._localized_text(chat_id, "hint", {"hint_text": hint_text})
                 else:
                     hint_text = ""
+                self.state_store.save_question(corresponding_question)
 
                 if remaining_attempts > 0:
                     text_to_send = self._localized_text(chat_id, "incorrect_answer", {"remaining_attempts": remaining_attempts})
-                    text_to_send += "\n" + similarity_msg
+                    if not asked_hint:
+                        # Closeness below CLOSENESS_MIN_SIMILARITY is not computed exactly
+                        similarity = similarity_percentage(user_key, corresponding_question['answer_key'], preprocess=False,
+                                                           min_similarity=CLOSENESS_MIN_SIMILARITY)
+                        text_to_send += "\n" + self._localized_text(chat_id, get_closeness_key(similarity))
                     if hint_text:
                         text_to_send += "\n" + hint_msg
-                    msg = await context.bot.send_message(chat_id=chat_id, 
-                                                         parse_mode=ParseMode.HTML, 
-                                                         text=text_to_send)
-                    corresponding_question['message_ids'].append(msg.message_id)  # Add new message_id to valid reply ids
+                    msg = await self._send(chat_id, text_to_send)
+                    self.quiz_history.add_message_id(corresponding_question, msg.message_id)  # Add new message_id to valid reply ids
+                    self.state_store.save_question(corresponding_question)
                 else:
-                    await context.bot.send_message(chat_id=chat_id, 
-                                                   parse_mode=ParseMode.HTML, 
-                                                   text=self._localized_text(chat_id, "incorrect_final_answer", {"correct_answer": corresponding_question["answer"]}))
+                    self._record_outcome(update, corresponding_question, QUALITY_WRONG)
+                    await self._send(chat_id, self._localized_text(chat_id, "incorrect_final_answer", {"correct_answer": corresponding_question["answer"]}))
             else:
-                await context.bot.send_message(chat_id=chat_id, 
-                                               parse_mode=ParseMode.HTML, 
-                                               text=self._localized_text(chat_id, "incorrect_outdated"))
+                await self._send(chat_id, self._localized_text(chat_id, "incorrect_outdated"))
 
+    @serialized_per_chat
+    async def show_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        chat_id = update.message.chat_id
+        user = update.message.from_user
+        user_stats = self.stats.user(chat_id, user.id if user is not None else chat_id)
+        if user_stats is None:
+            await self._send(chat_id, self._localized_text(chat_id, "no_stats"))
+            return
+        stats, rank, players = user_stats
+        chat_stats = self.stats.chat(chat_id)
+        await self._send(chat_id, self._localized_text(chat_id, "stats", {
+            "name": html.escape((user.username or user.first_name) if user is not None else str(chat_id)),
+            "correct": stats.correct,
+            "incorrect": stats.incorrect,
+            "streak": stats.streak,
+            "best_streak": stats.best_streak,
+            "tries": f"{stats.average_tries():.1f}",
+            "answer_time": f"{stats.average_answer_time():.0f}",
+            "rank": rank,
+            "players": players,
+            "chat_correct": chat_stats.correct,
+            "chat_incorrect": chat_stats.incorrect,
+            "chat_best_streak": chat_stats.best_streak,
+        }))
+
+    @serialized_per_chat
+    async def show_top(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        chat_id = update.message.chat_id
+        top = self.stats.top(chat_id)
+        if not top:
+            await self._send(chat_id, self._localized_text(chat_id, "no_stats"))
+            return
+        lines = [f"{rank}. {html.escape(name)}: <b>{score}</b>" for rank, name, score in top]
+        await self._send(chat_id, self._localized_text(chat_id, "top") + "\n" + "\n".join(lines))
+
+    @serialized_per_chat
     async def list_words(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id = update.message.chat_id
 
-        available_groups = await self.words_list.get_languages()
+        bot_language = self._get_bot_language(chat_id)
 
         if not context.args:
             # List only group descriptions without words
-            result_text = ""
-            for group_language in available_groups:
-                group_descriptions = await self.words_list.get_group_description(group_language)
-
-                description = group_descriptions.get(self.bot_language_preferences.get(chat_id, constants.DEFAULT_BOT_LANGUAGE), None)
-                if not description:
-                    description = group_descriptions.get(constants.DEFAULT_BOT_LANGUAGE, None)
-                if not description and group_descriptions:
-                    description = next(iter(group_descriptions.values()))
-
-                if description:
-                    result_text += f"{group_language} - {description}\n\n"
-
-            if not result_text:
-                await context.bot.send_message(chat_id=chat_id, 
-                                               parse_mode=ParseMode.HTML, 
-                                               text=self._localized_text(chat_id, "list_empty"))
-            else:
-                await context.bot.send_message(chat_id=chat_id, 
-                                               parse_mode=ParseMode.HTML, 
-                                               text=result_text)
+            group = None
+            pages = await self._get_list_pages(None, bot_language)
+            if not pages:
+                await self._send(chat_id, self._localized_text(chat_id, "list_empty"))
+                return
         else:
             group = preprocess_string(context.args[0])
+            available_groups = await self.words_list.get_languages()
             if group not in list(map(preprocess_string, available_groups)):
-                await context.bot.send_message(chat_id=chat_id, 
-                                               parse_mode=ParseMode.HTML, 
-                                               text=self._localized_text(chat_id, "list_unknown_group"))
+                await self._send(chat_id, self._localized_text(chat_id, "list_unknown_group"))
                 return
+            pages = await self._get_list_pages(group, bot_language)
 
-            group_descriptions = await self.words_list.get_group_description(group)
-
-            description = group_descriptions.get(self.bot_language_preferences.get(chat_id, constants.DEFAULT_BOT_LANGUAGE), None)
-            if not description:
-                description = group_descriptions.get(constants.DEFAULT_BOT_LANGUAGE, None)
-            if not description and group_descriptions:
-                description = next(iter(group_descriptions.values()))
-
-            word_list = await self.words_list.get_words_by_language(group)
-            word_list = self._localize_word_list(word_list, chat_id)
+        await self._send(chat_id, pages[0], reply_markup=self._list_keyboard(group, 0, len(pages)))
 
-            result_text = ""
-            if description:
-                result_text += f"{group} - {description}:\n\n"
+    @serialized_per_chat
+    async def list_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Inline keyboard navigation of /list, pages are served from the cache
+        """
+        query = update.callback_query
+        if query.data == "list:-":
+            # The page counter button
+            await query.answer()
+            return
+        token, page = query.data[len("list:"):].rsplit(":", 1)
+        group = None
+        if token:
+            # Keyboards sent before the group tokens carry the (preprocessed) group name itself
+            group = next((key for key in map(preprocess_string, await self.words_list.get_languages())
+                          if token in (self._group_token(key), key)), None)
+            if group is None:
+                await query.answer()
+                return
+        pages = await self._get_list_pages(group, self._get_bot_language(query.message.chat_id))
+        await query.answer()
+        if not pages:
+            return
+        # The list may have shrunk since the keyboard was sent
+        page = min(int(page), len(pages) - 1)
+        try:
+            await query.edit_message_text(pages[page], parse_mode=ParseMode.HTML,
+                                          reply_markup=self._list_keyboard(group, page, len(pages)))
+        except BadRequest as e:
+            # Pressing a button of an outdated keyboard can render the page already shown
+            logging.debug(f"List page not updated: {e}")
+
+    async def _get_list_pages(self, group, bot_language):
+        key = (group, bot_language)
+        pages = self._list_pages.get(key)
+        if pages is None:
+            if group is None:
+                entries = []
+                for group_language in await self.words_list.get_languages():
+                    description = await self.words_list.get_group_description(group_language, bot_language)
+                    if description:
+                        entries.append(f"{group_language} - {description}")
+                pages = paginate("", entries, separator="\n\n")
             else:
-                result_text += f"{group}:\n\n"
-
-            result_text += "\n".join([f"{entry['word']}: {entry['description']}" for entry in word_list])
-
-            await context.bot.send_message(chat_id=chat_id, 
-                                           parse_mode=ParseMode.HTML, 
-                                           text=result_text)
-
+                description = await self.words_list.get_group_description(group, bot_language)
+                header = f"{group} - {description}:\n\n" if description else f"{group}:\n\n"
+                word_list = await self.words_list.get_words_by_language(group)
+                pages = paginate(header, [f"{word.word}: {word.description(bot_language)}" for word in word_list]) \
+                    or (header.rstrip(),)
+            self._list_pages[key] = pages
+        return pages
+
+    @staticmethod
+    def _group_token(group):
+        """
+        Short stable token of a preprocessed group name, Telegram limits callback data to 64 bytes
+        """
+        return hashlib.blake2b(group.encode('utf-8'), digest_size=6).hexdigest()
+
+    @classmethod
+    def _list_keyboard(cls, group, page, pages):
+        if pages <= 1:
+            return None
+        data = f"list:{cls._group_token(group) if group is not None else ''}:"
+        return InlineKeyboardMarkup([[
+            InlineKeyboardButton("‹", callback_data=data + str((page - 1) % pages)),
+            InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="list:-"),
+            InlineKeyboardButton("›", callback_data=data + str((page + 1) % pages)),
+        ]])
+
+    @serialized_per_chat
+    @authorized
+    async def debug_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Start sampling the event loop, or stop and reply with where it spent its time
+        """
+        chat_id = update.message.chat_id
+        if not self.profiler.running:
+            self.profiler.start()
+            await self._send(chat_id, self._localized_text(chat_id, "profile_started"))
+            return
+        self.profiler.stop()
+        report = self.profiler.report()
+        logging.info("Profile:\n" + report)
+        await self._send(chat_id, self._localized_text(chat_id, "profile_report",
+                                                       {"report": html.escape(report[:constants.MAX_MESSAGE_LENGTH])}))
 
     async def post_init(self, application: Application):
         """
         Post initialization hook for the bot.
         """
         await application.bot.set_my_commands(self.commands)
-
-    def run(self):
+        self.message_sender.start(application.bot)
+        self._restore_state()
+        self.quiz_scheduler.start()
+        application.job_queue.run_repeating(self._flush_state, interval=constants.STATE_FLUSH_INTERVAL, name="flush_state")
+        metrics.add_collector(self._collect_metrics)
+        if self.metrics_address:
+            self._metrics_server = await metrics.serve(*self.metrics_address)
+            logging.info(f"Serving metrics on {self.metrics_address[0]}:{self.metrics_address[1]}")
+        if self.metrics_log_interval:
+            application.job_queue.run_repeating(self._log_metrics, interval=self.metrics_log_interval, name="log_metrics")
+
+    async def post_shutdown(self, application: Application):
+        """
+        Post shutdown hook for the bot.
         """
-        Runs the bot indefinitely until the user presses Ctrl+C
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+        if self.profiler.running:
+            self.profiler.stop()
+        metrics.remove_collector(self._collect_metrics)
+        await self.quiz_scheduler.stop()
+        await self.message_sender.stop()
+        await self.words_list.close()
+        await self.state_store.close()
+
+    def build_application(self, base_url=None):
         """
-        application = ApplicationBuilder() \
+        Build the Application with the bot's handlers and lifecycle hooks.
+        Updates are processed concurrently, ordered per chat by serialized_per_chat.
+        base_url overrides the Bot API endpoint, e.g. to point the bot at a local fake server.
+        """
+        builder = ApplicationBuilder() \
             .token(self.telegram_token) \
             .post_init(self.post_init) \
-            .build()
+            .post_shutdown(self.post_shutdown)
+        if base_url:
+            builder = builder.base_url(base_url)
+        builder = builder.concurrent_updates(constants.CONCURRENT_UPDATES)
+        application = builder.build()
 
         for handler in self.handlers:
             application.add_handler(handler)
-        
-        application.run_polling()
+        return application
+
+    def run(self, webhook_url=None, listen="0.0.0.0", port=8443, url_path="", secret_token=None, base_url=None):
+        """
+        Runs the bot indefinitely until the user presses Ctrl+C.
+        Uses long polling unless webhook_url (the public URL Telegram should post updates to) is given,
+        then updates are received by an embedded web server on listen:port/url_path.
+        """
+        application = self.build_application(base_url)
+
+        if webhook_url:
+            application.run_webhook(listen=listen,
+                                    port=port,
+                                    url_path=url_path,
+                                    webhook_url=webhook_url.rstrip("/") + "/" + url_path,
+                                    secret_token=secret_token)
+        else:
+            application.run_polling()
@@ -0,0 +1,140 @@
+"""
+Compiled translations.json. Run it directly to print the validation report:
+
+    python bot/translation_catalog.py data/translations.json
+"""
+import json
+import logging
+import random
+import string
+import sys
+
+import constants
+
+
+class _Template:
+    __slots__ = ('text', 'fields')
+
+    def __init__(self, text, fields):
+        self.text = text
+        self.fields = fields  # frozenset of the named fields, empty for plain text
+
+    def render(self, format_params):
+        if not self.fields or not format_params:
+            return self.text
+        if self.fields <= format_params.keys():
+            return self.text.format_map(format_params)
+        # Leave the missing fields as they are written
+        return self.text.format_map(_KeepMissing(format_params))
+
+
+class _KeepMissing(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def _parse_template(text, where, literal):
+    """
+    Validate a template once. Texts whose braces are not named fields (e.g. JSON examples)
+    are listed in literal and always sent as they are.
+    """
+    fields = set()
+    try:
+        for _, field_name, _, _ in string.Formatter().parse(text):
+            if field_name is None:
+                continue
+            if not field_name.isidentifier():
+                literal.append(where)
+                return _Template(text, frozenset())
+            fields.add(field_name)
+    except ValueError:
+        literal.append(where)
+        return _Template(text, frozenset())
+    return _Template(text, frozenset(fields))
+
+
+class TranslationCatalog:
+    """
+    translations.json compiled at startup: every language gets a complete table with its
+    fallback chain (the language, its base language, the default bot language) resolved,
+    and every template is parsed and validated once. Problems are reported once at load.
+    """
+    def __init__(self, translations, default_language=constants.DEFAULT_BOT_LANGUAGE):
+        self.default_language = default_language
+        self.problems = []
+        self.literal = []  # templates sent unformatted
+        self.missing = {}  # language -> sorted keys taken from a fallback language
+        self._warned = set()
+
+        compiled = {
+            language: {key: self._compile(language, key, value) for key, value in texts.items()}
+            for language, texts in translations.items()
+        }
+        all_keys = set().union(*compiled.values()) if compiled else set()
+
+        self._tables = {}  # language -> key -> tuple of _Template
+        for language, own in compiled.items():
+            table = {}
+            for key in all_keys:
+                for fallback in self._fallback_chain(language, compiled):
+                    if key in compiled[fallback]:
+                        table[key] = compiled[fallback][key]
+                        break
+            self.missing[language] = sorted(all_keys - own.keys())
+            self._tables[language] = table
+        self._default_table = self._tables.get(default_language, {})
+        self.languages = tuple(translations)
+
+    def _fallback_chain(self, language, compiled):
+        chain = [language]
+        base = language.replace('-', '_').split('_', 1)[0]
+        if base != language and base in compiled:
+            chain.append(base)
+        if self.default_language in compiled and self.default_language not in chain:
+            chain.append(self.default_language)
+        return chain
+
+    def _compile(self, language, key, value):
+        variants = value if isinstance(value, list) else [value]
+        templates = tuple(_parse_template(text, f"{language}.{key}[{i}]", self.literal)
+                          for i, text in enumerate(variants) if isinstance(text, str))
+        if len(templates) != len(variants):
+            self.problems.append(f"{language}.{key}: only strings or lists of strings are supported")
+        return templates
+
+    def text(self, language, key, format_params=None):
+        """
+        A random variant of key in language, formatted with format_params
+        """
+        templates = self._tables.get(language, self._default_table).get(key)
+        if not templates:
+            if key not in self._warned:
+                self._warned.add(key)
+                logging.warning(f"No translation found for key '{key}' in translations.json")
+            return key
+        template = templates[0] if len(templates) == 1 else random.choice(templates)
+        return template.render(format_params)
+
+    def report(self):
+        """
+        Keys missing per language (served from a fallback), unformatted templates and problems
+        """
+        return {
+            "languages": list(self.languages),
+            "missing": {language: keys for language, keys in self.missing.items() if keys},
+            "literal": self.literal,
+            "problems": self.problems,
+        }
+
+    def log_report(self):
+        for language, keys in self.missing.items():
+            if keys:
+                logging.warning(f"Translations for '{language}' miss {len(keys)} keys, using fallbacks: {', '.join(keys)}")
+        for problem in self.problems:
+            logging.warning(f"Translation problem: {problem}")
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1] if len(sys.argv) > 1 else "./data/translations.json", 'r', encoding='utf-8') as f:
+        catalog = TranslationCatalog(json.load(f))
+    print(json.dumps(catalog.report(), ensure_ascii=False, indent=4))
@@ -1,47 +1,29 @@
-import logging
 import uuid
 import string
-import random
 import re
+import math
+import time
+from functools import lru_cache
 
 import constants
+from metrics import metrics
 
 
 def get_random_id():
     return str(uuid.uuid4())  # Returns a random UUID as a string
 
 
-def localized_text(translations, bot_language, key, format_params=None):
+def localize_description(descriptions, language):
     """
-    Return translated text for a key in specified bot_language.
-    Keys and translations can be found in the translations.json.
+    Pick a description for language, falling back to the default bot language
+    and then to any available description.
     """
-    try:
-        translated_text = translations[bot_language][key]
-    except KeyError:
-        logging.warning(f"No translation available for bot_language code '{bot_language}' and key '{key}'")
-        # Fallback to English if the translation is not available
-        if key in translations['english']:
-            translated_text = translations['english'][key]
-        else:
-            logging.warning(f"No english definition found for key '{key}' in translations.json")
-            # return key as text
-            return key
-        
-    if type(translated_text) == list:
-        # Select a random text from the list
-        translated_text = random.choice(translated_text)
-
-    # Format the translated text with provided parameters if any
-    if format_params:
-        try:
-            return translated_text.format(**format_params)
-        except KeyError as e:
-            logging.warning(f"Parameter '{e}' not provided for key '{key}' formatting")
-            return translated_text
-
-    return translated_text
-
+    description = descriptions.get(language)
+    if not description:
+        description = descriptions.get(constants.DEFAULT_BOT_LANGUAGE)
+    if not description and descriptions:
+        description = next(iter(descriptions.values()))
+    return description
 
 
 def quiz_start_args_parser(args_list):
@@ -75,21 +57,41 @@ def quiz_start_args_parser(args_list):
     return language, interval_time_units
 
 
-def preprocess_string(text: str) -> str:
-    text = text.lower()
-    # Remove punctuation
-    text = text.translate(str.maketrans('', '', string.punctuation))
+class TextNormalizer:
+    """
+    Normalizes text for answer comparison: lowercase, strip punctuation and,
+    for multi-word text, drop stopwords and spaces.
+    The translation table and stopword set are built once and results for short texts
+    (word keys and typical replies) are cached, longer texts are normalized uncached.
+    """
+    def __init__(self, stopwords, cache_size=constants.NORMALIZER_CACHE_SIZE,
+                 max_cached_length=constants.NORMALIZER_CACHE_MAX_LENGTH):
+        self._punctuation_table = str.maketrans('', '', string.punctuation)
+        self._stopwords = frozenset(word for words in stopwords.values() for word in words)
+        self._max_cached_length = max_cached_length
+        self._cached_normalize = lru_cache(maxsize=cache_size)(self._normalize)
 
-    # If the text is a single word, return it as it is
-    if len(text.split()) == 1:
-        return text
+    def normalize(self, text: str) -> str:
+        if len(text) > self._max_cached_length:
+            return self._normalize(text)
+        return self._cached_normalize(text)
 
-    # Remove stopwords
-    for _, stopwords in constants.stopwords.items():
-        text = ' '.join([word for word in text.split() if word not in stopwords])
-    text = text.replace("_", "")
-    text = text.replace(" ", "")
-    return text
+    def _normalize(self, text: str) -> str:
+        text = text.lower().translate(self._punctuation_table)
+        words = text.split()
+
+        # If the text is a single word, return it as it is
+        if len(words) == 1:
+            return text
+
+        return ''.join([word for word in words if word not in self._stopwords])
+
+
+normalizer = TextNormalizer(constants.stopwords)
+
+
+def preprocess_string(text: str) -> str:
+    return normalizer.normalize(text)
 
 
 def words_eq(s1, s2, preprocess=True) -> bool:
@@ -99,51 +101,118 @@ def words_eq(s1, s2, preprocess=True) -> bool:
     return s1 == s2
 
 
-def levenshtein_distance(s1: str, s2: str) -> int:
+def levenshtein_distance(s1: str, s2: str, max_distance=None) -> int:
+    """
+    Bit-parallel (Myers/Hyyrö) edit distance, one big-int bit vector per column.
+    With max_distance set, returns max_distance + 1 as soon as the distance is known to exceed it.
+    """
     if len(s1) < len(s2):
-        return levenshtein_distance(s2, s1)
+        s1, s2 = s2, s1
 
-    # len(s1) >= len(s2)
+    # len(s1) >= len(s2), s2 is the pattern encoded in the bit vectors
+    if max_distance is not None and len(s1) - len(s2) > max_distance:
+        return max_distance + 1
     if len(s2) == 0:
         return len(s1)
 
-    previous_row = range(len(s2) + 1)
-    for i, c1 in enumerate(s1):
-        current_row = [i + 1]
-        for j, c2 in enumerate(s2):
-            insertions = previous_row[j + 1] + 1 
-            deletions = current_row[j] + 1       
-            substitutions = previous_row[j] + (c1 != c2)
-            current_row.append(min(insertions, deletions, substitutions))
-        previous_row = current_row
-
-    return previous_row[-1]
+    pattern_masks = {}
+    for i, c in enumerate(s2):
+        pattern_masks[c] = pattern_masks.get(c, 0) | (1 << i)
+
+    mask = (1 << len(s2)) - 1
+    last_bit = 1 << (len(s2) - 1)
+    positive_vector, negative_vector = mask, 0
+    distance = len(s2)
+    remaining = len(s1)
+    for c in s1:
+        remaining -= 1
+        eq = pattern_masks.get(c, 0)
+        xv = eq | negative_vector
+        xh = (((eq & positive_vector) + positive_vector) ^ positive_vector) | eq
+        positive_horizontal = negative_vector | ~(xh | positive_vector)
+        negative_horizontal = positive_vector & xh
+        if positive_horizontal & last_bit:
+            distance += 1
+        elif negative_horizontal & last_bit:
+            distance -= 1
+        # The distance drops by at most one per remaining character
+        if max_distance is not None and distance - remaining > max_distance:
+            return max_distance + 1
+        positive_horizontal = ((positive_horizontal << 1) | 1) & mask
+        negative_horizontal = (negative_horizontal << 1) & mask
+        positive_vector = (negative_horizontal | ~(xv | positive_horizontal)) & mask
+        negative_vector = positive_horizontal & xv
+
+    return distance
+
+
+CLOSENESS_KEYS = ((90, "closeness90"), (80, "closeness80"), (70, "closeness70"), (50, "closeness50"))
+# Below this every similarity maps to "closeness0", so it does not have to be exact
+CLOSENESS_MIN_SIMILARITY = CLOSENESS_KEYS[-1][0]
+
+
+def _similarity(s1: str, s2: str, min_similarity) -> float:
+    if s1 == s2:
+        return 100.0
+    max_len = max(len(s1), len(s2))
+    max_distance = None
+    if min_similarity is not None:
+        # similarity > min_similarity  <=>  distance < max_len * (100 - min_similarity) / 100
+        max_distance = max(math.ceil(max_len * (100 - min_similarity) / 100) - 1, 0)
+    distance = levenshtein_distance(s1, s2, max_distance)
+    return (1 - distance / max_len) * 100
 
 
-def similarity_percentage(s1: str, s2: str, preprocess=True) -> float:
+def similarity_percentage(s1: str, s2: str, preprocess=True, min_similarity=None) -> float:
+    """
+    Similarity of two strings in percent.
+    With min_similarity set, any value at or below it is returned only as an upper bound.
+    """
     if preprocess:
         s1 = preprocess_string(s1)
         s2 = preprocess_string(s2)
-    distance = levenshtein_distance(s1, s2)
-    max_len = max(len(s1), len(s2))
-    similarity = (1 - distance / max_len) * 100
+    started = time.perf_counter()
+    similarity = _similarity(s1, s2, min_similarity)
+    metrics.observe("similarity", time.perf_counter() - started)
     return similarity
 
 
 def get_closeness_key(similarity: float) -> str:
-    if similarity > 90:
-        return "closeness90"
-    elif similarity > 80:
-        return "closeness80"
-    elif similarity > 70:
-        return "closeness70"
-    elif similarity > 50:
-        return "closeness50"
-    else:
-        return "closeness0"
-    
+    for threshold, key in CLOSENESS_KEYS:
+        if similarity > threshold:
+            return key
+    return "closeness0"
+
 
 def get_hint_text(text: str, multiplier: int) -> str:
     percentage_to_give = constants.HINT_ITERATION_PERCENTAGE * multiplier
     hint_text = text[:min(len(text), max(int(len(text) * percentage_to_give / 100), 1))]
     return hint_text
+
+
+def _truncate(text, length):
+    return text if len(text) <= length else text[:length - 1] + "…"
+
+
+def paginate(header: str, entries, separator="\n", max_entries=constants.LIST_PAGE_SIZE,
+             max_length=constants.LIST_PAGE_LENGTH):
+    """
+    Split entries into page texts of at most max_entries entries and max_length characters,
+    each starting with header. Headers over half of max_length and entries that would not
+    fit on a page alone are cut short. Returns a tuple of pages, empty if there are no entries.
+    """
+    header = _truncate(header, max_length // 2)
+    pages = []
+    page = []
+    length = len(header)
+    for entry in entries:
+        entry = _truncate(entry, max_length - len(header))
+        if page and (len(page) >= max_entries or length + len(separator) + len(entry) > max_length):
+            pages.append(header + separator.join(page))
+            page = []
+            length = len(header)
+        page.append(entry)
+        length += len(separator) + len(entry)
+    if page:
+        pages.append(header + separator.join(page))
+    return tuple(pages)
@@ -0,0 +1,289 @@
+"""
+Bulk import and export of words, run from the repository root like main.py and on the
+backend selected by WORDS_BACKEND:
+
+    python bot/words_cli.py import words.ndjson
+    python bot/words_cli.py import words.csv --workers 8
+    python bot/words_cli.py export english_b2 korean > words.ndjson
+    python bot/words_cli.py export --format csv -o words.csv
+
+NDJSON records are /add_word entries, one per line:
+{"word": ..., "language": ..., "descriptions": {locale: text}, "quiz_type": ...}.
+CSV files start with a header naming the word, language and optionally quiz_type columns,
+every other column holds the descriptions in the locale it is named after.
+
+The input is read in chunks validated by worker processes and added to the words list in
+batches of --batch-size records, each written by one flush (one transaction with sqlite),
+so only the chunks in flight are held in memory besides the words list itself.
+
+A running bot keeps the json and lazy corpora in memory and rewrites words.json with its next
+flush, which would drop an import made meanwhile. It holds data/words.lock, and imports into
+these backends refuse to start while it does (and a bot started during an import waits for it).
+Stop the bot, import, then start it again. The sqlite backend commits every batch in a transaction
+the running bot reads, so it can import while the bot runs and new words are quizzed right away.
+Exports only read and work with every backend at any time.
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+import constants
+from main import create_words_list, lock_words
+
+_CSV_COLUMNS = ("word", "language", "quiz_type")
+
+
+def validate_record(record):
+    """
+    The word entry dict of a decoded record, raises ValueError if it is not one
+    """
+    if not isinstance(record, dict):
+        raise ValueError("not an object")
+    word = record.get("word")
+    if not isinstance(word, str) or not word.strip():
+        raise ValueError("'word' must be a non-empty string")
+    language = record.get("language")
+    if not isinstance(language, str) or not language.strip():
+        raise ValueError("'language' must be a non-empty string")
+    descriptions = record.get("descriptions", {})
+    if not isinstance(descriptions, dict) or not all(isinstance(text, str) for text in descriptions.values()):
+        raise ValueError("'descriptions' must map locales to strings")
+    quiz_type = record.get("quiz_type", constants.DEFAULT_QUIZ_TYPE)
+    if not isinstance(quiz_type, str):
+        raise ValueError("'quiz_type' must be a string")
+    return {"word": word, "language": language, "descriptions": descriptions, "quiz_type": quiz_type}
+
+
+def _validate_lines(chunk):
+    """
+    Worker task: (first line number, NDJSON lines) -> (word entries, [(line number, error)])
+    """
+    first_line, lines = chunk
+    records = []
+    errors = []
+    for line_number, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+        try:
+            records.append(validate_record(json.loads(line)))
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+    return records, errors
+
+
+def _validate_rows(chunk):
+    """
+    Worker task: (header, [(line number, CSV row)]) -> (word entries, [(line number, error)])
+    """
+    header, rows = chunk
+    records = []
+    errors = []
+    for line_number, row in rows:
+        if not any(row):
+            continue
+        if len(row) != len(header):
+            errors.append((line_number, f"expected {len(header)} columns, got {len(row)}"))
+            continue
+        record = {"descriptions": {}}
+        for column, value in zip(header, row):
+            if column in _CSV_COLUMNS:
+                if value:
+                    record[column] = value
+            elif value:
+                record["descriptions"][column] = value
+        try:
+            records.append(validate_record(record))
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+    return records, errors
+
+
+def _read_chunks(f, file_format, chunk_size):
+    """
+    (validation task, payload) per chunk_size records of the input, read lazily
+    """
+    if file_format == "csv":
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [column.strip() for column in header]
+        if "word" not in header or "language" not in header:
+            raise ValueError("The CSV header must name the 'word' and 'language' columns")
+        rows = ((reader.line_num, row) for row in reader)
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            yield _validate_rows, (header, chunk)
+    else:
+        line_number = 1
+        while chunk := list(itertools.islice(f, chunk_size)):
+            yield _validate_lines, (line_number, chunk)
+            line_number += len(chunk)
+
+
+def _validated(chunks, workers):
+    """
+    Validate the chunks in worker processes, yielding their results in input order.
+    At most 2 chunks per worker are in flight, which bounds the memory used by the pipeline.
+    """
+    if workers <= 1:
+        for task, payload in chunks:
+            yield task(payload)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        for task, payload in chunks:
+            pending.append(pool.apply_async(task, (payload,)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+async def import_words(words, f, file_format, workers, batch_size, chunk_size=constants.IMPORT_CHUNK_SIZE):
+    """
+    Add every valid record of the open file f to the words list, returns a summary dict
+    """
+    started = time.perf_counter()
+    summary = {"records": 0, "added": 0, "merged": 0, "rejected": 0, "invalid": 0}
+    batch = []
+
+    async def add_batch():
+        result = await words.add_words(batch)
+        await words.flush()
+        for word, existing, similarity in result.rejected:
+            print(f"{word}: near duplicate of {existing} ({similarity:.0f}%)", file=sys.stderr)
+        summary["added"] += len(result.added)
+        summary["merged"] += len(result.merged)
+        summary["rejected"] += len(result.rejected)
+        logging.info(f"Imported {summary['records']} records, {summary['added']} added")
+        batch.clear()
+
+    for records, errors in _validated(_read_chunks(f, file_format, chunk_size), workers):
+        for line_number, error in errors:
+            print(f"line {line_number}: {error}", file=sys.stderr)
+        summary["invalid"] += len(errors)
+        summary["records"] += len(records) + len(errors)
+        batch.extend(records)
+        if len(batch) >= batch_size:
+            await add_batch()
+    if batch:
+        await add_batch()
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+async def _write_records(words, groups, out):
+    """
+    Write the words of groups to out as NDJSON records, streamed group by group.
+    Returns (number of words, locales of their descriptions).
+    """
+    count = 0
+    locales = set()
+    for group in groups:
+        async for word in words.iter_words(group):
+            descriptions = word.descriptions
+            locales.update(descriptions)
+            record = {"word": word.word, "language": group, "descriptions": descriptions, "quiz_type": word.quiz_type}
+            out.write(json.dumps(record, ensure_ascii=False))
+            out.write("\n")
+            count += 1
+    return count, locales
+
+
+async def export_words(words, groups, file_format, out):
+    """
+    Write the words of groups (every group if empty) to out, returns the number of words.
+    Groups are streamed from the words list, the lazy backend does not load them.
+    """
+    groups = groups or await words.get_languages()
+    if file_format != "csv":
+        return (await _write_records(words, groups, out))[0]
+    # The locale columns have to be known before the first row, the words are read once
+    # into a temporary NDJSON file while collecting them
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as records:
+        count, locales = await _write_records(words, groups, records)
+        locales = sorted(locales)
+        records.seek(0)
+        writer = csv.writer(out)
+        writer.writerow(_CSV_COLUMNS + tuple(locales))
+        for line in records:
+            record = json.loads(line)
+            descriptions = record["descriptions"]
+            writer.writerow([record["word"], record["language"], record["quiz_type"]] +
+                            [descriptions.get(locale, "") for locale in locales])
+    return count
+
+
+def _file_format(path, file_format):
+    if file_format:
+        return file_format
+    return "csv" if path and path.lower().endswith(".csv") else "ndjson"
+
+
+async def run(args):
+    words_lock = None
+    if args.command == "import" and os.getenv('WORDS_BACKEND', 'json') != 'sqlite':
+        words_lock = lock_words(blocking=False)
+        if words_lock is None:
+            sys.exit("The bot is running and would overwrite the import with its next flush, "
+                     "stop it first or use WORDS_BACKEND=sqlite")
+    words = create_words_list(args.duplicate_similarity)
+    try:
+        if args.command == "import":
+            file_format = _file_format(args.file, args.format)
+            # newline='' lets the csv module handle line breaks inside quoted fields
+            with open(args.file, 'r', encoding='utf-8', newline='') as f:
+                summary = await import_words(words, f, file_format, args.workers, args.batch_size)
+            print(json.dumps(summary, indent=4))
+        else:
+            file_format = _file_format(args.output, args.format)
+            if args.output:
+                with open(args.output, 'w', encoding='utf-8', newline='') as out:
+                    count = await export_words(words, args.groups, file_format, out)
+            else:
+                count = await export_words(words, args.groups, file_format, sys.stdout)
+            logging.info(f"Exported {count} words")
+    finally:
+        await words.close()
+        if words_lock is not None:
+            words_lock.close()
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="add the words of an NDJSON or CSV file")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=("ndjson", "csv"), help="default: from the file extension")
+    import_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                               help="validation processes, 1 validates in this process")
+    import_parser.add_argument("--batch-size", type=int, default=constants.IMPORT_BATCH_SIZE,
+                               help="records added and written per flush")
+    import_parser.add_argument("--duplicate-similarity", type=float,
+                               help="overrides DUPLICATE_SIMILARITY, 100 only skips exact duplicates and is much faster")
+    export_parser = commands.add_parser("export", help="write the words of some or all groups")
+    export_parser.add_argument("groups", nargs="*")
+    export_parser.add_argument("--format", choices=("ndjson", "csv"), help="default: from the output extension")
+    export_parser.add_argument("-o", "--output", help="default: stdout")
+    export_parser.set_defaults(duplicate_similarity=None)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
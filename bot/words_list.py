@@ -1,148 +1,579 @@
+import asyncio
+import hashlib
 import json
+import logging
 import os
+import random
+import sys
+import tempfile
+from typing import NamedTuple
 import constants
-from utils import preprocess_string
+from metrics import metrics
+from duplicate_index import DuplicateIndex
+from utils import preprocess_string, localize_description
+
+
+class DescriptionTable:
+    """
+    Word descriptions of a group stored by column, one list per locale indexed by row,
+    instead of one dict per word
+    """
+    __slots__ = ('columns', 'size')
+
+    def __init__(self):
+        self.columns = {}  # interned locale -> list of description or None
+        self.size = 0
+
+    def add_row(self, descriptions):
+        row = self.size
+        self.size += 1
+        for locale, description in descriptions.items():
+            column = self.columns.get(locale)
+            if column is None:
+                # The dict is replaced rather than extended, a flush may iterate it from a worker thread
+                column = [None] * row
+                self.columns = {**self.columns, sys.intern(locale): column}
+            column.append(description)
+        for column in self.columns.values():
+            if len(column) < self.size:
+                column.append(None)
+        return row
+
+    def set(self, row, locale, description):
+        column = self.columns.get(locale)
+        if column is None:
+            column = [None] * self.size
+            self.columns = {**self.columns, sys.intern(locale): column}
+        column[row] = description
+
+    def get(self, row, locale):
+        column = self.columns.get(locale)
+        return column[row] if column is not None else None
+
+    def row(self, row):
+        return {locale: column[row] for locale, column in self.columns.items() if column[row] is not None}
+
+    def localized(self, row, language):
+        """
+        Same fallback as localize_description: language, the default bot language, then any description
+        """
+        description = self.get(row, language)
+        if not description:
+            description = self.get(row, constants.DEFAULT_BOT_LANGUAGE)
+        if not description:
+            description = next((column[row] for column in self.columns.values() if column[row] is not None), None)
+        return description
+
+
+class Word:
+    """
+    Compact word entry, its descriptions live in the group's DescriptionTable
+    """
+    __slots__ = ('word', 'key', 'quiz_type', 'table', 'row')
+
+    def __init__(self, word, quiz_type, descriptions, table=None, key=None):
+        self.word = word
+        self.key = key if key is not None else preprocess_string(word)
+        self.quiz_type = sys.intern(quiz_type)
+        self.table = table if table is not None else DescriptionTable()
+        self.row = self.table.add_row(descriptions)
+
+    @classmethod
+    def from_dict(cls, word_data, table=None, key=None):
+        return cls(word_data["word"], word_data.get("quiz_type", constants.DEFAULT_QUIZ_TYPE),
+                   word_data.get("descriptions", {}), table, key)
+
+    @property
+    def descriptions(self):
+        return self.table.row(self.row)
+
+    def description(self, language):
+        return self.table.localized(self.row, language)
+
+    def merge_descriptions(self, descriptions):
+        """
+        Add the descriptions of locales this word has none for, returns True if any was added
+        """
+        merged = False
+        for locale, description in descriptions.items():
+            if description and self.table.get(self.row, locale) is None:
+                self.table.set(self.row, locale, description)
+                merged = True
+        return merged
+
+    def to_dict(self):
+        return {"word": self.word, "descriptions": self.descriptions, "quiz_type": self.quiz_type}
+
+    def __eq__(self, other):
+        if not isinstance(other, Word):
+            return NotImplemented
+        return (self.word, self.quiz_type, self.descriptions) == (other.word, other.quiz_type, other.descriptions)
+
+    def __hash__(self):
+        return hash((self.word, self.quiz_type))
+
+    def __repr__(self):
+        return f"Word({self.to_dict()!r})"
+
+
+class QuizQuestion(NamedTuple):
+    """
+    A word localized for one bot language, ready to be asked
+    """
+    word: str
+    description: str
+    quiz_type: str
+    answer_key: str
+
+    @classmethod
+    def from_word(cls, word, bot_language):
+        return cls(word.word, word.description(bot_language), word.quiz_type, word.key)
+
+
+class AddResult(NamedTuple):
+    """
+    Outcome of adding words: the words added, the exact duplicates whose new descriptions were merged
+    into the existing word, and the near duplicates rejected as (word, existing word, similarity)
+    """
+    added: list
+    merged: list
+    rejected: list
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [])
+
+
+def read_changed_word_sets(file_sets_path, imported_sets, has_group):
+    """
+    Yield (file, record, word_set) for the word sets in file_sets_path that differ from their record in imported_sets.
+    Sets are compared by mtime/size and content hash, unchanged ones are not even read.
+    word_set is None when only the file metadata changed, the caller stores record as the new manifest entry.
+    """
+    for file in sorted(os.listdir(file_sets_path)):
+        if not file.endswith(".json"):
+            continue
+        file_path = os.path.join(file_sets_path, file)
+        stat = os.stat(file_path)
+        record = imported_sets.get(file)
+        if record and not all(has_group(group) for group in record["groups"]):
+            # The corpus was reset or edited by hand since this set was imported
+            record = None
+        if record and record["mtime_ns"] == stat.st_mtime_ns and record["size"] == stat.st_size:
+            continue
+
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if record and record["sha256"] == digest:
+            word_set = None
+            groups = record["groups"]
+        else:
+            word_set = json.loads(content.decode('utf-8'))
+            groups = list(word_set)
+
+        yield file, {"sha256": digest, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "groups": groups}, word_set
+
+
+def log_rejected(rejected):
+    if rejected:
+        logging.info(f"Skipped {len(rejected)} near duplicates from word sets: "
+                     + ", ".join(f"{word} ~ {existing} ({similarity:.0f}%)" for word, existing, similarity in rejected))
 
 
 class WordsList:
-    def __init__(self, filepath: str, file_sets_path: str):
+    """
+    Resident, indexed word corpus persisted to a JSON file.
+    Every mutation is applied synchronously between awaits and removals replace the
+    group word lists instead of editing them, so handlers running concurrently on the
+    event loop never observe a half-applied change.
+    """
+    def __init__(self, filepath: str, file_sets_path: str, duplicate_similarity=constants.DUPLICATE_SIMILARITY):
         """
-        Save filepath and inject the data from file_sets_path
+        Load filepath and import the word sets from file_sets_path that changed since the last start.
+        New words at least duplicate_similarity percent similar to a word of their group are rejected.
         """
         self.filepath = filepath
-        # Iterate over all json files in the directory
-        original_words = self._load_json_file(filepath)
-        for file in os.listdir(file_sets_path):
-            if not file.endswith(".json"):
-                continue
-            file_path = os.path.join(file_sets_path, file)
-            additional_words = self._load_json_file(file_path)
-            for language, data in additional_words.items():
-                if language not in original_words:
-                    original_words[language] = data
-                else:
-                    original_words[language]["words"].extend(data["words"])
-        self._save_json_file(filepath, original_words)
+        self.file_sets_path = file_sets_path
+        self.duplicate_similarity = duplicate_similarity
+        self.imported_sets_path = os.path.splitext(filepath)[0] + "_imported_sets.json"
+
+        # Write-behind state, see _save_words
+        self._dirty = False
+        self._flush_task = None
+        self._flush_lock = None  # Created on first use, asyncio primitives bind to the running loop
+
+        # The whole corpus stays resident, reads are served from the indexes below
+        with metrics.timer("words_io", operation="load"):
+            self._words = self._load_json_file(filepath)
+        duplicates = self._build_indexes()
+        imported = self._import_word_sets()
+        if duplicates or imported.added or imported.merged:
+            logging.info(f"Dropped {duplicates} duplicate words, imported {len(imported.added)} new words from word sets")
+            self._save_json_file(filepath, self._words)
+
+    def __getstate__(self):
+        """
+        Pickled by the startup snapshot without the write-behind state and the caches built on demand
+        """
+        state = self.__dict__.copy()
+        state.update(_dirty=False, _flush_task=None, _flush_lock=None, _question_pools={}, _duplicate_indexes={})
+        return state
 
     @staticmethod
     def _load_json_file(file_path):
         with open(file_path, 'r', encoding='utf-8') as file:
             return json.load(file)
-        
+
     @staticmethod
     def _save_json_file(file_path, data):
-        with open(file_path, 'w', encoding='utf-8') as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
+        """
+        Write data compactly to a temp file next to file_path and atomically rename it over
+        """
+        directory = os.path.dirname(os.path.abspath(file_path))
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, suffix='.tmp', delete=False) as file:
+            try:
+                json.dump(data, file, ensure_ascii=False, separators=(',', ':'), default=Word.to_dict)
+                file.flush()
+                os.fsync(file.fileno())
+            except BaseException:
+                file.close()
+                os.unlink(file.name)
+                raise
+        os.replace(file.name, file_path)
+
+    def _import_word_sets(self):
+        """
+        Merge new or modified word sets into the corpus, skipping words the group already has
+        or near duplicates of them. Returns an AddResult.
+        """
+        if os.path.exists(self.imported_sets_path):
+            imported_sets = self._load_json_file(self.imported_sets_path)
+        else:
+            imported_sets = {}
+
+        imported = AddResult.empty()
+        manifest_changed = False
+        for file, record, word_set in read_changed_word_sets(self.file_sets_path, imported_sets,
+                                                             lambda group: group in self._words):
+            for language, data in (word_set or {}).items():
+                group = self._ensure_group(language)
+                if not self._words[group].get("description"):
+                    self._words[group]["description"] = data.get("description", {})
+                    self._index_description(group, self._words[group])
+                for word in data["words"]:
+                    self._add_new_word(group, word, imported)
+            imported_sets[file] = record
+            manifest_changed = True
 
-    async def _load_words(self):
-        return self._load_json_file(self.filepath)
+        if manifest_changed:
+            self._save_json_file(self.imported_sets_path, imported_sets)
+        log_rejected(imported.rejected)
+        return imported
 
-    async def _save_words(self, words):
-        self._save_json_file(self.filepath, words)
+    def _build_indexes(self):
+        # preprocessed group name -> group name
+        self._group_index = {}
+        # preprocessed word -> list of (group name, word entry)
+        self._word_index = {}
+        # group name -> {locale: description} with the fallback already resolved
+        self._localized_descriptions = {}
+        # group name -> {bot language: tuple of QuizQuestion}, built lazily and dropped on any group change
+        self._question_pools = {}
+        # group name -> DescriptionTable of its words
+        self._tables = {}
+        # group name -> DuplicateIndex of its word keys, built on the first addition to the group
+        self._duplicate_indexes = {}
+        duplicates = 0
+        for language, lang_data in self._words.items():
+            self._group_index[preprocess_string(language)] = language
+            self._tables[language] = DescriptionTable()
+            words = lang_data["words"]
+            lang_data["words"] = []
+            for word in words:
+                if not self._append_word(language, word, deduplicate=True):
+                    duplicates += 1
+            self._index_description(language, lang_data)
+        return duplicates
+
+    def _ensure_group(self, language):
+        if language not in self._words:
+            self._words[language] = {"description": {}, "words": []}
+            self._tables[language] = DescriptionTable()
+            self._group_index[preprocess_string(language)] = language
+            self._index_description(language, self._words[language])
+        return language
+
+    def _append_word(self, language, word_data, deduplicate=False):
+        """
+        Add a word entry dict to a group and the word index, returns False if it was a duplicate
+        """
+        key = preprocess_string(word_data["word"])
+        matches = self._word_index.setdefault(key, [])
+        if deduplicate and any(group == language for group, _ in matches):
+            return False
+        word = Word.from_dict(word_data, self._tables[language], key)
+        self._words[language]["words"].append(word)
+        matches.append((language, word))
+        self._question_pools.pop(language, None)
+        duplicates = self._duplicate_indexes.get(language)
+        if duplicates is not None:
+            duplicates.add(key)
+        return True
+
+    def _duplicates(self, language):
+        duplicates = self._duplicate_indexes.get(language)
+        if duplicates is None:
+            duplicates = self._duplicate_indexes[language] = DuplicateIndex(
+                (word.key for word in self._words[language]["words"]), self.duplicate_similarity)
+        return duplicates
+
+    def _add_new_word(self, language, word_data, result):
+        """
+        Add a word entry dict to a group unless the group has it or a near duplicate of it,
+        recording the outcome in the AddResult result
+        """
+        key = preprocess_string(word_data["word"])
+        match = self._duplicates(language).find(key)
+        if match is None:
+            self._append_word(language, word_data)
+            result.added.append(word_data["word"])
+            return
+        existing_key, similarity = match
+        existing = next(word for group, word in self._word_index[existing_key] if group == language)
+        if existing_key != key:
+            result.rejected.append((word_data["word"], existing.word, similarity))
+        else:
+            if existing.merge_descriptions(word_data.get("descriptions", {})):
+                self._question_pools.pop(language, None)
+            result.merged.append(existing.word)
+
+    def _index_description(self, language, lang_data):
+        self._question_pools.pop(language, None)
+        descriptions = lang_data.get("description", {})
+        self._localized_descriptions[language] = {
+            locale: localize_description(descriptions, locale)
+            for locale in set(descriptions) | {constants.DEFAULT_BOT_LANGUAGE}
+        }
+
+    def _find_group(self, language):
+        return self._group_index.get(preprocess_string(language))
+
+    async def _save_words(self):
+        """
+        Mark the corpus as modified, all mutations within WORDS_FLUSH_DELAY are written by one flush
+        """
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(constants.WORDS_FLUSH_DELAY)
+        await self.flush()
+
+    async def flush(self):
+        """
+        Write pending modifications to the file, serializing in a worker thread off the event loop
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            # Group lists are copied so mutations during the write do not race with json.dump,
+            # word entries and description dicts are replaced rather than mutated
+            snapshot = {
+                language: {"description": lang_data.get("description", {}), "words": list(lang_data["words"])}
+                for language, lang_data in self._words.items()
+            }
+            loop = asyncio.get_running_loop()
+            try:
+                with metrics.timer("words_io", operation="flush"):
+                    await loop.run_in_executor(None, self._save_json_file, self.filepath, snapshot)
+            except Exception:
+                self._dirty = True
+                logging.exception(f"Failed to save words to {self.filepath}")
+
+    async def close(self):
+        """
+        Cancel the scheduled flush and write pending modifications immediately
+        """
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+    async def reload(self):
+        """
+        Re-read the corpus after another process modified the file
+        """
+        if self._dirty:
+            logging.warning(f"Discarding unsaved word changes, {self.filepath} was modified by another process")
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._dirty = False
+        loop = asyncio.get_running_loop()
+        with metrics.timer("words_io", operation="load"):
+            self._words = await loop.run_in_executor(None, self._load_json_file, self.filepath)
+        self._build_indexes()
+
+    def word_counts(self):
+        """
+        Number of words per group
+        """
+        return {language: len(lang_data["words"]) for language, lang_data in self._words.items()}
 
     async def add_word(self, json_word_data):
+        """
+        Add one word entry or a list of them, returns an AddResult
+        """
         words_data = json.loads(json_word_data)
         if isinstance(words_data, list):
             # Mass word addition
-            await self._add_multiple_words(words_data)
+            return await self.add_words(words_data)
         elif isinstance(words_data, dict):
             # Single word addition
-            await self._add_single_word(words_data)
+            return await self._add_single_word(words_data)
         else:
             raise ValueError("Invalid input format")
 
-    async def _add_single_word(self, word_data):
-        language = word_data["language"]
-        if "quiz_tyoe" in word_data:
-            quiz_type = word_data["quiz_type"]
-        else:
-            quiz_type = constants.DEFAULT_QUIZ_TYPE
-        words = await self._load_words()
-
-        if language not in words:
-            words[language] = {"description": {}, "words": []}
-
+    @staticmethod
+    def _make_word(word_data):
         new_word = {
             "word": word_data["word"],
             "descriptions": word_data["descriptions"],
-            "quiz_type": quiz_type
+            "quiz_type": word_data.get("quiz_type", constants.DEFAULT_QUIZ_TYPE)
         }
+        return word_data["language"], new_word
 
-        words[language]["words"].append(new_word)
-        await self._save_words(words)
+    async def _add_single_word(self, word_data):
+        return await self.add_words([word_data])
 
-    async def _add_multiple_words(self, words_data):
-        for word_data in words_data:
-            await self._add_single_word(word_data)
+    async def add_words(self, words_data):
+        """
+        Add word entry dicts ("word", "language", "descriptions" and optionally "quiz_type"), returns an AddResult
+        """
+        # Validate every entry before touching the corpus, then persist once
+        new_words = [self._make_word(word_data) for word_data in words_data]
+        result = AddResult.empty()
+        for language, new_word in new_words:
+            self._add_new_word(self._ensure_group(language), new_word, result)
+        if result.added or result.merged:
+            await self._save_words()
+        return result
 
     async def remove_word(self, word_text):
-        words = await self._load_words()
-        preprocessed_text = preprocess_string(word_text)
+        key = preprocess_string(word_text)
+        matches = self._word_index.pop(key, None)
+        if not matches:
+            return False
 
-        for _, lang_data in words.items():
-            lang_data["words"] = [word for word in lang_data["words"] if preprocess_string(word['word']) != preprocessed_text]
+        removed_ids = {}
+        for language, word in matches:
+            removed_ids.setdefault(language, set()).add(id(word))
+        # The description table rows of removed words stay unused until the next load
+        for language, ids in removed_ids.items():
+            lang_data = self._words[language]
+            lang_data["words"] = [word for word in lang_data["words"] if id(word) not in ids]
+            self._question_pools.pop(language, None)
+            if language in self._duplicate_indexes:
+                self._duplicate_indexes[language].discard(key)
 
-        await self._save_words(words)
+        await self._save_words()
         return True
 
     async def get_word_by_text(self, word_text):
-        preprocessed_text = preprocess_string(word_text)
-        words = await self._load_words()
-
-        for lang_data in words.values():
-            for word in lang_data["words"]:
-                if preprocess_string(word['word']) == preprocessed_text:
-                    return word
+        matches = self._word_index.get(preprocess_string(word_text))
+        if matches:
+            return matches[0][1]
         return None
 
     async def get_words_by_text(self, word_text=None):
-        words = await self._load_words()
-        if word_text is not None:
-            preprocessed_text = preprocess_string(word_text)
-            for _, lang_data in words.items():
-                lang_data["words"] = [word for word in lang_data["words"] if preprocess_string(word['word']) != preprocessed_text]
-        return words
+        if word_text is None:
+            return self._words
+        preprocessed_text = preprocess_string(word_text)
+        excluded = {id(word) for _, word in self._word_index.get(preprocessed_text, [])}
+        return {
+            language: {**lang_data, "words": [word for word in lang_data["words"] if id(word) not in excluded]}
+            for language, lang_data in self._words.items()
+        }
 
     async def get_words_by_language(self, language=None):
-        words = await self._load_words()
+        """
+        Return the resident word entries of a group (or of all groups), callers must not mutate them
+        """
         if language is not None:
-            preprocessed_language = preprocess_string(language)
-            for lang, lang_data in words.items():
-                if preprocess_string(lang) == preprocessed_language:
-                    return lang_data["words"]
-            return []
-        return [word for lang_data in words.values() for word in lang_data["words"]]
+            group = self._find_group(language)
+            if group is None:
+                return []
+            return self._words[group]["words"]
+        return [word for lang_data in self._words.values() for word in lang_data["words"]]
 
-    async def get_languages(self):
-        words = await self._load_words()
-        return list(words.keys())
-
-    async def get_group_description(self, language):
-        words = await self._load_words()
-        preprocessed_language = preprocess_string(language)
-        group_data = None
-        for lang, lang_data in words.items():
-            if preprocess_string(lang) == preprocessed_language:
-                group_data = lang_data
-                break
-        if group_data:
-            descriptions = group_data.get("description", {})
-            return descriptions
+    async def iter_words(self, language):
+        """
+        Yield the words of a group one by one
+        """
+        for word in await self.get_words_by_language(language):
+            yield word
+
+    async def get_random_word(self, language):
+        group = self._find_group(language)
+        if group is None or not self._words[group]["words"]:
+            return None
+        return random.choice(self._words[group]["words"])
+
+    async def get_random_question(self, language, bot_language):
+        """
+        Return a random QuizQuestion of a group localized for bot_language, or None if the group is empty
+        """
+        group = self._find_group(language)
+        if group is None:
+            return None
+        pools = self._question_pools.setdefault(group, {})
+        pool = pools.get(bot_language)
+        if pool is None:
+            pool = pools[bot_language] = tuple(QuizQuestion.from_word(word, bot_language)
+                                               for word in self._words[group]["words"])
+        if not pool:
+            return None
+        return random.choice(pool)
+
+    async def get_question_by_key(self, language, word_key, bot_language):
+        """
+        Return the QuizQuestion of the word with the preprocessed text word_key in a group, or None
+        """
+        group = self._find_group(language)
+        for word_group, word in self._word_index.get(word_key, ()):
+            if word_group == group:
+                return QuizQuestion.from_word(word, bot_language)
         return None
 
+    async def get_languages(self):
+        return list(self._words.keys())
+
+    async def get_group_description(self, language, bot_language=None):
+        """
+        Return the description dict of a group, or the resolved description
+        for bot_language if one is given
+        """
+        group = self._find_group(language)
+        if group is None:
+            return None
+        if bot_language is None:
+            return self._words[group].get("description", {})
+        localized = self._localized_descriptions[group]
+        if bot_language in localized:
+            return localized[bot_language]
+        return localized[constants.DEFAULT_BOT_LANGUAGE]
+
     async def update_description(self, json_word_data):
         word_data = json.loads(json_word_data)
         language = word_data["language"]
         description = word_data["descriptions"]
-        words = await self._load_words()
-        preprocessed_language = preprocess_string(language)
-        group_data = None
-        for lang, lang_data in words.items():
-            if preprocess_string(lang) == preprocessed_language:
-                group_data = lang_data
-                break
-        if group_data:
-            group_data["description"] = description
-            await self._save_words(words)
+        group = self._find_group(language)
+        if group:
+            self._words[group]["description"] = description
+            self._index_description(group, self._words[group])
+            await self._save_words()
             return True
         return False
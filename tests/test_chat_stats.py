@@ -0,0 +1,45 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+
+from chat_stats import ChatStats  # noqa: E402
+from state_store import StateStore, SQLiteStateStore  # noqa: E402
+
+
+def test_wrong_replies_count_for_their_senders():
+    stats = ChatStats(StateStore())
+    # Users 2 and 3 replied wrongly before user 1 answered on their second reply
+    stats.record(-100, 1, "ann", True, 2, missed_by={2: ("bob", 3), 3: ("cid", 1)})
+
+    ann, ann_rank, players = stats.user(-100, 1)
+    assert (ann.correct, ann.incorrect, ann.tries, ann_rank, players) == (1, 0, 2, 1, 3)
+    bob = stats.user(-100, 2)[0]
+    assert (bob.correct, bob.incorrect, bob.tries, bob.streak) == (0, 1, 3, 0)
+    assert [name for _, name, _ in stats.top(-100)] == ["ann", "bob", "cid"]
+
+    chat = stats.chat(-100)
+    assert (chat.correct, chat.incorrect, chat.tries) == (1, 0, 6)
+
+
+def test_evicted_chats_are_reloaded_with_their_unsaved_changes(tmp_path):
+    async def run(store):
+        stats = ChatStats(store, cache_size=1)
+        stats.record(-100, 1, "ann", True, 1)
+        stats.record(-100, 2, "bob", False, 2)
+        stats.record(-200, 3, "cid", True, 1)
+        assert len(stats) == 2
+        stats.record(-100, 2, "bob", True, 1)
+        stats.record(-100, 2, "bob", True, 1)
+        await store.flush()
+        stats.record(-200, 3, "cid", True, 1)
+        assert [name for _, name, _ in stats.top(-100)] == ["bob", "ann"]
+        bob = stats.user(-100, 2)[0]
+        assert (bob.correct, bob.incorrect, bob.tries) == (2, 1, 4)
+        assert stats.chat(-100).questions == 4
+        assert stats.user(-200, 3)[0].correct == 2
+        await store.close()
+
+    asyncio.run(run(StateStore()))
+    asyncio.run(run(SQLiteStateStore(str(tmp_path / "state.sqlite3"))))
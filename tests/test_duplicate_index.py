@@ -0,0 +1,39 @@
+import os
+import random
+import string
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+
+from duplicate_index import DuplicateIndex  # noqa: E402
+from utils import similarity_percentage  # noqa: E402
+
+
+@pytest.mark.parametrize("threshold", [50, 60, 75, 90])
+def test_find_matches_a_brute_force_scan(threshold):
+    rng = random.Random(threshold)
+
+    def random_key():
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 10)))
+
+    keys = {random_key() for _ in range(200)}
+    index = DuplicateIndex(keys, threshold=threshold)
+    for _ in range(200):
+        # Near duplicates of an indexed key with a few substituted characters, and unrelated keys
+        key = list(rng.choice(sorted(keys)))
+        for _ in range(rng.randint(1, 3)):
+            key[rng.randrange(len(key))] = rng.choice(string.ascii_lowercase)
+        key = "".join(key) if rng.random() < 0.8 else random_key()
+        best = max(similarity_percentage(key, other, preprocess=False) for other in keys)
+        found = index.find(key)
+        if best >= threshold:
+            assert found is not None and found[1] == pytest.approx(best), key
+        else:
+            assert found is None, key
+
+
+def test_short_keys_without_a_shared_trigram():
+    index = DuplicateIndex(["xbcy"], threshold=50)
+    assert index.find("abcd") == ("xbcy", 50.0)
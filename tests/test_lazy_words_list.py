@@ -0,0 +1,60 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+
+from lazy_words_list import LazyWordsList  # noqa: E402
+
+
+def corpus(*words):
+    return {
+        "english": {"description": {"english": "English"},
+                    "words": [{"word": word, "descriptions": {"english": f"about {word}"}} for word in words]},
+        "other": {"description": {}, "words": [{"word": "The Cat", "descriptions": {"english": "a cat"}}]},
+    }
+
+
+@pytest.fixture
+def make_words(tmp_path):
+    (tmp_path / "word_sets").mkdir()
+    opened = []
+
+    def make(data=None):
+        if data is not None:
+            (tmp_path / "words.json").write_text(json.dumps(data), encoding="utf-8")
+        words = LazyWordsList(filepath=str(tmp_path / "words.json"), file_sets_path=str(tmp_path / "word_sets"))
+        opened.append(words)
+        return words
+
+    yield make
+    for words in opened:
+        asyncio.run(words.close())
+
+
+def question(words, language, word_key):
+    return asyncio.run(words.get_question_by_key(language, word_key, "english"))
+
+
+def test_question_by_key_reads_one_entry(make_words):
+    words = make_words(corpus(*(f"word{i}" for i in range(500))))
+    found = question(words, "english", "word123")
+    assert (found.word, found.description, found.answer_key) == ("word123", "about word123", "word123")
+    assert question(words, "other", "cat").word == "The Cat"
+    assert question(words, "english", "missing") is None
+    assert not any(group.loaded for group in words._groups.values())
+
+
+def test_question_by_key_after_rewrite(make_words):
+    words = make_words(corpus("apple", "cherry"))
+    # Rewrites the corpus, copying the unloaded "other" group and writing the loaded "english" one
+    asyncio.run(words.add_word(json.dumps({"word": "plum", "language": "english", "descriptions": {}})))
+    asyncio.run(words.close())
+    words = make_words()
+    assert question(words, "english", "plum").word == "plum"
+    assert question(words, "english", "cherry").word == "cherry"
+    assert question(words, "other", "cat").word == "The Cat"
+    assert asyncio.run(words.get_word_by_text("CHERRY")).word == "cherry"
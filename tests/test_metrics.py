@@ -0,0 +1,13 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+
+import constants  # noqa: E402
+from metrics import Metrics  # noqa: E402
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.add_collector(lambda: {("words", (("group", 'say "hi"\\\nbye'),)): 3})
+    assert f'{constants.METRICS_PREFIX}words{{group="say \\"hi\\"\\\\\\nbye"}} 3' in metrics.render().splitlines()
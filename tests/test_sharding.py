@@ -0,0 +1,110 @@
+"""
+Starts the bot in sharded webhook mode (BOT_WORKERS=2) against the fake Bot API of replay_updates.py
+"""
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import pytest
+
+pytest.importorskip("telegram")
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bot"))
+
+from replay_updates import FakeBotAPI  # noqa: E402
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _command_update(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Tester", "username": "tester"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+def _wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_sharded_router_answers_every_shard(tmp_path):
+    shutil.copytree(os.path.join(ROOT, "data", "word_sets"), tmp_path / "data" / "word_sets")
+    shutil.copy(os.path.join(ROOT, "data", "translations.json"), tmp_path / "data")
+    (tmp_path / "data" / "words.json").write_text("{}", encoding="utf-8")
+
+    api = FakeBotAPI("127.0.0.1", _free_port())
+    threading.Thread(target=api.server.serve_forever, daemon=True).start()
+    api_port = api.server.server_address[1]
+    webhook_port = _free_port()
+    env = dict(os.environ,
+               TELEGRAM_TOKEN="123:test",
+               ALLOWED_HANDLES="@tester",
+               TELEGRAM_BASE_URL=f"http://127.0.0.1:{api_port}/bot",
+               WEBHOOK_URL=f"http://127.0.0.1:{webhook_port}",
+               WEBHOOK_LISTEN="127.0.0.1",
+               WEBHOOK_PORT=str(webhook_port),
+               WEBHOOK_PATH="telegram",
+               BOT_WORKERS="2",
+               WORDS_BACKEND="sqlite",
+               STATE_DB_PATH="",
+               METRICS_PORT="")
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "bot", "main.py")], cwd=tmp_path, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        def post(update):
+            request = urllib.request.Request(f"http://127.0.0.1:{webhook_port}/telegram",
+                                             data=json.dumps(update).encode("utf-8"),
+                                             headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    return response.status == 200
+            except OSError:
+                return False
+
+        # One chat per shard, the webhook only accepts updates once the front process is up
+        webhook_up = _wait_for(lambda: post(_command_update(1, 1, "/quiz")), 60)
+        answered = webhook_up and post(_command_update(2, 2, "/quiz")) and _wait_for(lambda: api.sent_messages >= 2, 30)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            output = process.communicate(timeout=30)[0].decode("utf-8", "replace")
+        except subprocess.TimeoutExpired:
+            process.kill()
+            output = process.communicate()[0].decode("utf-8", "replace")
+        api.server.shutdown()
+    assert webhook_up, "the webhook never came up:\n" + output
+    assert answered, "the workers did not answer:\n" + output
+    assert "There is no current event loop" not in output, output
+    assert "was never awaited" not in output, output
+
+
+def test_sharding_needs_the_sqlite_backend(tmp_path):
+    env = dict(os.environ, TELEGRAM_TOKEN="123:test", ALLOWED_HANDLES="@tester", BOT_WORKERS="2", WORDS_BACKEND="json")
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "bot", "main.py")], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode != 0
+    assert "BOT_WORKERS > 1 needs WORDS_BACKEND=sqlite" in result.stderr
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+
+from spaced_repetition import Reviews, QUALITY_WRONG  # noqa: E402
+from state_store import StateStore, SQLiteStateStore  # noqa: E402
+
+GROUP_CHAT = -100
+
+
+def test_group_chats_are_quizzed_from_every_members_deck(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def answer():
+        store = SQLiteStateStore(path)
+        reviews = Reviews(store)
+        # Ann forgot "apple" first, Bob answered last
+        reviews.review(GROUP_CHAT, 1, "english", "apple", QUALITY_WRONG, now=1000)
+        reviews.review(GROUP_CHAT, 2, "english", "cherry", QUALITY_WRONG, now=2000)
+        assert reviews.next_due(GROUP_CHAT, "english")[1:] == (1, "apple")
+        assert reviews.seen(GROUP_CHAT, "english", "cherry")
+        await store.close()
+
+    asyncio.run(answer())
+    store = SQLiteStateStore(path)
+    reviews = Reviews(store)
+    assert reviews.learners(GROUP_CHAT, "english") == {1, 2}
+    assert reviews.next_due(GROUP_CHAT, "english")[1:] == (1, "apple")
+    asyncio.run(store.close())
+
+
+def test_evicted_decks_are_reloaded_with_their_unsaved_changes(tmp_path):
+    async def run(store):
+        reviews = Reviews(store, cache_size=2)
+        for user_id in (1, 2, 3):
+            reviews.review(GROUP_CHAT, user_id, "english", f"word{user_id}", 5, now=1000)
+        assert len(reviews) == 2
+        assert "word1" in reviews.deck(GROUP_CHAT, 1, "english")
+        reviews.review(GROUP_CHAT, 2, "english", "plum", 5, now=1000)
+        await store.flush()
+        reloaded = Reviews(store, cache_size=2)
+        assert reloaded.learners(GROUP_CHAT, "english") == {1, 2, 3}
+        assert {"word2", "plum"} <= set(reloaded.deck(GROUP_CHAT, 2, "english").keys)
+        await store.close()
+
+    asyncio.run(run(StateStore()))
+    asyncio.run(run(SQLiteStateStore(str(tmp_path / "state.sqlite3"))))
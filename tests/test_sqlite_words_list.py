@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+
+from sqlite_words_list import SQLiteWordsList  # noqa: E402
+
+
+@pytest.fixture
+def words(tmp_path):
+    (tmp_path / "word_sets").mkdir()
+    (tmp_path / "words.json").write_text(json.dumps({"english": {"description": {}, "words": []}}), encoding="utf-8")
+    words = SQLiteWordsList(db_path=str(tmp_path / "words.sqlite3"), filepath=str(tmp_path / "words.json"),
+                            file_sets_path=str(tmp_path / "word_sets"))
+    yield words
+    asyncio.run(words.close())
+
+
+def entry(word, **fields):
+    return dict({"word": word, "language": "english", "descriptions": {"english": word}}, **fields)
+
+
+def add(words, *entries):
+    return asyncio.run(words.add_word(json.dumps(list(entries))))
+
+
+def test_invalid_entry_adds_nothing(words):
+    add(words, entry("apple"))
+    invalid = entry("orange")
+    del invalid["language"]
+    with pytest.raises(KeyError):
+        add(words, entry("pineapple"), invalid)
+    assert words.word_counts() == {"english": 1}
+    # pineapple was never added, so its near duplicates are not rejected
+    assert add(words, entry("pineapples")).added == ["pineapples"]
+    assert add(words, entry("pineapple")).rejected
+
+
+def test_rolled_back_words_leave_the_duplicate_index(words):
+    add(words, entry("apple"))
+    with pytest.raises(AttributeError):
+        # Fails inside the transaction, after cherry was inserted
+        add(words, entry("cherry"), entry("plum", descriptions=["not", "a", "dict"]))
+    assert words.word_counts() == {"english": 1}
+    assert add(words, entry("cherry")).added == ["cherry"]
+    assert add(words, entry("cherry")).merged == ["cherry"]
+
+
+def test_writes_run_on_the_writer_thread(words, monkeypatch):
+    write_threads = []
+    write = SQLiteWordsList._write
+
+    def recording_write(self, function, *args):
+        write_threads.append(threading.current_thread())
+        return write(self, function, *args)
+
+    monkeypatch.setattr(SQLiteWordsList, "_write", recording_write)
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        ticker = asyncio.create_task(tick())
+        result = await words.add_words([entry(f"word{i}") for i in range(2000)])
+        ticker.cancel()
+        assert ticks > 1
+        assert len(result.added) == 2000
+        assert await words.remove_word("word1")
+        assert await words.update_description(json.dumps({"language": "english", "descriptions": {"english": "x"}}))
+        assert not await words.update_description(json.dumps({"language": "missing", "descriptions": {}}))
+
+    asyncio.run(run())
+    assert len(write_threads) == 4
+    assert all(thread is not threading.main_thread() for thread in write_threads)
+    assert words.word_counts() == {"english": 1999}
+    assert asyncio.run(words.get_group_description("english")) == {"english": "x"}
@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bot"))
+
+import startup_snapshot  # noqa: E402
+
+
+@pytest.fixture
+def data(tmp_path):
+    shutil.copytree(os.path.join(ROOT, "data"), tmp_path / "data")
+    data = tmp_path / "data"
+    return {
+        "snapshot": str(data / "snapshot.pickle"),
+        "words": str(data / "words.json"),
+        "word_sets": str(data / "word_sets"),
+        "translations": str(data / "translations.json"),
+    }
+
+
+def _sources(data):
+    return startup_snapshot.source_files(data["words"], data["word_sets"], data["translations"])
+
+
+def _build(data):
+    return startup_snapshot.build(data["words"], data["word_sets"], data["translations"])
+
+
+def _contents(snapshot):
+    words = {language: [word.to_dict() for word in lang_data["words"]]
+             for language, lang_data in snapshot.words._words.items()}
+    catalog = {language: {key: [(template.text, template.fields) for template in templates]
+                          for key, templates in table.items()}
+               for language, table in snapshot.catalog._tables.items()}
+    return words, catalog
+
+
+def test_snapshot_loads_the_cold_start_corpus_faster(data):
+    built = startup_snapshot.load_or_build(data["snapshot"], data["words"], data["word_sets"], data["translations"])
+    assert sum(built.words.word_counts().values()) > 0
+
+    loaded = startup_snapshot.load(data["snapshot"], _sources(data))
+    assert loaded is not None
+    cold = _build(data)
+    assert _contents(loaded) == _contents(cold)
+    assert loaded.catalog.languages == cold.catalog.languages
+
+    from_sources, from_snapshot = [], []
+    for _ in range(5):
+        started = time.perf_counter()
+        _build(data)
+        from_sources.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        startup_snapshot.load(data["snapshot"], _sources(data))
+        from_snapshot.append(time.perf_counter() - started)
+    assert statistics.median(from_snapshot) < statistics.median(from_sources)
+
+
+def _change_words(data):
+    with open(data["words"], 'r', encoding='utf-8') as f:
+        words = json.load(f)
+    words.setdefault("snapshot test", {"description": {}, "words": []})["words"].append(
+        {"word": "snapshot", "descriptions": {"english": "a saved state"}})
+    with open(data["words"], 'w', encoding='utf-8') as f:
+        json.dump(words, f)
+
+
+def _change_word_sets(data):
+    with open(os.path.join(data["word_sets"], "snapshot_test.json"), 'w', encoding='utf-8') as f:
+        json.dump({"snapshot test": {"description": {}, "words": [
+            {"word": "snapshot", "descriptions": {"english": "a saved state"}}]}}, f)
+
+
+def _change_translations(data):
+    with open(data["translations"], 'r', encoding='utf-8') as f:
+        translations = json.load(f)
+    translations["english"]["snapshot_test"] = "A saved state"
+    with open(data["translations"], 'w', encoding='utf-8') as f:
+        json.dump(translations, f)
+
+
+@pytest.mark.parametrize("change", [_change_words, _change_word_sets, _change_translations])
+def test_changed_sources_invalidate_the_snapshot(data, change):
+    startup_snapshot.load_or_build(data["snapshot"], data["words"], data["word_sets"], data["translations"])
+    assert startup_snapshot.load(data["snapshot"], _sources(data)) is not None
+
+    change(data)
+    assert startup_snapshot.load(data["snapshot"], _sources(data)) is None
+    rebuilt = startup_snapshot.load_or_build(data["snapshot"], data["words"], data["word_sets"], data["translations"])
+    assert _contents(rebuilt) == _contents(_build(data))
+    if change is _change_translations:
+        assert rebuilt.catalog.text("english", "snapshot_test") == "A saved state"
+    else:
+        assert rebuilt.words.word_counts()["snapshot test"] == 1
+    assert startup_snapshot.load(data["snapshot"], _sources(data)) is not None
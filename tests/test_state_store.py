@@ -0,0 +1,65 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+
+from state_store import SQLiteStateStore  # noqa: E402
+from spaced_repetition import Reviews  # noqa: E402
+from chat_stats import ChatStats  # noqa: E402
+
+
+def test_flush_writes_on_the_writer_thread(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.sqlite3")
+    write_threads = []
+    write = SQLiteStateStore._write
+
+    def recording_write(self, pending):
+        write_threads.append(threading.current_thread())
+        write(self, pending)
+
+    monkeypatch.setattr(SQLiteStateStore, "_write", recording_write)
+
+    async def run():
+        store = SQLiteStateStore(path)
+        reviews, stats = Reviews(store), ChatStats(store)
+        store.save_chat(1, "english", "english")
+        store.save_question({"id": "q1", "chat_id": 1, "message_ids": [10]})
+        reviews.review(1, 7, "english", "apple", 5, now=1000)
+        stats.record(1, 7, "tester", True, 1)
+        await store.flush()
+        # Changed after the flush took its snapshot, saved by the next one
+        store.save_question({"id": "q1", "chat_id": 1, "message_ids": [10, 11]})
+        await store.close()
+
+    asyncio.run(run())
+    assert write_threads and all(thread is not threading.main_thread() for thread in write_threads)
+    store = SQLiteStateStore(path)
+    chats, quizzes, questions = store.load()
+    assert chats == [(1, "english", "english")]
+    assert questions == [{"id": "q1", "chat_id": 1, "message_ids": [10, 11]}]
+    assert "apple" in Reviews(store).deck(1, 7, "english")
+    assert [row[:4] for row in store.load_stats(1) if row[1] == 7] == [(1, 7, "tester", 1)]
+    asyncio.run(store.close())
+
+
+def test_failed_flush_keeps_the_changes(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def run():
+        store = SQLiteStateStore(path)
+        store.save_chat(1, "english", None)
+        with monkeypatch.context() as patch:
+            def failing_write(self, pending):
+                raise sqlite3.OperationalError("disk I/O error")
+            patch.setattr(SQLiteStateStore, "_write", failing_write)
+            await store.flush()
+        store.save_chat(2, "korean", None)
+        await store.close()
+
+    asyncio.run(run())
+    store = SQLiteStateStore(path)
+    assert sorted(store.load()[0]) == [(1, "english", None), (2, "korean", None)]
+    asyncio.run(store.close())
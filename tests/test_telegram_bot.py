@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("telegram")
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bot"))
+
+from telegram.error import Forbidden  # noqa: E402
+
+from message_sender import MessageSender  # noqa: E402
+from telegram_bot import TelegramQuizBot  # noqa: E402
+from utils import preprocess_string  # noqa: E402
+from words_list import WordsList  # noqa: E402
+
+BLOCKED, BROKEN, HEALTHY = 1, 2, 3
+UNLIMITED = (1e9, 1e9)
+
+
+class FailingBot:
+    """
+    Stands in for telegram.Bot: the BLOCKED chat blocked the bot, sending to the BROKEN one fails otherwise
+    """
+    async def send_message(self, chat_id, **kwargs):
+        if chat_id == BLOCKED:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        if chat_id == BROKEN:
+            raise RuntimeError("connection reset")
+        return None
+
+
+LONG_GROUP = "english words for the long train rides between seoul and busan, part two"
+
+
+@pytest.fixture
+def quiz_bot(tmp_path):
+    (tmp_path / "word_sets").mkdir()
+    (tmp_path / "words.json").write_text(json.dumps({
+        "english": {"description": {}, "words": [{"word": "apple", "descriptions": {"english": "a fruit"}}]},
+        LONG_GROUP: {"description": {}, "words": [{"word": f"word{i}", "descriptions": {"english": "x" * 200}}
+                                                  for i in range(100)]},
+    }), encoding="utf-8")
+    with open(os.path.join(ROOT, "data", "translations.json"), encoding="utf-8") as f:
+        translations = json.load(f)
+    words = WordsList(str(tmp_path / "words.json"), str(tmp_path / "word_sets"))
+    return TelegramQuizBot(telegram_token="test", allowed_handles=["@tester"], words_list=words,
+                           translations=translations, message_sender=MessageSender(UNLIMITED, UNLIMITED, UNLIMITED))
+
+
+def test_failed_scheduled_questions_are_logged_and_blocked_chats_unscheduled(quiz_bot, caplog):
+    async def run():
+        quiz_bot.message_sender.start(FailingBot())
+        for chat_id in (BLOCKED, BROKEN, HEALTHY):
+            quiz_bot.language_preferences[chat_id] = "english"
+            quiz_bot.quiz_scheduler.schedule(chat_id, 3600, 3600)
+        await quiz_bot._run_due_quizzes([BLOCKED, BROKEN, HEALTHY])
+        while quiz_bot._background_tasks:
+            await asyncio.sleep(0.01)
+        await quiz_bot.message_sender.stop()
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(run())
+    assert BLOCKED not in quiz_bot.quiz_scheduler
+    assert BROKEN in quiz_bot.quiz_scheduler and HEALTHY in quiz_bot.quiz_scheduler
+    assert f"Failed to ask the scheduled question of chat {BROKEN}" in caplog.text
+    assert "never retrieved" not in caplog.text
+
+
+def test_list_keyboard_of_a_long_group_name(quiz_bot):
+    class Query:
+        def __init__(self, data):
+            self.data = data
+            self.message = SimpleNamespace(chat_id=HEALTHY)
+            self.shown = None
+
+        async def answer(self):
+            pass
+
+        async def edit_message_text(self, text, reply_markup=None, **kwargs):
+            self.shown = text, reply_markup
+
+    async def press(data):
+        query = Query(data)
+        await quiz_bot.list_page(SimpleNamespace(callback_query=query, effective_chat=SimpleNamespace(id=HEALTHY)), None)
+        return query.shown
+
+    async def run():
+        # As /list passes it
+        group = preprocess_string(LONG_GROUP)
+        pages = await quiz_bot._get_list_pages(group, "english")
+        keyboard = quiz_bot._list_keyboard(group, 0, len(pages))
+        buttons = keyboard.inline_keyboard[0]
+        assert all(len(button.callback_data.encode("utf-8")) <= 64 for button in buttons)
+        text, next_keyboard = await press(buttons[2].callback_data)
+        assert text == pages[1]
+        assert next_keyboard.inline_keyboard[0][1].text == f"2/{len(pages)}"
+        # Keyboards sent before the group tokens name the group
+        assert (await press("list:english words for the long train rides:1")) is None
+        assert (await press(f"list:{group}:1"))[0] == pages[1]
+
+    asyncio.run(run())
+
+
+def test_quizzes_started_together_are_spread_and_stopped_ones_skipped(quiz_bot):
+    chats = range(10, 30)
+
+    async def run():
+        quiz_bot.message_sender.start(FailingBot())
+        for chat_id in chats:
+            update = SimpleNamespace(message=SimpleNamespace(chat_id=chat_id), effective_chat=SimpleNamespace(id=chat_id))
+            await quiz_bot.start_callback_quiz(update, SimpleNamespace(args=["english", "60s"]))
+        first_runs = [quiz_bot.quiz_scheduler.time_until(chat_id) for chat_id in chats]
+        assert all(0 < first_run <= 60 for first_run in first_runs)
+        assert max(first_runs) - min(first_runs) > 10
+
+        # /stop_quiz of the first chat arrives while the questions are picked
+        pick_question = quiz_bot._pick_question
+
+        async def pick_and_stop(chat_id):
+            quiz_bot.quiz_scheduler.cancel(chats[0])
+            return await pick_question(chat_id)
+
+        quiz_bot._pick_question = pick_and_stop
+        await quiz_bot._run_due_quizzes(list(chats[:3]))
+        assert len(quiz_bot._background_tasks) == 2
+        while quiz_bot._background_tasks:
+            await asyncio.sleep(0.01)
+        await quiz_bot.message_sender.stop()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("language, reply", [("english", "description_updated"), ("missing", "no_words_specific_language")])
+def test_change_description_of_a_missing_group(quiz_bot, monkeypatch, language, reply):
+    sent, changed = [], []
+    monkeypatch.setattr(quiz_bot, "_localized_text", lambda chat_id, key, params=None: key)
+
+    async def send(chat_id, text, *args, **kwargs):
+        sent.append(text)
+
+    async def words_changed():
+        changed.append(True)
+
+    monkeypatch.setattr(quiz_bot, "_send", send)
+    monkeypatch.setattr(quiz_bot, "_words_changed", words_changed)
+    update = SimpleNamespace(message=SimpleNamespace(chat_id=HEALTHY, from_user=SimpleNamespace(username="tester")),
+                             effective_chat=SimpleNamespace(id=HEALTHY))
+    data = json.dumps({"language": language, "descriptions": {"english": "Fruit"}})
+    asyncio.run(quiz_bot.change_description(update, SimpleNamespace(args=[data])))
+    assert sent == [reply]
+    assert changed == ([True] if language == "english" else [])
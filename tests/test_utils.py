@@ -0,0 +1,19 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+
+from utils import paginate  # noqa: E402
+
+
+def test_paginate_cuts_entries_longer_than_a_page():
+    pages = paginate("Header:\n\n", ["short", "x" * 5000, "after"], max_length=100)
+    assert all(len(page) <= 100 for page in pages)
+    assert pages[0] == "Header:\n\nshort"
+    assert pages[1] == "Header:\n\n" + "x" * 90 + "…"
+    assert pages[2] == "Header:\n\nafter"
+
+
+def test_paginate_cuts_long_headers():
+    pages = paginate("h" * 500, ["entry"], max_length=100)
+    assert pages == ("h" * 49 + "…" + "entry",)
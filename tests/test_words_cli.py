@@ -0,0 +1,90 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("telegram")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+
+import words_cli  # noqa: E402
+from main import create_words_list, lock_words  # noqa: E402
+from sqlite_words_list import SQLiteWordsList  # noqa: E402
+
+CORPUS = {
+    "english": {"description": {}, "words": [
+        {"word": "apple", "descriptions": {"english": "a fruit", "russian": "фрукт"}},
+        {"word": "cherry", "descriptions": {"english": "a red fruit"}, "quiz_type": "reverse"},
+    ]},
+    "korean": {"description": {}, "words": [{"word": "사과", "descriptions": {"english": "apple", "korean": "과일"}}]},
+}
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    (tmp_path / "data" / "word_sets").mkdir(parents=True)
+    (tmp_path / "data" / "words.json").write_text(json.dumps(CORPUS), encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "data"
+
+
+@pytest.mark.parametrize("backend", ["json", "lazy"])
+def test_import_refused_while_the_bot_runs(data, monkeypatch, backend):
+    monkeypatch.setenv("WORDS_BACKEND", backend)
+    (data / "new.ndjson").write_text(json.dumps({"word": "plum", "language": "english"}) + "\n", encoding="utf-8")
+    args = SimpleNamespace(command="import", file=str(data / "new.ndjson"), format=None, workers=1, batch_size=10,
+                           duplicate_similarity=None)
+    bot_lock = lock_words()
+    try:
+        with pytest.raises(SystemExit, match="The bot is running"):
+            asyncio.run(words_cli.run(args))
+    finally:
+        bot_lock.close()
+    asyncio.run(words_cli.run(args))
+    assert "plum" in (data / "words.json").read_text(encoding="utf-8")
+
+
+@pytest.mark.parametrize("backend", ["json", "lazy", "sqlite"])
+def test_export_streams_every_backend(data, monkeypatch, backend):
+    monkeypatch.setenv("WORDS_BACKEND", backend)
+    monkeypatch.setenv("WORDS_DB_PATH", str(data / "words.sqlite3"))
+
+    async def export(file_format):
+        words = create_words_list()
+        out = io.StringIO()
+        count = await words_cli.export_words(words, [], file_format, out)
+        if backend == "lazy":
+            assert not any(group.loaded for group in words._groups.values())
+        await words.close()
+        return count, out.getvalue()
+
+    count, ndjson = asyncio.run(export("ndjson"))
+    assert count == 3
+    assert [json.loads(line)["word"] for line in ndjson.splitlines()] == ["apple", "cherry", "사과"]
+    count, text = asyncio.run(export("csv"))
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0] == ["word", "language", "quiz_type", "english", "korean", "russian"]
+    assert rows[1:] == [["apple", "english", "translate", "a fruit", "", "фрукт"],
+                        ["cherry", "english", "reverse", "a red fruit", "", ""],
+                        ["사과", "korean", "translate", "apple", "과일", ""]]
+
+
+def test_sqlite_sees_words_imported_by_another_process(data):
+    def open_words():
+        return SQLiteWordsList(str(data / "words.sqlite3"), str(data / "words.json"), str(data / "word_sets"))
+
+    async def run():
+        bot, cli = open_words(), open_words()
+        assert (await bot.get_random_word("korean")).word == "사과"
+        await cli.add_words([{"word": "배", "language": "korean", "descriptions": {"english": "pear"}}])
+        seen = {(await bot.get_random_word("korean")).word for _ in range(200)}
+        await bot.close()
+        await cli.close()
+        return seen
+
+    assert asyncio.run(run()) == {"사과", "배"}